@@ -0,0 +1,171 @@
+import logging
+import re
+from math import gcd
+from typing import List, Literal
+
+import tree_sitter_python as tspython
+from haystack import component
+from tree_sitter import Language, Node, Parser
+
+from src.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+LICENSE_PATTERN = re.compile(r"licen[cs]e|copyright|spdx", re.IGNORECASE)
+COLLECTION_TYPES = ["list", "tuple", "set", "dictionary"]
+
+
+@component
+class CodeMinifier:
+    """
+    This component shrinks the source code inlined into the summary prompts to save input tokens,
+    by stripping or shortening comments, eliding long literals and data tables, collapsing whitespace
+    and optionally removing license headers. Docstrings are kept since they are valuable for summarization.
+
+    """
+    _parser = Parser(Language(tspython.language()))
+
+    def __init__(
+        self,
+        comments: Literal["keep", "shorten", "strip"] = "strip",
+        max_comment_length: int = 80,
+        max_literal_length: int = 80,
+        max_collection_items: int = 8,
+        collapse_whitespace: bool = True,
+        indent_width: int = 1,
+        strip_license_header: bool = False,
+    ) -> None:
+        self._comments = comments
+        self._max_comment_length = max_comment_length
+        self._max_literal_length = max_literal_length
+        self._max_collection_items = max_collection_items
+        self._collapse_whitespace = collapse_whitespace
+        self._indent_width = indent_width
+        self._strip_license_header = strip_license_header
+
+        self.original_tokens = 0
+        self.minified_tokens = 0
+
+    @staticmethod
+    def _is_docstring(node: Node) -> bool:
+        return (
+            node.parent is not None
+            and node.parent.type == "expression_statement"
+            and node.parent.child_count == 1
+        )
+
+    def _license_header_end(self, root: Node) -> int:
+        end = 0
+        for node in root.children:
+            if node.type == "comment" or (
+                node.type == "expression_statement"
+                and node.children[0].type == "string"
+                and self._is_docstring(node.children[0])
+            ):
+                if not LICENSE_PATTERN.search(node.text.decode("utf8")):
+                    break
+                end = node.end_byte
+            else:
+                break
+        return end
+
+    @staticmethod
+    def _shorten(node: Node, max_length: int) -> tuple[int, int, bytes] | None:
+        # the lengths are in characters and the cut is on a character boundary, so multi-byte characters are not split
+        text = node.text.decode("utf8")
+        if len(text) <= max_length:
+            return None
+        return (node.start_byte + len(text[:max_length].encode("utf8")), node.end_byte, b"...")
+
+    def _collect_replacements(self, node: Node, replacements: list[tuple[int, int, bytes]]):
+        if node.type == "comment":
+            if self._comments == "strip":
+                replacements.append((node.start_byte, node.end_byte, b""))
+            elif self._comments == "shorten" and (
+                replacement := self._shorten(node, self._max_comment_length)
+            ):
+                replacements.append(replacement)
+            return
+
+        if node.type == "string" and not self._is_docstring(node):
+            contents = [child for child in node.children if child.type == "string_content"]
+            # f-strings with interpolations are left as they are
+            if len(contents) == 1 and node.named_child_count == 3:
+                if replacement := self._shorten(contents[0], self._max_literal_length):
+                    replacements.append(replacement)
+            return
+
+        if node.type in COLLECTION_TYPES:
+            items = [child for child in node.named_children if child.type != "comment"]
+            if len(items) > self._max_collection_items:
+                for item in items[: self._max_collection_items]:
+                    self._collect_replacements(item, replacements)
+                replacements.append(
+                    (
+                        items[self._max_collection_items - 1].end_byte,
+                        items[-1].end_byte,
+                        f", ... ({len(items) - self._max_collection_items} more)".encode("utf8"),
+                    )
+                )
+                return
+
+        for child in node.children:
+            self._collect_replacements(child, replacements)
+
+    def _collapse(self, code: str) -> str:
+        lines = [line.rstrip() for line in code.splitlines()]
+        lines = [line for line in lines if line]
+        indents = [len(line) - len(line.lstrip(" ")) for line in lines]
+        unit = 0
+        for indent in indents:
+            unit = gcd(unit, indent)
+        if not unit:
+            return "\n".join(lines)
+
+        return "\n".join(
+            " " * (indent // unit * self._indent_width) + line[indent:]
+            for line, indent in zip(lines, indents)
+        )
+
+    def minify(self, code: str) -> str:
+        source = bytes(code, "utf-8")
+        root = CodeMinifier._parser.parse(source).root_node
+
+        replacements = []
+        if self._strip_license_header:
+            end = self._license_header_end(root)
+            if end:
+                replacements.append((0, end, b""))
+        self._collect_replacements(root, replacements)
+
+        # skip the replacements nested in another replaced range, then apply them from the end
+        outermost = []
+        for start, end, text in sorted(replacements, key=lambda r: (r[0], -r[1])):
+            if not outermost or start >= outermost[-1][1]:
+                outermost.append((start, end, text))
+
+        minified = source
+        for start, end, text in reversed(outermost):
+            minified = minified[:start] + text + minified[end:]
+
+        minified = minified.decode("utf8")
+        return self._collapse(minified) if self._collapse_whitespace else minified
+
+    @component.output_types(contents=List[str], original_tokens=int, minified_tokens=int)
+    def run(self, contents: List[str]):
+        minified = [self.minify(content) for content in contents]
+
+        original_tokens = sum(estimate_tokens(content) for content in contents)
+        minified_tokens = sum(estimate_tokens(content) for content in minified)
+        self.original_tokens += original_tokens
+        self.minified_tokens += minified_tokens
+        logger.info(
+            f"Minified {len(contents)} code snippets from {original_tokens} to {minified_tokens} tokens, "
+            f"saved {original_tokens - minified_tokens} tokens"
+        )
+
+        return {
+            "contents": minified,
+            "original_tokens": original_tokens,
+            "minified_tokens": minified_tokens,
+        }
@@ -0,0 +1,40 @@
+from src.components.code_parser import Code
+
+
+class CodeOutliner:
+    """
+    This component builds the document content of the fast index mode directly from the parsed code,
+    i.e. decorators, signature, docstring and a trimmed body, so no LLM summary is needed.
+
+    """
+    def __init__(self, max_function_lines: int = 30, max_class_lines: int = 60) -> None:
+        self._max_function_lines = max_function_lines
+        self._max_class_lines = max_class_lines
+
+    @staticmethod
+    def _trim(content: str, max_lines: int) -> str:
+        lines = content.splitlines()
+        if len(lines) <= max_lines:
+            return content
+        return "\n".join(lines[:max_lines] + ["    ..."])
+
+    def outline_function(self, function: Code.Function) -> str:
+        return "\n".join(
+            function.decorators + [self._trim(function.content, self._max_function_lines)]
+        )
+
+    def outline_class(self, global_class: Code.Class) -> str:
+        return "\n".join(
+            global_class.decorators + [self._trim(global_class.signature, self._max_class_lines)]
+        )
+
+    def outline_file(self, code: Code) -> str:
+        lines = [f"File: {code.path}"]
+        if code.imports:
+            lines.append("Imports: " + ", ".join(code.imports))
+        for global_class in code.global_classes:
+            header = global_class.signature.splitlines()[0] if global_class.signature else f"class {global_class.name}:"
+            lines.append(header + (f" {global_class.docstring}" if global_class.docstring else ""))
+        for global_function in code.global_functions:
+            lines.append(global_function.signature + (f" {global_function.docstring}" if global_function.docstring else ""))
+        return "\n".join(lines)
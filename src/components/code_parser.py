@@ -1,23 +1,54 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional
 
 import tree_sitter_python as tspython
 from tree_sitter import Language, Parser, Node
 
+DECISION_POINT_TYPES = {
+    "if_statement",
+    "elif_clause",
+    "for_statement",
+    "while_statement",
+    "except_clause",
+    "with_statement",
+    "case_clause",
+    "boolean_operator",
+    "conditional_expression",
+    "for_in_clause",
+    "if_clause",
+}
 
 @dataclass
 class Code:
     @dataclass
-    class Class:
+    class Function:
         name: str
         content: str
+        # unique within the codebase, it is used as the id of the indexed document
+        id: str = ""
+        signature: str = ""
+        docstring: Optional[str] = None
+        decorators: list[str] = field(default_factory=list)
+        complexity: int = 1
+        # 1-based and inclusive
+        start_line: int = 0
+        end_line: int = 0
         generated_summary: Optional[str] = None
 
     @dataclass
-    class Function:
+    class Class:
         name: str
         content: str
+        id: str = ""
+        # the class source with method bodies elided, i.e. header, docstring, attributes and method signatures
+        signature: str = ""
+        docstring: Optional[str] = None
+        decorators: list[str] = field(default_factory=list)
+        methods: list["Code.Function"] = field(default_factory=list)
+        complexity: int = 1
+        start_line: int = 0
+        end_line: int = 0
         generated_summary: Optional[str] = None
 
     path: Path
@@ -25,6 +56,12 @@ class Code:
     imports: list[str]
     global_classes: list[Class]
     global_functions: list[Function]
+    # top-level statements that are neither imports nor class/function definitions
+    module_code: list[str] = field(default_factory=list)
+    # top-level assignments of one name to another, e.g. "Retriever = AsyncQdrantEmbeddingRetriever"
+    aliases: dict[str, str] = field(default_factory=dict)
+    # cyclomatic complexity, i.e. the number of decision points plus one
+    complexity: int = 1
     generated_summary: Optional[str] = None
 
 
@@ -32,6 +69,57 @@ class CodeParser:
     _parser = Parser(Language(tspython.language()))
 
     def _parse_and_analyze_code(self, file: Path) -> Code:
+        def _text(start_byte: int, end_byte: int) -> str:
+            return source[start_byte:end_byte].decode("utf8")
+
+        def _get_docstring(body: Optional[Node]) -> Optional[str]:
+            if body is None or not body.children:
+                return None
+            first = body.children[0]
+            if first.type == "expression_statement" and first.children[0].type == "string":
+                for child in first.children[0].children:
+                    if child.type == "string_content":
+                        return child.text.decode("utf8").strip()
+            return None
+
+        def _get_decorators(node: Node) -> list[str]:
+            return [
+                child.text.decode("utf8")
+                for child in node.children
+                if child.type == "decorator"
+            ]
+
+        def _unwrap_definition(node: Node) -> Optional[Node]:
+            if node.type == "decorated_definition":
+                node = node.child_by_field_name("definition")
+            if node is not None and node.type in ["class_definition", "function_definition"]:
+                return node
+            return None
+
+        def _get_complexity(node: Node) -> int:
+            complexity = 1
+            cursor = node.walk()
+            visited_children = False
+            while True:
+                if not visited_children:
+                    if cursor.node.type in DECISION_POINT_TYPES:
+                        complexity += 1
+                    if cursor.goto_first_child():
+                        continue
+                if cursor.node == node:
+                    return complexity
+                if cursor.goto_next_sibling():
+                    visited_children = False
+                else:
+                    cursor.goto_parent()
+                    visited_children = True
+
+        def _make_id(qualified_name: str) -> str:
+            _id = f"{file}::{qualified_name}"
+            # symbols can be redefined in the same file, e.g. under different conditions
+            occurrences[_id] = occurrences.get(_id, 0) + 1
+            return _id if occurrences[_id] == 1 else f"{_id}#{occurrences[_id]}"
+
         def _process_import(node: Node, code_file: Code):
             if node.type == "import_statement":
                 for child in node.children:
@@ -40,45 +128,95 @@ class CodeParser:
                     elif child.type == "aliased_import":
                         code_file.imports.append(child.children[0].text.decode("utf8"))
             elif node.type == "import_from_statement":
-                module_name = ""
+                # relative modules keep their leading dots, e.g. "from . import a" gives ".a"
+                module = node.child_by_field_name("module_name")
+                module_name = module.text.decode("utf8")
+                separator = "" if module_name.endswith(".") else "."
                 for child in node.children:
+                    if child == module:
+                        continue
                     if child.type == "dotted_name":
-                        if not module_name:
-                            module_name = child.text.decode("utf8")
-                        else:
-                            package_name = child.text.decode("utf8")
-                            code_file.imports.append(f"{module_name}.{package_name}")
-
-        def _process_class(node: Node, code_file: Code):
-            for child in node.children:
-                if child.type == "identifier":
-                    code_file.global_classes.append(
-                        Code.Class(
-                            name=child.text.decode("utf8"),
-                            content=node.text.decode("utf8"),
-                        )
-                    )
-
-        def _process_function(node: Node, code_file: Code):
-            for child in node.children:
-                if child.type == "identifier":
-                    code_file.global_functions.append(
-                        Code.Function(
-                            name=child.text.decode("utf8"),
-                            content=node.text.decode("utf8")
-                        )
-                    )
+                        code_file.imports.append(f"{module_name}{separator}{child.text.decode('utf8')}")
+                    elif child.type == "aliased_import":
+                        code_file.imports.append(f"{module_name}{separator}{child.children[0].text.decode('utf8')}")
+                    elif child.type == "wildcard_import":
+                        code_file.imports.append(module_name)
+
+        def _build_function(node: Node, decorators: list[str], prefix: str = "") -> Code.Function:
+            body = node.child_by_field_name("body")
+            name = node.child_by_field_name("name").text.decode("utf8")
+            return Code.Function(
+                name=name,
+                content=node.text.decode("utf8"),
+                id=_make_id(f"{prefix}{name}"),
+                signature=_text(node.start_byte, body.start_byte).rstrip(),
+                docstring=_get_docstring(body),
+                decorators=decorators,
+                complexity=_get_complexity(node),
+                start_line=node.start_point[0] + 1,
+                end_line=node.end_point[0] + 1,
+            )
+
+        def _process_class(node: Node, code_file: Code, decorators: list[str]):
+            body = node.child_by_field_name("body")
+            name = node.child_by_field_name("name").text.decode("utf8")
+            methods = []
+            # replace the body of every method with "..." so the signature keeps the shape of the class only
+            signature, cursor = [], node.start_byte
+            for child in body.children:
+                definition = _unwrap_definition(child)
+                if definition is None or definition.type != "function_definition":
+                    continue
+                methods.append(_build_function(definition, _get_decorators(child), prefix=f"{name}."))
+                method_body = definition.child_by_field_name("body")
+                signature.append(_text(cursor, method_body.start_byte))
+                signature.append("...")
+                cursor = method_body.end_byte
+            signature.append(_text(cursor, node.end_byte))
+
+            code_file.global_classes.append(
+                Code.Class(
+                    name=name,
+                    content=node.text.decode("utf8"),
+                    id=_make_id(name),
+                    signature="".join(signature),
+                    docstring=_get_docstring(body),
+                    decorators=decorators,
+                    methods=methods,
+                    complexity=_get_complexity(node),
+                    start_line=node.start_point[0] + 1,
+                    end_line=node.end_point[0] + 1,
+                )
+            )
+
+        def _process_function(node: Node, code_file: Code, decorators: list[str]):
+            code_file.global_functions.append(_build_function(node, decorators))
+
+        def _process_alias(node: Node, code_file: Code):
+            if node.type != "expression_statement" or node.children[0].type != "assignment":
+                return
+            left = node.children[0].child_by_field_name("left")
+            right = node.children[0].child_by_field_name("right")
+            if left.type == "identifier" and right is not None and right.type in ["identifier", "attribute"]:
+                code_file.aliases[left.text.decode("utf8")] = right.text.decode("utf8")
 
         def _traverse(nodes: list[Node], code_file: Code):
             for node in nodes:
                 if node.type in ["import_statement", "import_from_statement"]:
                     _process_import(node, code_file)
                 elif node.type == "class_definition":
-                    _process_class(node, code_file)
+                    _process_class(node, code_file, [])
                 elif node.type == "function_definition":
-                    _process_function(node, code_file)
+                    _process_function(node, code_file, [])
                 elif node.type == "decorated_definition":
-                    _traverse(node.children, code_file)
+                    definition = node.child_by_field_name("definition")
+                    if definition.type == "class_definition":
+                        _process_class(definition, code_file, _get_decorators(node))
+                    elif definition.type == "function_definition":
+                        _process_function(definition, code_file, _get_decorators(node))
+                else:
+                    _process_alias(node, code_file)
+                    code_file.module_code.append(node.text.decode("utf8"))
 
         with open(file, 'r') as f:
             code = f.read()
@@ -90,8 +228,11 @@ class CodeParser:
             global_classes=[],
             global_functions=[],
         )
-        tree = CodeParser._parser.parse(bytes(code_file.content, 'utf-8'))
+        occurrences = {}
+        source = bytes(code_file.content, 'utf-8')
+        tree = CodeParser._parser.parse(source)
         _traverse(tree.root_node.children, code_file)
+        code_file.complexity = _get_complexity(tree.root_node)
 
         return code_file
 
@@ -100,3 +241,4 @@ class CodeParser:
             self._parse_and_analyze_code(file)
             for file in sorted(path.glob('**/*.py'))
         ]
+
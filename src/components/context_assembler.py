@@ -0,0 +1,223 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from haystack import Document, component
+
+from src.utils import estimate_tokens
+
+RETRIEVAL_LEVELS = ["code_file_retrieval", "code_function_retrieval", "code_class_retrieval"]
+
+
+@dataclass
+class _Hit:
+    document: Document
+    path: str
+    # 1-based and inclusive
+    start_line: int
+    end_line: int
+    score: float
+    # the source lines of the span, if the document holds them
+    lines: Optional[List[str]]
+
+    @property
+    def summary(self) -> str:
+        return str(self.document.meta.get("signature") or self.document.content or "").strip()
+
+
+@dataclass
+class _Segment:
+    path: str
+    start_line: int
+    end_line: int
+    score: float
+    # the hits the segment was merged from, and the hits nested within them
+    parts: List[_Hit] = field(default_factory=list)
+    children: List[_Hit] = field(default_factory=list)
+    # the source lines of the span, if all the merged hits hold them
+    lines: Optional[List[str]] = None
+
+
+@dataclass
+class ContextItem:
+    path: str
+    start_line: int
+    end_line: int
+    score: float
+    # "full" for the source, "partial" for the summaries with the source of the nested hits,
+    # "summary" for the summaries or signatures only, and "reference" for the location only
+    form: str
+    text: str
+    tokens: int
+    document_ids: List[str]
+
+
+@component
+class ContextAssembler:
+    """
+    This component turns the retrieval results into one prompt context within a token budget.
+
+    The hits of all the collections are grouped by path, the hits nested in the line span of another hit are dropped,
+    e.g. a function within a retrieved file, and the overlapping or adjacent spans are merged.
+    The merged spans are packed by their best score, each in the most complete form that still fits the remaining budget,
+    i.e. the source, the summary with the source of the nested hits, the summary or signature, or the location only.
+    The files of the dependency expansion are listed last, as long as they fit.
+
+    """
+    def __init__(self, max_tokens: int = 4000, max_gap_lines: int = 2) -> None:
+        self._max_tokens = max_tokens
+        # the spans with at most this many lines between them are merged, e.g. two functions separated by two blank lines
+        self._max_gap_lines = max_gap_lines
+
+    @staticmethod
+    def _hits(retrieval_results: dict) -> List[_Hit]:
+        hits = []
+        for level in RETRIEVAL_LEVELS:
+            for document in retrieval_results.get(level, {}).get("documents", []):
+                if not document.meta.get("path"):
+                    continue
+
+                raw_data = document.meta.get("raw_data")
+                lines = raw_data.splitlines() if isinstance(raw_data, str) else None
+                start_line = document.meta.get("start_line") or 1
+                # the files cover all their lines
+                end_line = document.meta.get("end_line") or start_line + max(len(lines or [""]), 1) - 1
+                hits.append(
+                    _Hit(document, str(document.meta["path"]), start_line, end_line, document.score or 0.0, lines)
+                )
+        return hits
+
+    def _segments(self, hits: List[_Hit]) -> List[_Segment]:
+        by_path: Dict[str, List[_Hit]] = {}
+        for hit in hits:
+            by_path.setdefault(hit.path, []).append(hit)
+
+        segments = []
+        for path, path_hits in by_path.items():
+            # the source of the whole file, if a file was retrieved, to cut the merged spans from
+            file_lines = next(
+                (hit.lines for hit in path_hits if hit.lines is not None and "start_line" not in hit.document.meta),
+                None,
+            )
+
+            path_segments: List[_Segment] = []
+            for hit in sorted(path_hits, key=lambda hit: (hit.start_line, -hit.end_line, -hit.score)):
+                segment = path_segments[-1] if path_segments else None
+                if segment is not None and hit.end_line <= segment.end_line:
+                    # a method within a class within a file is only kept as the class
+                    if not segment.children or hit.end_line > segment.children[-1].end_line:
+                        segment.children.append(hit)
+                    segment.score = max(segment.score, hit.score)
+                elif segment is not None and hit.start_line - segment.end_line - 1 <= self._max_gap_lines:
+                    if segment.lines is not None and hit.lines is not None:
+                        segment.lines += [""] * max(hit.start_line - segment.end_line - 1, 0)
+                        segment.lines += hit.lines[max(segment.end_line - hit.start_line + 1, 0) :]
+                    else:
+                        segment.lines = None
+                    segment.parts.append(hit)
+                    segment.end_line = hit.end_line
+                    segment.score = max(segment.score, hit.score)
+                else:
+                    path_segments.append(
+                        _Segment(
+                            path,
+                            hit.start_line,
+                            hit.end_line,
+                            hit.score,
+                            parts=[hit],
+                            lines=list(hit.lines) if hit.lines is not None else None,
+                        )
+                    )
+
+            if file_lines is not None:
+                for segment in path_segments:
+                    segment.lines = file_lines[segment.start_line - 1 : segment.end_line]
+            segments.extend(path_segments)
+
+        return sorted(segments, key=lambda segment: -segment.score)
+
+    @staticmethod
+    def _forms(segment: _Segment) -> List[tuple[str, str]]:
+        header = f"# {segment.path}:{segment.start_line}-{segment.end_line}"
+        summaries = [part.summary for part in segment.parts if part.summary]
+        forms = []
+        if segment.lines:
+            forms.append(("full", "\n".join([header, *segment.lines])))
+        children = [
+            (
+                child,
+                segment.lines[child.start_line - segment.start_line : child.end_line - segment.start_line + 1]
+                if segment.lines is not None
+                else child.lines,
+            )
+            for child in segment.children
+        ]
+        if summaries and (children := [(child, lines) for child, lines in children if lines]):
+            forms.append(
+                (
+                    "partial",
+                    "\n".join(
+                        [header, *summaries]
+                        + [
+                            line
+                            for child, lines in children
+                            for line in [f"## {segment.path}:{child.start_line}-{child.end_line}", *lines]
+                        ]
+                    ),
+                )
+            )
+        if summaries:
+            forms.append(("summary", "\n".join([header, *summaries])))
+        names = [str(part.document.meta["name"]) for part in segment.parts if part.document.meta.get("name")]
+        forms.append(("reference", header + (f" {', '.join(names)}" if names else "")))
+        return forms
+
+    @component.output_types(context=str, items=List[ContextItem], tokens=int, retrieved_tokens=int)
+    def run(self, retrieval_results: dict, max_tokens: Optional[int] = None):
+        """
+        The context of the results of CodebaseRetrieval, in at most max_tokens, see estimate_tokens.
+        It also returns the tokens of all the contents and sources retrieved, to compare with.
+        """
+        budget = self._max_tokens if max_tokens is None else max_tokens
+        hits = self._hits(retrieval_results)
+        retrieved_tokens = sum(
+            estimate_tokens(hit.document.content or "") + estimate_tokens("\n".join(hit.lines or [])) for hit in hits
+        )
+
+        items, tokens = [], 0
+        for segment in self._segments(hits):
+            for form, text in self._forms(segment):
+                # the blank line between the items
+                text_tokens = estimate_tokens(text) + 1
+                if tokens + text_tokens <= budget:
+                    items.append(
+                        ContextItem(
+                            segment.path,
+                            segment.start_line,
+                            segment.end_line,
+                            segment.score,
+                            form,
+                            text,
+                            text_tokens,
+                            list(dict.fromkeys(hit.document.id for hit in segment.parts + segment.children)),
+                        )
+                    )
+                    tokens += text_tokens
+                    break
+
+        included = {item.path for item in items}
+        for document in retrieval_results.get("dependency_expansion", {}).get("documents", []):
+            if (path := str(document.meta.get("path"))) in included:
+                continue
+            text = f"# {path} ({document.meta.get('relation')}, {document.meta.get('hops')} hops)"
+            text_tokens = estimate_tokens(text) + 1
+            if tokens + text_tokens > budget:
+                break
+            items.append(ContextItem(path, 0, 0, 0.0, "reference", text, text_tokens, [document.id]))
+            tokens += text_tokens
+
+        return {
+            "context": "\n\n".join(item.text for item in items),
+            "items": items,
+            "tokens": tokens,
+            "retrieved_tokens": retrieved_tokens,
+        }
@@ -0,0 +1,189 @@
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.components.symbol_table import module_name
+
+if TYPE_CHECKING:
+    # the saved graphs are loaded without the parser and tree-sitter
+    from src.components.code_parser import Code
+
+
+def _csr(edges: List[Tuple[int, int]], size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The compressed sparse rows of the edges, i.e. the targets of node i are indices[indptr[i]:indptr[i + 1]].
+    """
+    edges = sorted(set(edges))
+    sources = np.array([source for source, _ in edges], dtype=np.int32)
+    indices = np.array([target for _, target in edges], dtype=np.int32)
+    indptr = np.zeros(size + 1, dtype=np.int32)
+    np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+    return indptr, indices
+
+
+class DependencyGraph:
+    """
+    The import graph between the files of the codebase, for the expansion of the retrieval results.
+
+    The imports are resolved to the parsed files by their module names, including the relative imports,
+    and the imports of other packages are dropped. The files are numbered in the order of the paths,
+    and both the imports and the importers of every file are kept as CSR arrays of int32.
+
+    """
+    def __init__(
+        self,
+        paths: List[str],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        reverse_indptr: np.ndarray,
+        reverse_indices: np.ndarray,
+    ) -> None:
+        self.paths = paths
+        self._ids = {path: i for i, path in enumerate(paths)}
+        self._indptr = indptr
+        self._indices = indices
+        self._reverse_indptr = reverse_indptr
+        self._reverse_indices = reverse_indices
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    @property
+    def edges(self) -> int:
+        return len(self._indices)
+
+    @classmethod
+    def build(cls, parsed_code: List["Code"]) -> "DependencyGraph":
+        parsed_code = sorted(parsed_code, key=lambda code: str(code.path))
+        paths = [str(code.path) for code in parsed_code]
+        module_names = [module_name(code.path) for code in parsed_code]
+
+        # the paths depend on the directory the codebase was parsed from, so the absolute imports are rooted
+        # at the modules and packages directly within the common directory of the files,
+        # or at the packages the common directory is nested in, e.g. "src" for the files of src/
+        packages = {module for path, module in zip(paths, module_names) if Path(path).stem == "__init__"}
+        directory = Path(os.path.commonpath([str(Path(path).parent) for path in paths])) if paths else Path()
+        root = [part for part in directory.parts if part not in ("", "/", ".")]
+        starts = [len(root)]
+        for end in range(len(root), 0, -1):
+            if ".".join(root[:end]) not in packages:
+                break
+            starts.append(end - 1)
+
+        # the full module names, for the relative imports, and the module names from every root
+        modules: Dict[str, List[int]] = {}
+        top_level = set()
+        for i, module in enumerate(module_names):
+            parts = module.split(".")
+            modules.setdefault(module, []).append(i)
+            for start in starts:
+                if start < len(parts):
+                    top_level.add(parts[start])
+                    if start:
+                        modules.setdefault(".".join(parts[start:]), []).append(i)
+
+        def _resolve(name: str, importer: int) -> Optional[int]:
+            # the other packages, even if a file of the codebase has the same name, e.g. src/providers/llm/openai.py
+            if not name.startswith(".") and name.split(".")[0] not in top_level:
+                return None
+
+            if name.startswith("."):
+                # one dot is the package of the importer, every further dot goes one package up
+                level = len(name) - len(name.lstrip("."))
+                package = module_names[importer].split(".")
+                if Path(paths[importer]).stem != "__init__":
+                    package = package[:-1]
+                package = package[: len(package) - level + 1]
+                name = ".".join(package + ([name.lstrip(".")] if name.lstrip(".") else []))
+
+            # "a.b.c" may be the module a.b.c, or the name c in the module a.b
+            parts = name.split(".")
+            for end in range(len(parts), 0, -1):
+                if candidates := modules.get(".".join(parts[:end])):
+                    # the same module name in several directories, prefer the closest one to the importer
+                    return max(candidates, key=lambda candidate: _common_prefix(paths[importer], paths[candidate]))
+            return None
+
+        edges = []
+        for i, code in enumerate(parsed_code):
+            for name in code.imports:
+                target = _resolve(name, i)
+                if target is not None and target != i:
+                    edges.append((i, target))
+
+        indptr, indices = _csr(edges, len(paths))
+        reverse_indptr, reverse_indices = _csr([(target, source) for source, target in edges], len(paths))
+        return cls(paths, indptr, indices, reverse_indptr, reverse_indices)
+
+    def imports(self, path: str) -> List[str]:
+        i = self._ids[str(path)]
+        return [self.paths[j] for j in self._indices[self._indptr[i] : self._indptr[i + 1]]]
+
+    def importers(self, path: str) -> List[str]:
+        i = self._ids[str(path)]
+        return [self.paths[j] for j in self._reverse_indices[self._reverse_indptr[i] : self._reverse_indptr[i + 1]]]
+
+    def expand(self, paths: List[str], hops: int = 1, direction: str = "both") -> Dict[str, Tuple[str, int]]:
+        """
+        The files reached from the paths within the hops, by "imports", "importers" or "both" edges.
+        It maps every reached file to how it was first reached, i.e. "imports" or "imported_by", and the number of hops.
+        The paths themselves and the unknown paths are left out.
+        """
+        seeds = np.array([self._ids[str(path)] for path in paths if str(path) in self._ids], dtype=np.int32)
+        visited = np.zeros(len(self.paths), dtype=bool)
+        visited[seeds] = True
+        reached: Dict[str, Tuple[str, int]] = {}
+
+        graphs = []
+        if direction in ("imports", "both"):
+            graphs.append(("imports", self._indptr, self._indices))
+        if direction in ("importers", "both"):
+            graphs.append(("imported_by", self._reverse_indptr, self._reverse_indices))
+
+        for relation, indptr, indices in graphs:
+            frontier = seeds
+            for hop in range(1, hops + 1):
+                if not len(frontier):
+                    break
+                neighbors = np.unique(
+                    np.concatenate([indices[indptr[i] : indptr[i + 1]] for i in frontier])
+                )
+                frontier = neighbors[~visited[neighbors]]
+                visited[frontier] = True
+                for i in frontier:
+                    reached[self.paths[i]] = (relation, hop)
+        return reached
+
+    def save(self, path: Path | str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                paths=np.array(self.paths, dtype=str),
+                indptr=self._indptr,
+                indices=self._indices,
+                reverse_indptr=self._reverse_indptr,
+                reverse_indices=self._reverse_indices,
+            )
+
+    @classmethod
+    def load(cls, path: Path | str) -> "DependencyGraph":
+        with np.load(path) as data:
+            return cls(
+                data["paths"].tolist(),
+                data["indptr"],
+                data["indices"],
+                data["reverse_indptr"],
+                data["reverse_indices"],
+            )
+
+
+def _common_prefix(a: str, b: str) -> int:
+    common = 0
+    for part_a, part_b in zip(Path(a).parts, Path(b).parts):
+        if part_a != part_b:
+            break
+        common += 1
+    return common
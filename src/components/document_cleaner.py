@@ -1,9 +1,10 @@
 import asyncio
-from typing import List
+from typing import List, Optional
 
 from haystack import component
 from haystack.document_stores.types import DocumentStore
 from src.components.code_parser import Code
+from src.components.index_version import IndexVersion, get_index_version
 
 
 @component
@@ -12,8 +13,9 @@ class DocumentCleaner:
     This component is used to clear all the documents in the specified document store(s).
 
     """
-    def __init__(self, stores: List[DocumentStore]) -> None:
+    def __init__(self, stores: List[DocumentStore], index_version: Optional[IndexVersion] = None) -> None:
         self._stores = stores
+        self._index_version = index_version or get_index_version()
 
     @component.output_types(parsed_code=list[Code])
     async def run(self, parsed_code: list[Code]) -> list[Code]:
@@ -41,5 +43,6 @@ class DocumentCleaner:
         await asyncio.gather(
             *[_clear_documents(store, parsed_code) for store in self._stores]
         )
+        self._index_version.bump()
 
         return {"parsed_code": parsed_code}
@@ -4,9 +4,21 @@ from haystack import component, Document
 from haystack.components.writers import DocumentWriter
 from haystack.document_stores.types import DuplicatePolicy
 
+from src.components.index_version import IndexVersion, get_index_version
+
 
 @component
 class AsyncDocumentWriter(DocumentWriter):
+    def __init__(
+        self,
+        document_store,
+        policy: DuplicatePolicy = DuplicatePolicy.NONE,
+        index_version: Optional[IndexVersion] = None,
+    ):
+        super(AsyncDocumentWriter, self).__init__(document_store=document_store, policy=policy)
+        # bumped after every write, so the cached retrieval results of the previous documents are not used
+        self._index_version = index_version or get_index_version()
+
     @component.output_types(documents_written=int)
     async def run(
         self, documents: List[Document], policy: Optional[DuplicatePolicy] = None
@@ -17,4 +29,5 @@ class AsyncDocumentWriter(DocumentWriter):
         documents_written = await self.document_store.write_documents(
             documents=documents, policy=policy
         )
+        self._index_version.bump()
         return {"documents_written": documents_written}
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+
+class IndexVersion:
+    """
+    A counter bumped whenever the indexed documents are written or cleaned,
+    so the retrieval results cached for an older version of the index are not used.
+
+    With a path, the counter is kept in a SQLite file shared by the worker processes and bumped in one atomic statement,
+    otherwise it is kept in memory.
+
+    """
+    def __init__(self, path: Optional[str | Path] = None) -> None:
+        self._lock = threading.Lock()
+        self._version = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS index_version (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)"
+            )
+            self._connection.execute("INSERT OR IGNORE INTO index_version VALUES (0, 0)")
+
+    def get(self) -> int:
+        with self._lock:
+            if self._connection is None:
+                return self._version
+            return self._connection.execute("SELECT version FROM index_version WHERE id = 0").fetchone()[0]
+
+    def bump(self) -> int:
+        with self._lock:
+            if self._connection is None:
+                self._version += 1
+                return self._version
+            return self._connection.execute(
+                "UPDATE index_version SET version = version + 1 WHERE id = 0 RETURNING version"
+            ).fetchone()[0]
+
+
+_index_version: Optional[IndexVersion] = None
+
+
+def get_index_version() -> IndexVersion:
+    global _index_version
+    if _index_version is None:
+        _index_version = IndexVersion(os.getenv("INDEX_VERSION_PATH"))
+    return _index_version
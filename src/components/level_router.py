@@ -0,0 +1,254 @@
+import logging
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("wren-ai-service")
+
+COLLECTIONS = ["code_file", "code_function", "code_class"]
+
+# the words and the spellings that name the level asked for, e.g. "which file configures Qdrant"
+_LEVEL_RULES = {
+    "code_file": re.compile(
+        r"\b(files?|modules?|scripts?|config(ure[sd]?|uration)?|settings|imports?|entry ?points?)\b|[\w/]+\.py\b",
+        re.IGNORECASE,
+    ),
+    "code_class": re.compile(r"\b(class(es)?|subclass(es)?|inherit\w*|base class)\b|`?\b[A-Z][a-z0-9]+[A-Z]\w*`?"),
+    # the methods are held by the documents of their classes, see SymbolTable
+    "code_function": re.compile(
+        r"\b(functions?|methods?|helpers?|def)\b|`_?\w+`|\b\w+\(\)|\b_?[a-z0-9]+_\w+\b",
+        re.IGNORECASE,
+    ),
+}
+
+
+@dataclass(frozen=True)
+class LevelRoute:
+    # the collections to search and the top k of each, the others are skipped
+    top_k: Dict[str, int]
+    # "rule", "classifier" or "fallback", when all the collections are searched
+    source: str
+    confidence: float
+    # the most probable collection by the classifier, also for the fallback routes, to measure the hit rate
+    predicted: Optional[str] = None
+    # whether the route is searched in full anyway to measure its hit rate, see LevelRouter.audit_rate
+    audit: bool = False
+
+
+@dataclass
+class RouterMetrics:
+    routes: Dict[str, int] = field(default_factory=lambda: {"rule": 0, "classifier": 0, "fallback": 0})
+    # the searches skipped out of the searches of all the collections
+    skipped: int = 0
+    searches: int = 0
+    # whether the best hit of the full searches was in the routed collections
+    audited: int = 0
+    hits: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "routes": dict(self.routes),
+            "skipped": self.skipped,
+            "searches": self.searches,
+            "audited": self.audited,
+            "hit_rate": self.hits / self.audited if self.audited else None,
+        }
+
+
+class LevelRouter:
+    """
+    It decides which collections a query searches, and with what top k, so the queries asking for one level,
+    e.g. "which file configures Qdrant" or "what does the `_traverse` helper do", skip the other searches.
+
+    The rules match the words and the identifiers naming a level. Otherwise a nearest centroid classifier over
+    the query embedding picks the level, with the probabilities of the softmax of the cosine similarities
+    to the centroids, where the temperature is calibrated on the seen examples. Below min_confidence,
+    or before every level has min_examples, all the collections are searched, and the level of the best hit
+    of these searches becomes an example, so the classifier learns from the fallback traffic.
+
+    A fraction audit_rate of the routed queries is searched in full anyway, to measure the hit rate of the routes,
+    i.e. how often the best hit is in the routed collections.
+
+    """
+    def __init__(
+        self,
+        top_k: int = 3,
+        min_confidence: float = 0.7,
+        min_examples: int = 20,
+        # the second most probable collection is also searched with a smaller top k, above this probability
+        secondary_confidence: float = 0.2,
+        audit_rate: float = 0.05,
+        use_rules: bool = True,
+        max_examples: int = 2048,
+    ) -> None:
+        self._top_k = top_k
+        self._min_confidence = min_confidence
+        self._min_examples = min_examples
+        self._secondary_confidence = secondary_confidence
+        self._audit_every = round(1 / audit_rate) if audit_rate > 0 else 0
+        self._use_rules = use_rules
+        self._sums: Optional[np.ndarray] = None
+        self._counts = np.zeros(len(COLLECTIONS), dtype=np.int64)
+        self.temperature = 0.05
+        # the latest examples, to recalibrate the temperature
+        self._examples: Deque[Tuple[np.ndarray, int]] = deque(maxlen=max_examples)
+        self._routed = 0
+        self.metrics = RouterMetrics()
+
+    @staticmethod
+    def _normalize(embedding: Any) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    @property
+    def trained(self) -> bool:
+        return self._sums is not None and bool((self._counts >= self._min_examples).all())
+
+    def _probabilities(self, vector: np.ndarray, temperature: Optional[float] = None) -> np.ndarray:
+        centroids = self._sums / np.maximum(self._counts, 1)[:, None]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        logits = centroids @ vector.T / (temperature or self.temperature)
+        logits -= logits.max(axis=0)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=0)
+
+    def _calibrate(self) -> None:
+        """
+        The temperature of the lowest negative log likelihood of the examples.
+        """
+        vectors = np.stack([vector for vector, _ in self._examples])
+        labels = np.array([label for _, label in self._examples])
+        best = None
+        for temperature in np.geomspace(0.005, 1.0, 30):
+            probabilities = self._probabilities(vectors, temperature)
+            loss = -np.log(probabilities[labels, np.arange(len(labels))] + 1e-12).mean()
+            if best is None or loss < best[0]:
+                best = (loss, float(temperature))
+        self.temperature = best[1]
+
+    def fit(self, embeddings: List[List[float]], collections: List[str]) -> "LevelRouter":
+        """
+        Add the embeddings of queries labeled by the collection they are answered from, and recalibrate.
+        """
+        for embedding, collection in zip(embeddings, collections):
+            self._add(self._normalize(embedding), COLLECTIONS.index(collection))
+        if self._examples:
+            self._calibrate()
+        return self
+
+    def _add(self, vector: np.ndarray, label: int) -> None:
+        if self._sums is None:
+            self._sums = np.zeros((len(COLLECTIONS), len(vector)), dtype=np.float64)
+        self._sums[label] += vector
+        self._counts[label] += 1
+        self._examples.append((vector, label))
+
+    def _rules(self, query: str) -> List[str]:
+        return [collection for collection, pattern in _LEVEL_RULES.items() if pattern.search(query)]
+
+    def route(self, query: str, embedding: Optional[List[float]] = None) -> LevelRoute:
+        predicted, probabilities = None, None
+        if self.trained and embedding is not None:
+            probabilities = self._probabilities(self._normalize(embedding)[None, :])[:, 0]
+            predicted = COLLECTIONS[int(np.argmax(probabilities))]
+
+        if self._use_rules and (collections := self._rules(query)):
+            if "code_function" in collections:
+                collections.append("code_class")
+            route = LevelRoute(
+                {collection: self._top_k for collection in COLLECTIONS if collection in collections},
+                "rule",
+                1.0,
+                predicted,
+            )
+        elif probabilities is not None and probabilities.max() >= self._min_confidence:
+            order = np.argsort(-probabilities)
+            top_k = {COLLECTIONS[order[0]]: self._top_k}
+            if probabilities[order[1]] >= self._secondary_confidence:
+                top_k[COLLECTIONS[order[1]]] = max(1, self._top_k // 3)
+            route = LevelRoute(top_k, "classifier", float(probabilities.max()), predicted)
+        else:
+            route = LevelRoute(
+                {collection: self._top_k for collection in COLLECTIONS},
+                "fallback",
+                float(probabilities.max()) if probabilities is not None else 0.0,
+                predicted,
+            )
+
+        if route.source != "fallback" and len(route.top_k) < len(COLLECTIONS) and self._audit_every:
+            self._routed += 1
+            if self._routed % self._audit_every == 0:
+                route = LevelRoute(route.top_k, route.source, route.confidence, route.predicted, audit=True)
+
+        self.metrics.routes[route.source] += 1
+        self.metrics.searches += len(COLLECTIONS)
+        if not route.audit:
+            self.metrics.skipped += len(COLLECTIONS) - len(route.top_k)
+        logger.info(
+            f"Routed the query to {', '.join(route.top_k)} by {route.source} "
+            f"with confidence {route.confidence:.2f}{' for an audit' if route.audit else ''}"
+        )
+        return route
+
+    def observe(self, route: LevelRoute, embedding: Optional[List[float]], results: Dict[str, dict]) -> None:
+        """
+        Learn from the results of a full search, i.e. a fallback or an audited route,
+        where results maps every collection to its retrieval results.
+        """
+        if route.source != "fallback" and not route.audit:
+            return
+
+        best = max(
+            (
+                (document.score or 0.0, collection)
+                for collection in COLLECTIONS
+                for document in results.get(collection, {}).get("documents", [])
+            ),
+            default=None,
+        )
+        if best is None:
+            return
+
+        if route.audit:
+            self.metrics.audited += 1
+            self.metrics.hits += best[1] in route.top_k
+            logger.info(
+                f"Audited the route to {', '.join(route.top_k)}: the best hit is in {best[1]}, "
+                f"hit rate {self.metrics.hits / self.metrics.audited:.2f} of {self.metrics.audited}"
+            )
+        elif embedding is not None:
+            self._add(self._normalize(embedding), COLLECTIONS.index(best[1]))
+            # recalibrate as the examples grow, every 64 of them
+            if len(self._examples) % 64 == 0 and self.trained:
+                self._calibrate()
+
+    def save(self, path: Path | str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                sums=self._sums if self._sums is not None else np.zeros((len(COLLECTIONS), 0)),
+                counts=self._counts,
+                temperature=np.array(self.temperature),
+            )
+
+    def load(self, path: Path | str, dimension: Optional[int] = None) -> "LevelRouter":
+        """
+        Load a saved router, unless it learned from the embeddings of another dimension than the given one,
+        e.g. before switching the embedder, where it starts over untrained.
+        """
+        with np.load(path) as data:
+            if dimension is not None and data["sums"].shape[1] not in (0, dimension):
+                logger.warning(
+                    f"Discarding the level router of {path}, it learned from {data['sums'].shape[1]} dimensional "
+                    f"embeddings instead of {dimension}"
+                )
+                return self
+            self._sums = data["sums"] if data["sums"].shape[1] else None
+            self._counts = data["counts"]
+            self.temperature = float(data["temperature"])
+        return self
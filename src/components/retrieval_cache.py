@@ -0,0 +1,239 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+from haystack import Document
+
+from src.components.index_version import IndexVersion, get_index_version
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+def _dump(results: Dict[str, Any]) -> bytes:
+    return orjson.dumps(
+        {
+            name: {"documents": [document.to_dict(flatten=False) for document in result["documents"]]}
+            for name, result in results.items()
+        },
+        default=str,
+    )
+
+
+def _load(value: bytes) -> Dict[str, Any]:
+    return {
+        name: {"documents": [Document.from_dict(document) for document in result["documents"]]}
+        for name, result in orjson.loads(value).items()
+    }
+
+
+class SqliteCacheBackend:
+    """
+    The cache entries shared by the worker processes in a SQLite file,
+    where the least recently used ones are evicted once they take more than max_bytes.
+    """
+    def __init__(self, path: str | Path, max_bytes: int = 256 * 2**20) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS retrieval_cache "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS retrieval_cache_accessed ON retrieval_cache (accessed)")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection.execute(
+                "UPDATE retrieval_cache SET accessed = ? WHERE key = ? RETURNING value", (time.time(), key)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO retrieval_cache VALUES (?, ?, ?, ?)", (key, value, len(value), time.time())
+                )
+                total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM retrieval_cache").fetchone()[0]
+                if total > self._max_bytes:
+                    # the oldest entries whose sizes add up to the excess
+                    self._connection.execute(
+                        "DELETE FROM retrieval_cache WHERE key IN ("
+                        "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed) AS freed FROM retrieval_cache) "
+                        "WHERE freed - size < ?)",
+                        (total - self._max_bytes,),
+                    )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+
+class RetrievalCache:
+    """
+    It caches the retrieval results by the normalized query, the retrieval parameters and the index version,
+    so the repeated questions skip the embedding and the searches, and the re-indexing invalidates the results.
+
+    The results are kept serialized in a least recently used cache of at most max_bytes,
+    in front of an optional shared backend for multi-worker deployments, see SqliteCacheBackend.
+    With semantic_threshold, a query missing from the cache reuses the results of a cached query of the same version
+    and parameters whose embedding is at least that cosine similar. The embeddings are kept by this process only.
+
+    """
+    def __init__(
+        self,
+        max_bytes: int = 64 * 2**20,
+        backend: Optional[SqliteCacheBackend] = None,
+        semantic_threshold: Optional[float] = None,
+        index_version: Optional[IndexVersion] = None,
+    ) -> None:
+        self._max_bytes = max_bytes
+        self._backend = backend
+        self.semantic_threshold = semantic_threshold
+        self._index_version = index_version or get_index_version()
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        # the normalized embeddings of the cached queries, with the key of the entry and the key of the parameters
+        self._embeddings = np.zeros((0, 0), dtype=np.float32)
+        self._embedding_keys: List[Tuple[str, str]] = []
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _params_key(self, params: Dict[str, Any]) -> str:
+        return hashlib.sha256(
+            orjson.dumps({**params, "index_version": self._index_version.get()}, option=orjson.OPT_SORT_KEYS, default=str)
+        ).hexdigest()
+
+    @staticmethod
+    def _key(query: str, params_key: str) -> str:
+        return hashlib.sha256(f"{params_key}\0{normalize_query(query)}".encode()).hexdigest()
+
+    def _get(self, key: str) -> Optional[bytes]:
+        if (value := self._entries.get(key)) is not None:
+            self._entries.move_to_end(key)
+            return value
+        if self._backend is not None and (value := self._backend.get(key)) is not None:
+            self._put(key, value)
+            return value
+        return None
+
+    def _put(self, key: str, value: bytes) -> None:
+        if len(value) > self._max_bytes:
+            return
+
+        if (previous := self._entries.pop(key, None)) is not None:
+            self._size -= len(previous)
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self._max_bytes:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._forget_embedding(evicted_key)
+
+    def _forget_embedding(self, key: str) -> None:
+        rows = [row for row, (entry_key, _) in enumerate(self._embedding_keys) if entry_key == key]
+        if rows:
+            self._embeddings = np.delete(self._embeddings, rows, axis=0)
+            self._embedding_keys = [keys for row, keys in enumerate(self._embedding_keys) if row not in rows]
+
+    def get(self, query: str, **params) -> Optional[Dict[str, Any]]:
+        """
+        The cached results of the query with the same parameters, e.g. top_k and filters, and the current index version.
+        """
+        if (value := self._get(self._key(query, self._params_key(params)))) is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return _load(value)
+
+    def get_similar(self, embedding: List[float], **params) -> Optional[Dict[str, Any]]:
+        """
+        The cached results of the most similar query, if it is at least semantic_threshold similar to the embedding.
+        """
+        if self.semantic_threshold is None or not self._embedding_keys:
+            return None
+
+        params_key = self._params_key(params)
+        rows = np.array([keys[1] == params_key for keys in self._embedding_keys])
+        if not rows.any():
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        similarities = self._embeddings[rows] @ (query / (np.linalg.norm(query) or 1.0))
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.semantic_threshold:
+            return None
+
+        key = [keys for keys, row in zip(self._embedding_keys, rows) if row][best][0]
+        if (value := self._get(key)) is None:
+            return None
+        # the exact lookup of the query was counted as a miss already
+        self.semantic_hits += 1
+        return _load(value)
+
+    def put(self, query: str, results: Dict[str, Any], embedding: Optional[List[float]] = None, **params) -> None:
+        params_key = self._params_key(params)
+        key = self._key(query, params_key)
+        value = _dump(results)
+        self._put(key, value)
+        if self._backend is not None:
+            self._backend.put(key, value)
+
+        if self.semantic_threshold is not None and embedding is not None and key in self._entries:
+            self._forget_embedding(key)
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+            self._embeddings = (
+                np.vstack([self._embeddings, vector]) if len(self._embedding_keys) else vector[None, :]
+            )
+            self._embedding_keys.append((key, params_key))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+        }
+
+
+def get_retrieval_cache() -> Optional[RetrievalCache]:
+    if os.getenv("RETRIEVAL_CACHE", "true").lower() != "true":
+        return None
+
+    path = os.getenv("RETRIEVAL_CACHE_PATH")
+    # the results shared across processes have to be invalidated by a version shared across them too
+    if path and not os.getenv("INDEX_VERSION_PATH"):
+        raise ValueError("RETRIEVAL_CACHE_PATH needs INDEX_VERSION_PATH, or the cache outlives the re-indexing")
+    max_bytes = int(os.getenv("RETRIEVAL_CACHE_MAX_BYTES") or 64 * 2**20)
+    return RetrievalCache(
+        max_bytes=max_bytes,
+        backend=SqliteCacheBackend(path, max_bytes=max_bytes * 4) if path else None,
+        semantic_threshold=(
+            float(os.getenv("RETRIEVAL_CACHE_SEMANTIC_THRESHOLD"))
+            if os.getenv("RETRIEVAL_CACHE_SEMANTIC_THRESHOLD")
+            else None
+        ),
+    )
@@ -0,0 +1,64 @@
+import zlib
+from collections import Counter
+from typing import List
+
+from haystack import Document, component
+from haystack.dataclasses import SparseEmbedding
+
+from src.utils import tokenize_code
+
+
+@component
+class SparseEncoder:
+    """
+    This component encodes the documents and queries into BM25-style sparse vectors for lexical search,
+    so the identifiers pasted into a query match the code, e.g. "_embed_batch" also matches "embed" and "batch".
+    The words come from the name, the path and the raw code of the documents, see tokenize_code.
+
+    The document vectors hold the BM25 term frequency part, and the inverse document frequency is applied by the store,
+    e.g. with the IDF modifier of Qdrant. The query vectors hold one for every distinct word.
+
+    """
+    def __init__(
+        self,
+        k1: float = 1.2,
+        b: float = 0.75,
+        # the average number of words per document, an estimate is good enough for the length normalization
+        avg_length: float = 256.0,
+        # the words of the name count as many times as this
+        name_weight: int = 3,
+    ) -> None:
+        self._k1 = k1
+        self._b = b
+        self._avg_length = avg_length
+        self._name_weight = name_weight
+
+    @staticmethod
+    def _index(word: str) -> int:
+        return zlib.crc32(word.encode())
+
+    def _words(self, document: Document) -> List[str]:
+        words = tokenize_code(str(document.meta.get("name") or "")) * self._name_weight
+        words += tokenize_code(str(document.meta.get("path") or ""))
+        words += tokenize_code(str(document.meta.get("raw_data") or document.content or ""))
+        return words
+
+    def encode_document(self, document: Document) -> SparseEmbedding:
+        words = self._words(document)
+        length_norm = self._k1 * (1 - self._b + self._b * len(words) / self._avg_length)
+        weights: dict[int, float] = {}
+        for word, tf in Counter(words).items():
+            index = self._index(word)
+            weights[index] = weights.get(index, 0.0) + tf * (self._k1 + 1) / (tf + length_norm)
+        return SparseEmbedding(indices=list(weights), values=list(weights.values()))
+
+    def encode_query(self, query: str) -> SparseEmbedding:
+        indices = sorted({self._index(word) for word in tokenize_code(query)})
+        return SparseEmbedding(indices=indices, values=[1.0] * len(indices))
+
+    @component.output_types(documents=List[Document])
+    def run(self, documents: List[Document]):
+        for document in documents:
+            document.sparse_embedding = self.encode_document(document)
+
+        return {"documents": documents}
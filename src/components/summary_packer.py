@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from typing import Any, List
+
+import orjson
+from haystack import component
+from haystack.components.builders.prompt_builder import PromptBuilder
+from pydantic import BaseModel, ValidationError
+
+from src.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+packed_system_prompt = """
+You will be given several requests, each one starts with a line "### id: <id>".
+Answer every request independently and return one summary per request, keyed by its id.
+"""
+
+packed_user_prompt_template = """
+{% for item in items %}
+### id: {{item.id}}
+{{item.prompt}}
+{% endfor %}
+"""
+
+
+class PackedSummary(BaseModel):
+    id: str
+    summary: str
+
+
+class PackedGenerationResult(BaseModel):
+    summaries: list[PackedSummary]
+
+
+PACKED_GENERATION_MODEL_KWARGS = {
+    "response_format": {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "code_summaries",
+            "schema": PackedGenerationResult.model_json_schema(),
+        },
+    }
+}
+
+
+@component
+class SummaryPacker:
+    """
+    This component packs several small summary prompts into one LLM request, up to a token budget.
+    The results keep the shape of the generator replies, so they can be postprocessed as if every prompt was sent on its own.
+    The summaries of a packed request are marked as packed, and only the first one holds the usage of the request.
+    Prompts missing from the packed response, or of a failed packed request, are sent on their own with the fallback generator.
+    Every prompt comes with the AST complexity of its code, and a packed request is routed on the highest one of the pack,
+    see ModelRouter.
+
+    """
+    def __init__(
+        self,
+        generator: Any,
+        packed_generator: Any,
+        max_pack_tokens: int = 2048,
+        max_pack_size: int = 10,
+        max_item_tokens: int = 512,
+    ) -> None:
+        self._generator = generator
+        self._packed_generator = packed_generator
+        self._max_pack_tokens = max_pack_tokens
+        self._max_pack_size = max_pack_size
+        self._max_item_tokens = max_item_tokens
+        self._prompt_builder = PromptBuilder(template=packed_user_prompt_template)
+
+    def _pack(self, prompts: List[dict]) -> List[List[int]]:
+        packs, pack, pack_tokens = [], [], 0
+        for i, prompt in enumerate(prompts):
+            tokens = estimate_tokens(prompt["prompt"])
+            if tokens > self._max_item_tokens:
+                packs.append([i])
+                continue
+
+            if pack and (
+                pack_tokens + tokens > self._max_pack_tokens
+                or len(pack) >= self._max_pack_size
+            ):
+                packs.append(pack)
+                pack, pack_tokens = [], 0
+            pack.append(i)
+            pack_tokens += tokens
+
+        if pack:
+            packs.append(pack)
+        return packs
+
+    @staticmethod
+    def _to_reply(summary: str, meta: dict) -> dict:
+        return {
+            "replies": [orjson.dumps({"summary": summary}).decode()],
+            "meta": [meta],
+        }
+
+    def _generate(self, prompt: dict) -> Any:
+        return self._generator(prompt=prompt["prompt"], complexity=prompt.get("complexity"))
+
+    async def _run_pack(self, prompts: List[dict], pack: List[int]) -> dict[int, dict]:
+        if len(pack) == 1:
+            return {pack[0]: await self._generate(prompts[pack[0]])}
+
+        complexities = [prompts[i]["complexity"] for i in pack if prompts[i].get("complexity") is not None]
+        summaries, meta = {}, {}
+        try:
+            result = await self._packed_generator(
+                prompt=self._prompt_builder.run(
+                    items=[{"id": str(i), "prompt": prompts[i]["prompt"]} for i in pack]
+                )["prompt"],
+                complexity=max(complexities, default=None),
+            )
+        except Exception:
+            # e.g. the packed prompt exceeds the context length, or the retries are exhausted
+            logger.exception(f"The packed request of {len(pack)} prompts failed, falling back to one request per prompt")
+        else:
+            meta = result["meta"][0] if result.get("meta") else {}
+            try:
+                packed = PackedGenerationResult.model_validate_json(result["replies"][0])
+                for item in packed.summaries:
+                    if item.summary.strip():
+                        summaries[item.id] = item.summary
+            except (ValidationError, IndexError, KeyError):
+                logger.warning(f"Failed to parse the packed summaries of {len(pack)} prompts, falling back to one request per prompt")
+
+        results, missing = {}, []
+        for i in pack:
+            if str(i) in summaries:
+                # the usage is of the whole packed request, so it is only counted on its first summary
+                item_meta = {**meta, "packed": True}
+                if results:
+                    item_meta.pop("usage", None)
+                results[i] = self._to_reply(summaries[str(i)], item_meta)
+            else:
+                missing.append(i)
+
+        if missing:
+            logger.warning(f"{len(missing)} of {len(pack)} packed prompts are missing from the response, sending them one by one")
+            replies = await asyncio.gather(
+                *[self._generate(prompts[i]) for i in missing]
+            )
+            results.update(zip(missing, replies))
+
+        return results
+
+    @component.output_types(results=List[dict])
+    async def run(self, prompts: List[dict]):
+        packs = self._pack(prompts)
+        logger.info(f"Packed {len(prompts)} prompts into {len(packs)} LLM requests")
+
+        results = {}
+        for pack_results in await asyncio.gather(
+            *[self._run_pack(prompts, pack) for pack in packs]
+        ):
+            results.update(pack_results)
+
+        return {"results": [results[i] for i in range(len(prompts))]}
@@ -0,0 +1,250 @@
+import bisect
+import re
+from dataclasses import astuple, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import orjson
+
+if TYPE_CHECKING:
+    # the saved tables are loaded without the parser and tree-sitter
+    from src.components.code_parser import Code
+
+# a dotted name, optionally quoted in backticks or followed by call parentheses, e.g. `AsyncDocumentWriter.run()`
+_IDENTIFIER_QUERY_PATTERN = re.compile(r"^`?([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*)(?:\(\))?`?$")
+# underscores, dots or capitals after the first character
+_CODE_NAME_PATTERN = re.compile(r"[_.]|.[A-Z]")
+
+
+@dataclass(frozen=True)
+class Symbol:
+    # the name within its file, e.g. "AsyncDocumentWriter.run"
+    name: str
+    # module, class, function or method
+    kind: str
+    # the collection and the id of the document holding the symbol, methods are held by the documents of their classes
+    collection: str
+    document_id: str
+    path: str
+    start_line: int
+    end_line: int
+
+
+@dataclass(frozen=True)
+class SymbolMatch:
+    symbol: Symbol
+    # 1.0 for the exact matches, lower for the prefix and fuzzy matches
+    score: float
+
+
+def module_name(path: Path | str) -> str:
+    """
+    The dotted module name of the path, e.g. "src/components/__init__.py" gives "src.components".
+    """
+    parts = list(Path(path).with_suffix("").parts)
+    if parts and parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(part for part in parts if part not in ("", "/", "."))
+
+
+def parse_identifier_query(query: str) -> Optional[str]:
+    """
+    The name asked for, if the query is a bare identifier, e.g. "`CodeParser`" or "AsyncDocumentWriter.run()".
+    """
+    match = _IDENTIFIER_QUERY_PATTERN.match(query.strip())
+    return match.group(1) if match else None
+
+
+def _edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    The Levenshtein distance, or max_distance + 1 once it is certainly larger than max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class SymbolTable:
+    """
+    It maps the names of the parsed symbols to the indexed documents holding them, so the identifier queries
+    are answered without embedding them, see CodebaseRetrieval.
+
+    Every symbol is registered under its name in the file, its short name, its aliases and its module qualified names,
+    e.g. "AsyncDocumentWriter.run", "run", and "document_writer.AsyncDocumentWriter.run" up to the full module path.
+    The lowercase names are kept in a sorted array, with the symbol index of every name in a parallel array,
+    so the exact and prefix lookups are binary searches.
+
+    """
+    def __init__(self, symbols: Optional[List[Symbol]] = None, names: Optional[List[Tuple[str, int]]] = None) -> None:
+        self.symbols = symbols or []
+        names = sorted(names or [], key=lambda item: (item[0].lower(), item[0], item[1]))
+        self._keys = [name.lower() for name, _ in names]
+        self._names = [name for name, _ in names]
+        self._entries = [entry for _, entry in names]
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @classmethod
+    def build(cls, parsed_code: List["Code"]) -> "SymbolTable":
+        symbols: List[Symbol] = []
+        names: List[Tuple[str, int]] = []
+
+        def add(symbol: Symbol, module: str, aliases: List[str]) -> None:
+            entry = len(symbols)
+            symbols.append(symbol)
+            local_names = {symbol.name, symbol.name.rsplit(".", 1)[-1], *aliases}
+            if symbol.kind == "module":
+                local_names = {module.rsplit(".", 1)[-1], symbol.path} if module else {symbol.path}
+            names.extend((name, entry) for name in local_names)
+
+            # every suffix of the module path, since the paths depend on the directory the codebase was parsed from
+            parts = module.split(".") if module else []
+            for start in range(len(parts) - (symbol.kind == "module")):
+                prefix = ".".join(parts[start:])
+                names.append((prefix if symbol.kind == "module" else f"{prefix}.{symbol.name}", entry))
+
+        for code in parsed_code:
+            path = str(code.path)
+            module = module_name(code.path)
+            aliases: Dict[str, List[str]] = {}
+            for alias, target in code.aliases.items():
+                aliases.setdefault(target, []).append(alias)
+
+            add(
+                Symbol(module, "module", "code_file", path, path, 1, code.content.count("\n") + 1),
+                module,
+                [],
+            )
+            for global_class in code.global_classes:
+                add(
+                    Symbol(
+                        global_class.name,
+                        "class",
+                        "code_class",
+                        global_class.id,
+                        path,
+                        global_class.start_line,
+                        global_class.end_line,
+                    ),
+                    module,
+                    aliases.get(global_class.name, []),
+                )
+                for method in global_class.methods:
+                    add(
+                        Symbol(
+                            f"{global_class.name}.{method.name}",
+                            "method",
+                            "code_class",
+                            global_class.id,
+                            path,
+                            method.start_line,
+                            method.end_line,
+                        ),
+                        module,
+                        [],
+                    )
+            for global_function in code.global_functions:
+                add(
+                    Symbol(
+                        global_function.name,
+                        "function",
+                        "code_function",
+                        global_function.id,
+                        path,
+                        global_function.start_line,
+                        global_function.end_line,
+                    ),
+                    module,
+                    aliases.get(global_function.name, []),
+                )
+
+        return cls(symbols, names)
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        key = prefix.lower()
+        return bisect.bisect_left(self._keys, key), bisect.bisect_left(self._keys, key + "\uffff")
+
+    def _matches(self, positions, score) -> List[SymbolMatch]:
+        matches, seen = [], set()
+        for position in positions:
+            if (entry := self._entries[position]) not in seen:
+                seen.add(entry)
+                matches.append(SymbolMatch(self.symbols[entry], score(position)))
+        return matches
+
+    def lookup(self, name: str) -> List[SymbolMatch]:
+        """
+        The symbols registered under the name, ignoring case, where the names with the same case come first.
+        """
+        key = name.lower()
+        start = bisect.bisect_left(self._keys, key)
+        end = bisect.bisect_right(self._keys, key, lo=start)
+        positions = sorted(range(start, end), key=lambda position: self._names[position] != name)
+        return self._matches(positions, lambda _: 1.0)
+
+    def prefix(self, prefix: str, limit: int = 10) -> List[SymbolMatch]:
+        start, end = self._range(prefix)
+        # the shorter names are closer to the prefix, so they match better
+        positions = sorted(range(start, end), key=lambda position: len(self._keys[position]))
+        return self._matches(positions, lambda position: len(prefix) / len(self._keys[position]))[:limit]
+
+    def fuzzy(self, name: str, max_distance: Optional[int] = None, limit: int = 10) -> List[SymbolMatch]:
+        """
+        The symbols within max_distance edits of the name, by default one edit per five characters.
+        Only the names with the same first character are compared, as typos rarely change it.
+        """
+        key = name.lower()
+        if max_distance is None:
+            max_distance = max(1, len(key) // 5)
+        if not key:
+            return []
+
+        start, end = self._range(key[0])
+        distances = {
+            position: distance
+            for position in range(start, end)
+            if (distance := _edit_distance(key, self._keys[position], max_distance)) <= max_distance
+        }
+        positions = sorted(distances, key=lambda position: distances[position])
+        return self._matches(positions, lambda position: 1 - distances[position] / max(len(key), 1))[:limit]
+
+    def search(self, name: str, limit: int = 10) -> List[SymbolMatch]:
+        """
+        The exact matches, else the prefix matches, else the fuzzy matches of the name.
+        The prefix and fuzzy matches are only tried for the names spelled as code, e.g. "parse_code" or "CodeParser",
+        since a plain word that starts or is close to a symbol name is more likely meant as a word.
+        """
+        if matches := self.lookup(name)[:limit]:
+            return matches
+        if _CODE_NAME_PATTERN.search(name):
+            return self.prefix(name, limit) or self.fuzzy(name, limit=limit)
+        return []
+
+    def save(self, path: Path | str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_bytes(
+            orjson.dumps(
+                {
+                    "symbols": [astuple(symbol) for symbol in self.symbols],
+                    "names": list(zip(self._names, self._entries)),
+                }
+            )
+        )
+
+    @classmethod
+    def load(cls, path: Path | str) -> "SymbolTable":
+        data = orjson.loads(Path(path).read_bytes())
+        return cls(
+            [Symbol(*symbol) for symbol in data["symbols"]],
+            [(name, entry) for name, entry in data["names"]],
+        )
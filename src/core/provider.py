@@ -12,6 +12,10 @@ class LLMProvider(metaclass=ABCMeta):
     def get_model_kwargs(self):
         return self._model_kwargs
 
+    def get_route_metrics(self):
+        # the providers routing the prompts to several models return the metrics of every route, see ModelRouter
+        return {}
+
 
 class EmbedderProvider(metaclass=ABCMeta):
     @abstractmethod
@@ -37,3 +41,7 @@ class DocumentStoreProvider(metaclass=ABCMeta):
     @abstractmethod
     def get_retriever(self, *args, **kwargs):
         ...
+
+    def get_sparse_encoder(self):
+        # the stores supporting hybrid search return the encoder of their sparse vectors
+        return None
@@ -1,59 +1,294 @@
+import argparse
 import asyncio
+import os
+import sys
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator, Optional, Tuple
 
-from src.pipelines.indexing import CodeParsing, CodeClassIndexing, CodeFunctionIndexing, CodeFileIndexing
-from src.pipelines.retrieval import CodebaseRetrieval
-from src.utils import init_langfuse
-from src.providers.llm.openai import OpenAILLMProvider
-from src.providers.embedder.openai import OpenAIEmbedderProvider
-from src.providers.document_store.qdrant import QdrantProvider
+import orjson
 
+from src.core.provider import DocumentStoreProvider, EmbedderProvider
+from src.utils import init_langfuse, to_json
 
-async def main():
-    init_langfuse()
+# the pipelines and the providers are imported by the commands using them, after the environment is loaded,
+# so e.g. query starts without the indexing pipelines, the LLM providers and the clients of the unused stores
+if TYPE_CHECKING:
+    from src.components.dependency_graph import DependencyGraph
+    from src.components.symbol_table import SymbolTable
+
+# the symbol table, the dependency graph and the level router of the indexed codebase, next to the memmap vectors,
+# unless CODEBASE_INDEX_PATH or --index-path is given
+INDEX_PATH = ".codebase_index"
+
+
+def _symbol_table_path(index_path: Path) -> Path:
+    return index_path / "symbol_table.json"
+
+
+def _dependency_graph_path(index_path: Path) -> Path:
+    return index_path / "dependency_graph.npz"
+
+
+def level_router_path(index_path: Path) -> Path:
+    return index_path / "level_router.npz"
+
+
+def index_version_path(index_path: Path) -> Path:
+    # shared by the index, query and serve processes, so an index run invalidates the results cached by the others
+    return index_path / "index_version.sqlite"
+
+
+def get_embedder_provider() -> EmbedderProvider:
+    # the local embedder runs on CPU without network access, so it is deterministic and not recorded
+    if os.getenv("EMBEDDER_PROVIDER") == "local":
+        from src.providers.embedder.local import LocalEmbedderProvider
+
+        return LocalEmbedderProvider()
+
+    from src.providers.cassette import CassetteEmbedderProvider, get_cassette
+    from src.providers.embedder.openai import OpenAIEmbedderProvider
 
-    code_path = Path("example/test")
-    llm = OpenAILLMProvider()
     embedder = OpenAIEmbedderProvider()
-    document_store = QdrantProvider()
+    # with CASSETTE_PATH set, the LLM and embedding calls are recorded to or replayed from a local file
+    if cassette := get_cassette():
+        embedder = CassetteEmbedderProvider(embedder, cassette)
+    return embedder
+
+
+def get_document_store_provider() -> DocumentStoreProvider:
+    # the memmap store runs in-process without a Qdrant service
+    if os.getenv("DOCUMENT_STORE_PROVIDER") == "memmap":
+        from src.providers.document_store.memmap import MemmapProvider
+
+        return MemmapProvider()
+
+    from src.providers.document_store.qdrant import QdrantProvider
+
+    return QdrantProvider()
+
+
+def load_codebase(index_path: Path) -> Tuple[Optional["SymbolTable"], Optional["DependencyGraph"]]:
+    """
+    The symbol table and the dependency graph saved by the index command, if any.
+    """
+    from src.components.dependency_graph import DependencyGraph
+    from src.components.symbol_table import SymbolTable
+
+    return (
+        SymbolTable.load(path) if (path := _symbol_table_path(index_path)).exists() else None,
+        DependencyGraph.load(path) if (path := _dependency_graph_path(index_path)).exists() else None,
+    )
+
+
+def save_codebase(index_path: Path, symbol_table: "SymbolTable", dependency_graph: "DependencyGraph") -> None:
+    """
+    Save the symbol table and the dependency graph of an indexed codebase, for load_codebase.
+    """
+    symbol_table.save(_symbol_table_path(index_path))
+    dependency_graph.save(_dependency_graph_path(index_path))
+
+
+async def index(code_path: Path, index_path: Path, fast: bool = False, backfill: bool = False) -> None:
+    from src.components.code_minifier import CodeMinifier
+    from src.pipelines.indexing import CodeParsing, CodeClassIndexing, CodeFunctionIndexing, CodeFileIndexing
+    from src.providers.cassette import CassetteLLMProvider, get_cassette
+    from src.providers.client_pool import get_client_pool
+    from src.providers.llm.openai import OpenAILLMProvider
+
+    llm = OpenAILLMProvider()
+    if cassette := get_cassette():
+        llm = CassetteLLMProvider(llm, cassette)
+    embedder = get_embedder_provider()
+    document_store = get_document_store_provider()
+    code_minifier = CodeMinifier()
 
     code_parsing = CodeParsing()
-    parsed_code = code_parsing.run(code_path)['parse_code']
+    parsing_results = code_parsing.run(code_path)
+    parsed_code = parsing_results['parse_code']
 
     code_class_indexing = CodeClassIndexing(
         llm_provider=llm,
         embedder_provider=embedder,
         document_store_provider=document_store,
+        hierarchical=True,
+        packing=True,
+        fast=fast,
+        code_minifier=code_minifier,
     )
     code_function_indexing = CodeFunctionIndexing(
         llm_provider=llm,
         embedder_provider=embedder,
         document_store_provider=document_store,
+        packing=True,
+        fast=fast,
+        code_minifier=code_minifier,
     )
     code_file_indexing = CodeFileIndexing(
         llm_provider=llm,
         embedder_provider=embedder,
         document_store_provider=document_store,
+        hierarchical=True,
+        fast=fast,
+        code_minifier=code_minifier,
     )
-    codebase_retrieval = CodebaseRetrieval(
-        embedder_provider=embedder,
-        document_store_provider=document_store,
-    )
 
+    await get_client_pool().warmup()
+
+    # file summaries are composed from class and function summaries, so they have to be generated first
     await asyncio.gather(
         code_class_indexing.run(parsed_code),
         code_function_indexing.run(parsed_code),
-        code_file_indexing.run(parsed_code),
     )
+    await code_file_indexing.run(parsed_code)
+
+    save_codebase(index_path, parsing_results['build_symbol_table'], parsing_results['build_dependency_graph'])
+    print(
+        f'Indexed {len(parsed_code)} files of {code_path} into {index_path}, saved '
+        f'{code_minifier.original_tokens - code_minifier.minified_tokens} of '
+        f'{code_minifier.original_tokens} prompt tokens by minifying the code',
+        flush=True,
+    )
+    if not backfill:
+        return
+
+    # the fast index is saved and can be queried by other processes, while the summaries are upserted over it by id
+    await asyncio.gather(
+        code_class_indexing.backfill(parsed_code),
+        code_function_indexing.backfill(parsed_code),
+    )
+    await code_file_indexing.backfill(parsed_code)
+    print(f'Backfilled the LLM summaries of {len(parsed_code)} files of {code_path}')
+
+
+async def _read_lines() -> AsyncIterator[str]:
+    """
+    The lines of stdin, read without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    except (ValueError, OSError, NotImplementedError):
+        # regular files and some platforms can not be watched by the event loop, so they are read in a thread
+        while line := await asyncio.to_thread(sys.stdin.readline):
+            yield line
+        return
+
+    while line := await reader.readline():
+        yield line.decode()
 
-    while True:
-        query = input("Ask me anything about the codebase: (type 'exit' to quit)\n")
-        if query == 'exit':
-            break
-        print(f'You asked: {query}')
 
-        query_results = await codebase_retrieval.run(query)
-        print(f'Query results: {query_results}')
+async def query(
+    index_path: Path,
+    questions: Optional[list[str]] = None,
+    max_tokens: int = 4000,
+    output_json: bool = False,
+) -> None:
+    """
+    Answer the questions, or the lines of stdin without questions, from the existing index.
+    Only the embedder and the document store are built, so it starts without indexing pipelines or LLM generators.
+    """
+    from src.components.level_router import LevelRouter
+    from src.components.retrieval_cache import get_retrieval_cache
+    from src.pipelines.retrieval import CodebaseRetrieval
+
+    symbol_table, dependency_graph = load_codebase(index_path)
+    embedder_provider = get_embedder_provider()
+    level_router = LevelRouter()
+    if (router_path := level_router_path(index_path)).exists():
+        level_router.load(router_path, dimension=embedder_provider.get_dimensions())
+
+    codebase_retrieval = CodebaseRetrieval(
+        embedder_provider=embedder_provider,
+        document_store_provider=get_document_store_provider(),
+        symbol_table=symbol_table,
+        dependency_graph=dependency_graph,
+        expand_hops=1,
+        cache=get_retrieval_cache(),
+        level_router=level_router,
+    )
+
+    async def answer(question: str) -> None:
+        start = time.perf_counter()
+        query_results = await codebase_retrieval.run(question, max_tokens=max_tokens)
+        if output_json:
+            sys.stdout.buffer.write(orjson.dumps(to_json(query_results), default=str) + b"\n")
+            sys.stdout.flush()
+            return
+        context = query_results["assemble_context"]
+        print(
+            f'Context of {context["tokens"]} of {context["retrieved_tokens"]} retrieved tokens '
+            f'in {time.perf_counter() - start:.2f}s:\n{context["context"]}\n',
+            flush=True,
+        )
+
+    try:
+        if questions:
+            for question in questions:
+                await answer(question)
+            return
+
+        interactive = sys.stdin.isatty()
+        if interactive:
+            print("Ask me anything about the codebase: (type 'exit' to quit)", flush=True)
+        async for line in _read_lines():
+            question = line.strip()
+            if question == 'exit':
+                break
+            if question:
+                await answer(question)
+    finally:
+        # the router learns from the fallback searches, so it is kept for the next session
+        level_router.save(level_router_path(index_path))
+
+
+async def serve(host: str, port: int, index_path: Path) -> None:
+    # the service builds the indexing pipelines, so it is only imported to serve
+    from src.service import get_service, serve as serve_service
+
+    service = get_service(index_path)
+    service.retrieval.update_codebase(*load_codebase(index_path))
+    await serve_service(host, port, service)
+
+
+async def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Index a codebase, and query it in natural language")
+    parser.add_argument("--index-path", type=Path)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="parse and index a codebase")
+    index_parser.add_argument("path", nargs="?", type=Path, default=Path("example/test"))
+    index_parser.add_argument("--fast", action="store_true", help="embed code outlines instead of LLM summaries")
+    index_parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="with --fast, then generate the LLM summaries and upsert them over the fast index",
+    )
+
+    query_parser = subparsers.add_parser("query", help="query an indexed codebase")
+    query_parser.add_argument("questions", nargs="*", help="answer these and exit, instead of reading stdin")
+    query_parser.add_argument("--max-tokens", type=int, default=4000)
+    query_parser.add_argument("--json", action="store_true", help="print the results as JSON lines")
+
+    serve_parser = subparsers.add_parser("serve", help="serve the indexing and retrieval over HTTP")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+
+    args = parser.parse_args(argv)
+    if args.command == "index" and args.backfill and not args.fast:
+        parser.error("--backfill needs --fast")
+    # also loads the environment of .env, before the providers read their defaults
+    init_langfuse()
+    args.index_path = args.index_path or Path(os.getenv("CODEBASE_INDEX_PATH") or INDEX_PATH)
+    os.environ.setdefault("INDEX_VERSION_PATH", str(index_version_path(args.index_path)))
+
+    if args.command == "index":
+        await index(args.path, args.index_path, fast=args.fast, backfill=args.backfill)
+    elif args.command == "query":
+        await query(args.index_path, args.questions, max_tokens=args.max_tokens, output_json=args.json)
+    else:
+        await serve(args.host, args.port, args.index_path)
 
 if __name__ == "__main__":
     asyncio.run(main())
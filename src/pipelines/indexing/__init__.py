@@ -1,7 +1,12 @@
-from .code_parsing import CodeParsing
-from .code_file_indexing import CodeFileIndexing
-from .code_class_indexing import CodeClassIndexing
-from .code_function_indexing import CodeFunctionIndexing
+import importlib
+
+# imported on first access, so e.g. the parsing pipeline does not import the LLM providers of the indexing ones
+_EXPORTS = {
+    "CodeParsing": ".code_parsing",
+    "CodeFileIndexing": ".code_file_indexing",
+    "CodeClassIndexing": ".code_class_indexing",
+    "CodeFunctionIndexing": ".code_function_indexing",
+}
 
 __all__ = [
     "CodeParsing",
@@ -9,3 +14,9 @@ __all__ = [
     "CodeClassIndexing",
     "CodeFunctionIndexing",
 ]
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
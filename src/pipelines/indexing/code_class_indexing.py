@@ -1,6 +1,6 @@
 import asyncio
 import sys
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from hamilton import base
 from hamilton.async_driver import AsyncDriver
@@ -13,9 +13,17 @@ import orjson
 
 from src.core.pipeline import BasicPipeline
 from src.core.provider import EmbedderProvider, DocumentStoreProvider, LLMProvider
+from src.components.code_minifier import CodeMinifier
+from src.components.code_outliner import CodeOutliner
 from src.components.code_parser import Code
 from src.components.document_writer import AsyncDocumentWriter
 from src.components.document_cleaner import DocumentCleaner
+from src.components.sparse_encoder import SparseEncoder
+from src.components.summary_packer import (
+    PACKED_GENERATION_MODEL_KWARGS,
+    SummaryPacker,
+    packed_system_prompt,
+)
 
 system_prompt = """
 """
@@ -26,29 +34,151 @@ Code: {{content}}
 Please generate a summary of the code.
 """
 
+hierarchical_user_prompt_template = """
+Class: {{signature}}
+
+Method summaries:
+{% for method in methods -%}
+- {{method.name}}: {{method.summary}}
+{% endfor %}
+
+Please generate a summary of the class based on its signature and the summaries of its methods.
+"""
+
 
 @observe(capture_input=False, capture_output=False)
 async def clean_documents(
-    parsed_code: list[Code], cleaner: DocumentCleaner
+    parsed_code: list[Code], cleaner: DocumentCleaner, index_mode: str
 ) -> list[Code]:
+    # backfilled documents are upserted over the fast ones by id, so the fast index stays usable in the meantime
+    if index_mode == "backfill":
+        return parsed_code
+
     return (await cleaner.run(parsed_code=parsed_code))['parsed_code']
 
 
 @observe(capture_input=False)
-def prepare_class_summary_prompts(clean_documents: list[Code], prompt_builder: PromptBuilder) -> list[dict]:
+def prepare_method_summary_prompts(
+    clean_documents: list[Code],
+    prompt_builder: PromptBuilder,
+    code_minifier: Any,
+    hierarchical: bool,
+    index_mode: str,
+) -> list[dict]:
+    if not hierarchical or index_mode == "fast":
+        return []
+
+    methods = [
+        method
+        for code in clean_documents
+        for global_class in code.global_classes
+        for method in global_class.methods
+    ]
+    contents = [method.content for method in methods]
+    if code_minifier is not None:
+        contents = code_minifier.run(contents=contents)["contents"]
+
     return [
-        prompt_builder.run(
-            content=global_class.content,
+        {
+            **prompt_builder.run(content=content),
+            "complexity": method.complexity,
+        }
+        for method, content in zip(methods, contents)
+    ]
+
+
+@observe(as_type="generation", capture_input=False)
+async def generate_method_summaries(
+    prepare_method_summary_prompts: list[dict], generator: Any, summary_packer: Any
+) -> list[dict]:
+    if summary_packer is not None:
+        return (
+            await summary_packer.run(prompts=prepare_method_summary_prompts)
+        )["results"]
+
+    tasks = [
+        asyncio.ensure_future(
+            generator(prompt=prompt.get("prompt"), complexity=prompt.get("complexity"))
         )
-        for code in clean_documents
+        for prompt in prepare_method_summary_prompts
+    ]
+
+    return await asyncio.gather(*tasks)
+
+
+@observe(capture_input=False, capture_output=False)
+def postprocess_method_summaries(generate_method_summaries: list[dict], clean_documents: list[Code]) -> list[Code]:
+    summaries = [
+        orjson.loads(result['replies'][0])['summary']
+        for result in generate_method_summaries
+    ][::-1]
+
+    if summaries:
+        for code in clean_documents:
+            for global_class in code.global_classes:
+                for method in global_class.methods:
+                    method.generated_summary = summaries.pop()
+
+    return clean_documents
+
+
+@observe(capture_input=False)
+def prepare_class_summary_prompts(
+    postprocess_method_summaries: list[Code],
+    prompt_builder: PromptBuilder,
+    hierarchical_prompt_builder: PromptBuilder,
+    code_minifier: Any,
+    hierarchical: bool,
+    index_mode: str,
+) -> list[dict]:
+    if index_mode == "fast":
+        return []
+
+    global_classes = [
+        global_class
+        for code in postprocess_method_summaries
         for global_class in code.global_classes
     ]
+    # compose the class summary from its method summaries instead of sending the whole class body again
+    contents = [
+        global_class.signature if hierarchical else global_class.content
+        for global_class in global_classes
+    ]
+    if code_minifier is not None:
+        contents = code_minifier.run(contents=contents)["contents"]
+
+    return [
+        {
+            **(
+                hierarchical_prompt_builder.run(
+                    signature=content,
+                    methods=[
+                        {"name": method.name, "summary": method.generated_summary}
+                        for method in global_class.methods
+                    ],
+                )
+                if hierarchical
+                else prompt_builder.run(content=content)
+            ),
+            "complexity": global_class.complexity,
+        }
+        for global_class, content in zip(global_classes, contents)
+    ]
 
 
 @observe(as_type="generation", capture_input=False)
-async def generate_class_summaries(prepare_class_summary_prompts: list[dict], generator: Any) -> list[str]:
+async def generate_class_summaries(
+    prepare_class_summary_prompts: list[dict], generator: Any, summary_packer: Any
+) -> list[str]:
+    if summary_packer is not None:
+        return (
+            await summary_packer.run(prompts=prepare_class_summary_prompts)
+        )["results"]
+
     tasks = [
-        asyncio.ensure_future(generator(prompt=prompt.get("prompt")))
+        asyncio.ensure_future(
+            generator(prompt=prompt.get("prompt"), complexity=prompt.get("complexity"))
+        )
         for prompt in prepare_class_summary_prompts
     ]
 
@@ -56,23 +186,35 @@ async def generate_class_summaries(prepare_class_summary_prompts: list[dict], ge
 
 
 @observe
-def postprocess_class_summaries(generate_class_summaries: list[str], parsed_code: list[Code]) -> list[Document]:
+def postprocess_class_summaries(
+    generate_class_summaries: list[str], parsed_code: list[Code], outliner: CodeOutliner, index_mode: str
+) -> list[Document]:
     summaries = [
         orjson.loads(result['replies'][0])['summary']
         for result in generate_class_summaries
     ][::-1]
 
-    for code in parsed_code:
-        for global_class in code.global_classes:
-            global_class.generated_summary = summaries.pop()
+    if index_mode != "fast":
+        for code in parsed_code:
+            for global_class in code.global_classes:
+                global_class.generated_summary = summaries.pop()
 
     return [
         Document(
-            content=global_class.generated_summary,
+            id=global_class.id,
+            content=(
+                outliner.outline_class(global_class)
+                if index_mode == "fast"
+                else global_class.generated_summary
+            ),
             meta={
                 "path": code.path,
                 "name": global_class.name,
                 "raw_data": global_class.content,
+                "signature": global_class.signature,
+                "start_line": global_class.start_line,
+                "end_line": global_class.end_line,
+                "index_mode": index_mode,
             },
         )
         for code in parsed_code
@@ -81,8 +223,16 @@ def postprocess_class_summaries(generate_class_summaries: list[str], parsed_code
 
 
 @observe(capture_input=False, capture_output=False)
-async def embed_classes(postprocess_class_summaries: list[Document], embedder: Any) -> Dict[str, Any]:
-    return await embedder(documents=postprocess_class_summaries)
+async def embed_classes(
+    postprocess_class_summaries: list[Document],
+    embedder: Any,
+    sparse_encoder: Optional[SparseEncoder],
+) -> Dict[str, Any]:
+    result = await embedder(documents=postprocess_class_summaries)
+    # the sparse vectors for hybrid search, if the document store supports them
+    if sparse_encoder is not None:
+        sparse_encoder.run(documents=result["documents"])
+    return result
 
 
 @observe(capture_input=False)
@@ -109,26 +259,57 @@ class CodeClassIndexing(BasicPipeline):
         llm_provider: LLMProvider,
         embedder_provider: EmbedderProvider,
         document_store_provider: DocumentStoreProvider,
+        hierarchical: bool = False,
+        packing: bool = False,
+        fast: bool = False,
+        code_minifier: Optional[CodeMinifier] = None,
         **kwargs,
     ):
         store = document_store_provider.get_store(dataset_name="code_class")
+        generator = llm_provider.get_generator(
+            system_prompt=system_prompt,
+            generation_kwargs=GENERATION_MODEL_KWARGS,
+            level="class",
+        )
 
         self._components = {
             "cleaner": DocumentCleaner([store]),
             "embedder": embedder_provider.get_document_embedder(),
-            "generator": llm_provider.get_generator(
-                system_prompt=system_prompt,
-                generation_kwargs=GENERATION_MODEL_KWARGS,
+            "sparse_encoder": document_store_provider.get_sparse_encoder(),
+            "generator": generator,
+            # pack several small classes into one LLM request to cut the per-request overhead
+            "summary_packer": (
+                SummaryPacker(
+                    generator=generator,
+                    packed_generator=llm_provider.get_generator(
+                        system_prompt=packed_system_prompt,
+                        generation_kwargs=PACKED_GENERATION_MODEL_KWARGS,
+                        level="class",
+                    ),
+                )
+                if packing
+                else None
             ),
             "prompt_builder": PromptBuilder(
                 template=user_prompt_template,
             ),
+            "hierarchical_prompt_builder": PromptBuilder(
+                template=hierarchical_user_prompt_template,
+            ),
+            "outliner": CodeOutliner(),
+            "code_minifier": code_minifier,
             "writer": AsyncDocumentWriter(
                 document_store=store,
                 policy=DuplicatePolicy.OVERWRITE,
             ),
         }
 
+        self._configs = {
+            # the fast mode embeds outlines built from the parsed code instead of LLM summaries
+            "index_mode": "fast" if fast else "summary",
+            "hierarchical": hierarchical,
+        }
+
         super().__init__(
             AsyncDriver({}, sys.modules[__name__], result_builder=base.DictResult())
         )
@@ -140,5 +321,21 @@ class CodeClassIndexing(BasicPipeline):
             inputs={
                 "parsed_code": parsed_code,
                 **self._components,
+                **self._configs,
+            },
+        )
+
+    @observe(name="Code Class Indexing Backfill")
+    async def backfill(self, parsed_code: list[Code]):
+        """
+        Generate the LLM summaries of the parsed code and upsert them over the documents written in the fast mode.
+        """
+        return await self._pipe.execute(
+            ["write_classes"],
+            inputs={
+                "parsed_code": parsed_code,
+                **self._components,
+                **self._configs,
+                "index_mode": "backfill",
             },
         )
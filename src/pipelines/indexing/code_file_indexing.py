@@ -1,6 +1,6 @@
 import asyncio
 import sys
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from haystack import Document
 from hamilton import base
@@ -13,9 +13,12 @@ import orjson
 
 from src.core.pipeline import BasicPipeline
 from src.core.provider import EmbedderProvider, DocumentStoreProvider, LLMProvider
+from src.components.code_minifier import CodeMinifier
+from src.components.code_outliner import CodeOutliner
 from src.components.code_parser import Code
 from src.components.document_writer import AsyncDocumentWriter
 from src.components.document_cleaner import DocumentCleaner
+from src.components.sparse_encoder import SparseEncoder
 
 
 system_prompt = """
@@ -27,23 +30,94 @@ Code: {{content}}
 Please generate a summary of the code.
 """
 
+hierarchical_user_prompt_template = """
+File: {{path}}
+
+Imports:
+{% for import in imports -%}
+- {{import}}
+{% endfor %}
+
+Module-level code:
+{{module_code}}
+
+Class summaries:
+{% for class in classes -%}
+- {{class.name}}: {{class.summary}}
+{% endfor %}
+
+Function summaries:
+{% for function in functions -%}
+- {{function.name}}: {{function.summary}}
+{% endfor %}
+
+Please generate a summary of the file based on its imports, module-level code and the summaries of its classes and functions.
+"""
+
 
 @observe(capture_input=False, capture_output=False)
 async def clean_documents(
-    parsed_code: list[Code], cleaner: DocumentCleaner
+    parsed_code: list[Code], cleaner: DocumentCleaner, index_mode: str
 ) -> list[Code]:
+    # backfilled documents are upserted over the fast ones by id, so the fast index stays usable in the meantime
+    if index_mode == "backfill":
+        return parsed_code
+
     return (await cleaner.run(parsed_code=parsed_code))['parsed_code']
 
 
 @observe(capture_input=False)
-def prepare_file_summary_prompts(clean_documents: list[Code], prompt_builder: PromptBuilder) -> list[dict]:
-    return [prompt_builder.run(content=code.content) for code in clean_documents]
+def prepare_file_summary_prompts(
+    clean_documents: list[Code],
+    prompt_builder: PromptBuilder,
+    hierarchical_prompt_builder: PromptBuilder,
+    code_minifier: Any,
+    hierarchical: bool,
+    index_mode: str,
+) -> list[dict]:
+    if index_mode == "fast":
+        return []
+
+    contents = [
+        "\n".join(code.module_code) if hierarchical else code.content
+        for code in clean_documents
+    ]
+    if code_minifier is not None:
+        contents = code_minifier.run(contents=contents)["contents"]
+
+    # class and function summaries are expected to be generated by CodeClassIndexing and CodeFunctionIndexing first,
+    # fall back to their signatures for the ones that are not summarized yet
+    return [
+        {
+            **(
+                hierarchical_prompt_builder.run(
+                    path=str(code.path),
+                    imports=code.imports,
+                    module_code=content,
+                    classes=[
+                        {"name": global_class.name, "summary": global_class.generated_summary or global_class.signature}
+                        for global_class in code.global_classes
+                    ],
+                    functions=[
+                        {"name": global_function.name, "summary": global_function.generated_summary or global_function.signature}
+                        for global_function in code.global_functions
+                    ],
+                )
+                if hierarchical
+                else prompt_builder.run(content=content)
+            ),
+            "complexity": code.complexity,
+        }
+        for code, content in zip(clean_documents, contents)
+    ]
 
 
 @observe(as_type="generation", capture_input=False)
 async def generate_file_summaries(prepare_file_summary_prompts: list[dict], generator: Any) -> list[dict]:
     tasks = [
-        asyncio.ensure_future(generator(prompt=prompt.get("prompt")))
+        asyncio.ensure_future(
+            generator(prompt=prompt.get("prompt"), complexity=prompt.get("complexity"))
+        )
         for prompt in prepare_file_summary_prompts
     ]
 
@@ -51,24 +125,33 @@ async def generate_file_summaries(prepare_file_summary_prompts: list[dict], gene
 
 
 @observe
-def postprocess_file_summaries(generate_file_summaries: list[dict], parsed_code: list[Code]) -> list[Document]:
+def postprocess_file_summaries(
+    generate_file_summaries: list[dict], parsed_code: list[Code], outliner: CodeOutliner, index_mode: str
+) -> list[Document]:
     summaries = [
         orjson.loads(result['replies'][0])['summary']
         for result in generate_file_summaries
     ][::-1]
 
-    for code in parsed_code:
-        code.generated_summary = summaries.pop()
+    if index_mode != "fast":
+        for code in parsed_code:
+            code.generated_summary = summaries.pop()
 
     return [
         Document(
-            content=code.generated_summary,
+            id=str(code.path),
+            content=(
+                outliner.outline_file(code)
+                if index_mode == "fast"
+                else code.generated_summary
+            ),
             meta={
                 "path": code.path,
                 "raw_data": code.content,
                 "imports": code.imports,
                 "global_classes": [global_class.name for global_class in code.global_classes],
                 "global_functions": [global_function.name for global_function in code.global_functions],
+                "index_mode": index_mode,
             },
         )
         for code in parsed_code
@@ -76,8 +159,16 @@ def postprocess_file_summaries(generate_file_summaries: list[dict], parsed_code:
 
 
 @observe(capture_input=False, capture_output=False)
-async def embed_files(postprocess_file_summaries: list[Document], embedder: Any) -> Dict[str, Any]:
-    return await embedder(documents=postprocess_file_summaries)
+async def embed_files(
+    postprocess_file_summaries: list[Document],
+    embedder: Any,
+    sparse_encoder: Optional[SparseEncoder],
+) -> Dict[str, Any]:
+    result = await embedder(documents=postprocess_file_summaries)
+    # the sparse vectors for hybrid search, if the document store supports them
+    if sparse_encoder is not None:
+        sparse_encoder.run(documents=result["documents"])
+    return result
 
 
 @observe(capture_input=False)
@@ -104,6 +195,9 @@ class CodeFileIndexing(BasicPipeline):
         llm_provider: LLMProvider,
         embedder_provider: EmbedderProvider,
         document_store_provider: DocumentStoreProvider,
+        hierarchical: bool = False,
+        fast: bool = False,
+        code_minifier: Optional[CodeMinifier] = None,
         **kwargs,
     ):
         store = document_store_provider.get_store(dataset_name="code_file")
@@ -111,19 +205,32 @@ class CodeFileIndexing(BasicPipeline):
         self._components = {
             "cleaner": DocumentCleaner([store]),
             "embedder": embedder_provider.get_document_embedder(),
+            "sparse_encoder": document_store_provider.get_sparse_encoder(),
             "generator": llm_provider.get_generator(
                 system_prompt=system_prompt,
                 generation_kwargs=GENERATION_MODEL_KWARGS,
+                level="file",
             ),
             "prompt_builder": PromptBuilder(
                 template=user_prompt_template,
             ),
+            "hierarchical_prompt_builder": PromptBuilder(
+                template=hierarchical_user_prompt_template,
+            ),
+            "outliner": CodeOutliner(),
+            "code_minifier": code_minifier,
             "writer": AsyncDocumentWriter(
                 document_store=store,
                 policy=DuplicatePolicy.OVERWRITE,
             ),
         }
 
+        self._configs = {
+            # the fast mode embeds outlines built from the parsed code instead of LLM summaries
+            "index_mode": "fast" if fast else "summary",
+            "hierarchical": hierarchical,
+        }
+
         super().__init__(
             AsyncDriver({}, sys.modules[__name__], result_builder=base.DictResult())
         )
@@ -135,5 +242,21 @@ class CodeFileIndexing(BasicPipeline):
             inputs={
                 "parsed_code": parsed_code,
                 **self._components,
+                **self._configs,
+            },
+        )
+
+    @observe(name="Code File Indexing Backfill")
+    async def backfill(self, parsed_code: list[Code]):
+        """
+        Generate the LLM summaries of the parsed code and upsert them over the documents written in the fast mode.
+        """
+        return await self._pipe.execute(
+            ["write_files"],
+            inputs={
+                "parsed_code": parsed_code,
+                **self._components,
+                **self._configs,
+                "index_mode": "backfill",
             },
         )
@@ -1,6 +1,6 @@
 import asyncio
 import sys
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from hamilton import base
 from hamilton.async_driver import AsyncDriver
@@ -13,9 +13,17 @@ import orjson
 
 from src.core.pipeline import BasicPipeline
 from src.core.provider import EmbedderProvider, DocumentStoreProvider, LLMProvider
+from src.components.code_minifier import CodeMinifier
+from src.components.code_outliner import CodeOutliner
 from src.components.code_parser import Code
 from src.components.document_writer import AsyncDocumentWriter
 from src.components.document_cleaner import DocumentCleaner
+from src.components.sparse_encoder import SparseEncoder
+from src.components.summary_packer import (
+    PACKED_GENERATION_MODEL_KWARGS,
+    SummaryPacker,
+    packed_system_prompt,
+)
 
 
 system_prompt = """
@@ -30,26 +38,53 @@ Please generate a summary of the code.
 
 @observe(capture_input=False, capture_output=False)
 async def clean_documents(
-    parsed_code: list[Code], cleaner: DocumentCleaner
+    parsed_code: list[Code], cleaner: DocumentCleaner, index_mode: str
 ) -> list[Code]:
+    # backfilled documents are upserted over the fast ones by id, so the fast index stays usable in the meantime
+    if index_mode == "backfill":
+        return parsed_code
+
     return (await cleaner.run(parsed_code=parsed_code))['parsed_code']
 
 
 @observe(capture_input=False)
-def prepare_function_summary_prompts(clean_documents: list[Code], prompt_builder: PromptBuilder) -> list[dict]:
-    return [
-        prompt_builder.run(
-            content=global_function.content,
-        )
+def prepare_function_summary_prompts(
+    clean_documents: list[Code], prompt_builder: PromptBuilder, code_minifier: Any, index_mode: str
+) -> list[dict]:
+    if index_mode == "fast":
+        return []
+
+    global_functions = [
+        global_function
         for code in clean_documents
         for global_function in code.global_functions
     ]
+    contents = [global_function.content for global_function in global_functions]
+    if code_minifier is not None:
+        contents = code_minifier.run(contents=contents)["contents"]
+
+    return [
+        {
+            **prompt_builder.run(content=content),
+            "complexity": global_function.complexity,
+        }
+        for global_function, content in zip(global_functions, contents)
+    ]
 
 
 @observe(as_type="generation", capture_input=False)
-async def generate_function_summaries(prepare_function_summary_prompts: list[dict], generator: Any) -> list[dict]:
+async def generate_function_summaries(
+    prepare_function_summary_prompts: list[dict], generator: Any, summary_packer: Any
+) -> list[dict]:
+    if summary_packer is not None:
+        return (
+            await summary_packer.run(prompts=prepare_function_summary_prompts)
+        )["results"]
+
     tasks = [
-        asyncio.ensure_future(generator(prompt=prompt.get("prompt")))
+        asyncio.ensure_future(
+            generator(prompt=prompt.get("prompt"), complexity=prompt.get("complexity"))
+        )
         for prompt in prepare_function_summary_prompts
     ]
 
@@ -57,23 +92,35 @@ async def generate_function_summaries(prepare_function_summary_prompts: list[dic
 
 
 @observe
-def postprocess_function_summaries(generate_function_summaries: list[dict], parsed_code: list[Code]) -> list[Document]:
+def postprocess_function_summaries(
+    generate_function_summaries: list[dict], parsed_code: list[Code], outliner: CodeOutliner, index_mode: str
+) -> list[Document]:
     summaries = [
         orjson.loads(result['replies'][0])['summary']
         for result in generate_function_summaries
     ][::-1]
 
-    for code in parsed_code:
-        for global_function in code.global_functions:
-            global_function.generated_summary = summaries.pop()
+    if index_mode != "fast":
+        for code in parsed_code:
+            for global_function in code.global_functions:
+                global_function.generated_summary = summaries.pop()
 
     return [
         Document(
-            content=global_function.generated_summary,
+            id=global_function.id,
+            content=(
+                outliner.outline_function(global_function)
+                if index_mode == "fast"
+                else global_function.generated_summary
+            ),
             meta={
                 "path": code.path,
                 "name": global_function.name,
                 "raw_data": global_function.content,
+                "signature": global_function.signature,
+                "start_line": global_function.start_line,
+                "end_line": global_function.end_line,
+                "index_mode": index_mode,
             },
         )
         for code in parsed_code
@@ -82,8 +129,16 @@ def postprocess_function_summaries(generate_function_summaries: list[dict], pars
 
 
 @observe(capture_input=False, capture_output=False)
-async def embed_functions(postprocess_function_summaries: list[Document], embedder: Any) -> Dict[str, Any]:
-    return await embedder(documents=postprocess_function_summaries)
+async def embed_functions(
+    postprocess_function_summaries: list[Document],
+    embedder: Any,
+    sparse_encoder: Optional[SparseEncoder],
+) -> Dict[str, Any]:
+    result = await embedder(documents=postprocess_function_summaries)
+    # the sparse vectors for hybrid search, if the document store supports them
+    if sparse_encoder is not None:
+        sparse_encoder.run(documents=result["documents"])
+    return result
 
 
 @observe(capture_input=False)
@@ -110,26 +165,52 @@ class CodeFunctionIndexing(BasicPipeline):
         llm_provider: LLMProvider,
         embedder_provider: EmbedderProvider,
         document_store_provider: DocumentStoreProvider,
+        packing: bool = False,
+        fast: bool = False,
+        code_minifier: Optional[CodeMinifier] = None,
         **kwargs,
     ):
         store = document_store_provider.get_store(dataset_name="code_function")
+        generator = llm_provider.get_generator(
+            system_prompt=system_prompt,
+            generation_kwargs=GENERATION_MODEL_KWARGS,
+            level="function",
+        )
 
         self._components = {
             "cleaner": DocumentCleaner([store]),
             "embedder": embedder_provider.get_document_embedder(),
-            "generator": llm_provider.get_generator(
-                system_prompt=system_prompt,
-                generation_kwargs=GENERATION_MODEL_KWARGS,
+            "sparse_encoder": document_store_provider.get_sparse_encoder(),
+            "generator": generator,
+            # pack several small functions into one LLM request to cut the per-request overhead
+            "summary_packer": (
+                SummaryPacker(
+                    generator=generator,
+                    packed_generator=llm_provider.get_generator(
+                        system_prompt=packed_system_prompt,
+                        generation_kwargs=PACKED_GENERATION_MODEL_KWARGS,
+                        level="function",
+                    ),
+                )
+                if packing
+                else None
             ),
             "prompt_builder": PromptBuilder(
                 template=user_prompt_template,
             ),
+            "outliner": CodeOutliner(),
+            "code_minifier": code_minifier,
             "writer": AsyncDocumentWriter(
                 document_store=store,
                 policy=DuplicatePolicy.OVERWRITE,
             ),
         }
 
+        self._configs = {
+            # the fast mode embeds outlines built from the parsed code instead of LLM summaries
+            "index_mode": "fast" if fast else "summary",
+        }
+
         super().__init__(
             AsyncDriver({}, sys.modules[__name__], result_builder=base.DictResult())
         )
@@ -141,5 +222,21 @@ class CodeFunctionIndexing(BasicPipeline):
             inputs={
                 "parsed_code": parsed_code,
                 **self._components,
+                **self._configs,
+            },
+        )
+
+    @observe(name="Code Function Indexing Backfill")
+    async def backfill(self, parsed_code: list[Code]):
+        """
+        Generate the LLM summaries of the parsed code and upsert them over the documents written in the fast mode.
+        """
+        return await self._pipe.execute(
+            ["write_functions"],
+            inputs={
+                "parsed_code": parsed_code,
+                **self._components,
+                **self._configs,
+                "index_mode": "backfill",
             },
         )
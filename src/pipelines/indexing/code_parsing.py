@@ -7,6 +7,8 @@ from langfuse.decorators import observe
 
 from src.core.pipeline import BasicPipeline
 from src.components.code_parser import CodeParser, Code
+from src.components.dependency_graph import DependencyGraph
+from src.components.symbol_table import SymbolTable
 
 
 @observe(name="parse_code")
@@ -14,6 +16,16 @@ def parse_code(path: Path, code_parser: CodeParser) -> list[Code]:
     return code_parser.parse(path)
 
 
+@observe(capture_input=False, capture_output=False)
+def build_symbol_table(parse_code: list[Code]) -> SymbolTable:
+    return SymbolTable.build(parse_code)
+
+
+@observe(capture_input=False, capture_output=False)
+def build_dependency_graph(parse_code: list[Code]) -> DependencyGraph:
+    return DependencyGraph.build(parse_code)
+
+
 class CodeParsing(BasicPipeline):
     def __init__(self, **kwargs,):
         self._components = {
@@ -26,7 +38,7 @@ class CodeParsing(BasicPipeline):
 
     def run(self, path: Path):
         return self._pipe.execute(
-            ["parse_code"],
+            ["parse_code", "build_symbol_table", "build_dependency_graph"],
             inputs={
                 "path": path,
                 **self._components,
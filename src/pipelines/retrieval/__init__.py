@@ -1,3 +1,14 @@
-from .codebase_retrieval import CodebaseRetrieval
+import importlib
+
+# imported on first access, like the indexing pipelines
+_EXPORTS = {
+    "CodebaseRetrieval": ".codebase_retrieval",
+}
 
 __all__ = ["CodebaseRetrieval"]
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
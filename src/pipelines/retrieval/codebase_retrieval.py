@@ -1,10 +1,20 @@
+import asyncio
 import sys
-from typing import Any
+import time
+from typing import Any, AsyncIterator, List, Optional, Tuple
 
 from hamilton import base
 from hamilton.async_driver import AsyncDriver
+from haystack import Document
+from haystack.dataclasses import SparseEmbedding
 from langfuse.decorators import observe
 
+from src.components.context_assembler import ContextAssembler
+from src.components.dependency_graph import DependencyGraph
+from src.components.level_router import COLLECTIONS, LevelRoute, LevelRouter
+from src.components.retrieval_cache import RetrievalCache
+from src.components.sparse_encoder import SparseEncoder
+from src.components.symbol_table import SymbolTable, parse_identifier_query
 from src.core.pipeline import BasicPipeline
 from src.core.provider import DocumentStoreProvider, EmbedderProvider
 
@@ -15,61 +25,355 @@ async def embedding(query: str, embedder: Any) -> dict:
     return await embedder.run(query)
 
 
+@observe(capture_input=False, capture_output=False)
+def sparse_embedding(query: str, sparse_encoder: Optional[SparseEncoder]) -> Optional[SparseEmbedding]:
+    # without a sparse encoder the retrievers only search the dense vectors
+    if sparse_encoder is None:
+        return None
+    return sparse_encoder.encode_query(query)
+
+
+@observe(capture_input=False, capture_output=False)
+def level_route(query: str, embedding: dict, level_router: Optional[LevelRouter]) -> Optional[LevelRoute]:
+    # without a level router every collection is searched
+    if level_router is None:
+        return None
+    return level_router.route(query, embedding.get("embedding"))
+
+
 @observe(capture_input=False)
-async def code_file_retrieval(embedding: dict, code_file_retriever: Any) -> dict:
+async def code_file_retrieval(
+    embedding: dict,
+    sparse_embedding: Optional[SparseEmbedding],
+    filters: Optional[dict],
+    payload_fields: Optional[list],
+    level_route: Optional[LevelRoute],
+    code_file_retriever: Any,
+) -> dict:
+    if _skipped(level_route, "code_file"):
+        return {"documents": []}
     return await code_file_retriever.run(
         query_embedding=embedding.get("embedding"),
+        query_sparse_embedding=sparse_embedding,
+        filters=filters,
+        top_k=_routed_top_k(level_route, "code_file"),
+        payload_fields=payload_fields,
     )
 
 
 @observe(capture_input=False)
-async def code_function_retrieval(embedding: dict, code_function_retriever: Any) -> dict:
+async def code_function_retrieval(
+    embedding: dict,
+    sparse_embedding: Optional[SparseEmbedding],
+    filters: Optional[dict],
+    payload_fields: Optional[list],
+    level_route: Optional[LevelRoute],
+    code_function_retriever: Any,
+) -> dict:
+    if _skipped(level_route, "code_function"):
+        return {"documents": []}
     return await code_function_retriever.run(
         query_embedding=embedding.get("embedding"),
+        query_sparse_embedding=sparse_embedding,
+        filters=filters,
+        top_k=_routed_top_k(level_route, "code_function"),
+        payload_fields=payload_fields,
     )
 
 
 @observe(capture_input=False)
-async def code_class_retrieval(embedding: dict, code_class_retriever: Any) -> dict:
+async def code_class_retrieval(
+    embedding: dict,
+    sparse_embedding: Optional[SparseEmbedding],
+    filters: Optional[dict],
+    payload_fields: Optional[list],
+    level_route: Optional[LevelRoute],
+    code_class_retriever: Any,
+) -> dict:
+    if _skipped(level_route, "code_class"):
+        return {"documents": []}
     return await code_class_retriever.run(
         query_embedding=embedding.get("embedding"),
+        query_sparse_embedding=sparse_embedding,
+        filters=filters,
+        top_k=_routed_top_k(level_route, "code_class"),
+        payload_fields=payload_fields,
+    )
+
+
+@observe(capture_input=False)
+def dependency_expansion(
+    code_file_retrieval: dict,
+    code_function_retrieval: dict,
+    code_class_retrieval: dict,
+    dependency_graph: Optional[DependencyGraph],
+    expand_hops: int,
+) -> dict:
+    return _expand_dependencies(
+        [code_file_retrieval, code_function_retrieval, code_class_retrieval],
+        dependency_graph,
+        expand_hops,
     )
 
 
 @observe(capture_input=False)
 async def construct_retrieval_results(
-    code_file_retrieval: dict, code_function_retrieval: dict, code_class_retrieval: dict
+    code_file_retrieval: dict,
+    code_function_retrieval: dict,
+    code_class_retrieval: dict,
+    dependency_expansion: dict,
 ) -> dict:
     return {
         "code_file_retrieval": code_file_retrieval,
         "code_function_retrieval": code_function_retrieval,
         "code_class_retrieval": code_class_retrieval,
+        "dependency_expansion": dependency_expansion,
     }
 
 
+@observe(capture_input=False, capture_output=False)
+async def batch_embeddings(queries: list[str], embedder: Any) -> dict:
+    return await embedder.run_batch(queries)
+
+
+@observe(capture_input=False, capture_output=False)
+def batch_sparse_embeddings(
+    queries: list[str], sparse_encoder: Optional[SparseEncoder]
+) -> Optional[list[SparseEmbedding]]:
+    if sparse_encoder is None:
+        return None
+    return [sparse_encoder.encode_query(query) for query in queries]
+
+
+@observe(capture_input=False, capture_output=False)
+async def code_file_batch_retrieval(
+    batch_embeddings: dict,
+    batch_sparse_embeddings: Optional[list[SparseEmbedding]],
+    filters: Optional[dict],
+    payload_fields: Optional[list],
+    code_file_retriever: Any,
+) -> dict:
+    return await code_file_retriever.run_batch(
+        query_embeddings=batch_embeddings["embeddings"],
+        query_sparse_embeddings=batch_sparse_embeddings,
+        filters=filters,
+        payload_fields=payload_fields,
+    )
+
+
+@observe(capture_input=False, capture_output=False)
+async def code_function_batch_retrieval(
+    batch_embeddings: dict,
+    batch_sparse_embeddings: Optional[list[SparseEmbedding]],
+    filters: Optional[dict],
+    payload_fields: Optional[list],
+    code_function_retriever: Any,
+) -> dict:
+    return await code_function_retriever.run_batch(
+        query_embeddings=batch_embeddings["embeddings"],
+        query_sparse_embeddings=batch_sparse_embeddings,
+        filters=filters,
+        payload_fields=payload_fields,
+    )
+
+
+@observe(capture_input=False, capture_output=False)
+async def code_class_batch_retrieval(
+    batch_embeddings: dict,
+    batch_sparse_embeddings: Optional[list[SparseEmbedding]],
+    filters: Optional[dict],
+    payload_fields: Optional[list],
+    code_class_retriever: Any,
+) -> dict:
+    return await code_class_retriever.run_batch(
+        query_embeddings=batch_embeddings["embeddings"],
+        query_sparse_embeddings=batch_sparse_embeddings,
+        filters=filters,
+        payload_fields=payload_fields,
+    )
+
+
+@observe(capture_input=False, capture_output=False)
+def construct_batch_retrieval_results(
+    code_file_batch_retrieval: dict,
+    code_function_batch_retrieval: dict,
+    code_class_batch_retrieval: dict,
+    dependency_graph: Optional[DependencyGraph],
+    expand_hops: int,
+) -> list[dict]:
+    results = []
+    for file_documents, function_documents, class_documents in zip(
+        code_file_batch_retrieval["documents"],
+        code_function_batch_retrieval["documents"],
+        code_class_batch_retrieval["documents"],
+    ):
+        result = {
+            "code_file_retrieval": {"documents": file_documents},
+            "code_function_retrieval": {"documents": function_documents},
+            "code_class_retrieval": {"documents": class_documents},
+        }
+        result["dependency_expansion"] = _expand_dependencies(list(result.values()), dependency_graph, expand_hops)
+        results.append(result)
+    return results
+
+
 ## End of Pipeline
 
 
+def _skipped(level_route: Optional[LevelRoute], collection: str) -> bool:
+    # the audited routes search every collection to measure the hit rate of the route
+    return level_route is not None and not level_route.audit and collection not in level_route.top_k
+
+
+def _routed_top_k(level_route: Optional[LevelRoute], collection: str) -> Optional[int]:
+    if level_route is None or level_route.audit:
+        return None
+    return level_route.top_k.get(collection)
+
+
+def _expand_dependencies(
+    retrieval_results: list[dict],
+    dependency_graph: Optional[DependencyGraph],
+    expand_hops: int,
+) -> dict:
+    """
+    The files imported by and importing the files of the retrieved documents, up to expand_hops away,
+    found in the dependency graph without any embedding or vector search.
+    """
+    if dependency_graph is None or expand_hops <= 0:
+        return {"documents": []}
+
+    paths = list(
+        dict.fromkeys(
+            str(document.meta["path"])
+            for result in retrieval_results
+            for document in result["documents"]
+            if document.meta.get("path")
+        )
+    )
+    reached = dependency_graph.expand(paths, hops=expand_hops)
+    return {
+        "documents": [
+            Document(
+                id=path,
+                meta={
+                    "path": path,
+                    "relation": relation,
+                    "hops": hops,
+                    "retrieval": "dependency",
+                },
+            )
+            for path, (relation, hops) in sorted(reached.items(), key=lambda item: item[1][1])
+        ]
+    }
+
+
+# the collection searched for every name of the results, the dependency expansion holds files
+_COLLECTIONS = {
+    "code_file_retrieval": "code_file",
+    "code_function_retrieval": "code_function",
+    "code_class_retrieval": "code_class",
+    "dependency_expansion": "code_file",
+}
+
+# the fields the context is assembled from, fetched for the documents retrieved without them, see ContextAssembler
+_CONTEXT_FIELDS = ["raw_data", "signature", "start_line", "end_line"]
+
+
+def _merge_fetched(document: Document, fetched: Document) -> Document:
+    """
+    The document with the fields it lacks taken from the fetched one, see CodebaseRetrieval.hydrate.
+    """
+    content = document.content if document.content is not None else fetched.content
+    meta = {**fetched.meta, **document.meta}
+    # a method of the symbol table is fetched as the document of its class, so only its own lines of the class source
+    # are kept, and not the summary and the signature of the class
+    if document.meta.get("kind") == "method":
+        raw_data, class_start_line = fetched.meta.get("raw_data"), fetched.meta.get("start_line")
+        if isinstance(raw_data, str) and class_start_line is not None:
+            meta["raw_data"] = "\n".join(
+                raw_data.splitlines()[
+                    document.meta["start_line"] - class_start_line : document.meta["end_line"] - class_start_line + 1
+                ]
+            )
+        else:
+            meta.pop("raw_data", None)
+        meta.pop("signature", None)
+        content = document.content
+    return Document(id=document.id, content=content, meta=meta, score=document.score, embedding=document.embedding)
+
+
+def lookup_symbols(query: str, symbol_table: SymbolTable, top_k: int) -> Optional[dict]:
+    """
+    Answer the identifier queries from the symbol table, in the same shape as construct_retrieval_results.
+    It returns None for the other queries and the unknown identifiers, which are left to the vector search.
+    """
+    if (name := parse_identifier_query(query)) is None or not (matches := symbol_table.search(name)):
+        return None
+
+    results = {
+        "code_file_retrieval": {"documents": []},
+        "code_function_retrieval": {"documents": []},
+        "code_class_retrieval": {"documents": []},
+    }
+    for match in matches:
+        documents = results[f"{match.symbol.collection}_retrieval"]["documents"]
+        if len(documents) < top_k:
+            documents.append(
+                Document(
+                    id=match.symbol.document_id,
+                    meta={
+                        "path": match.symbol.path,
+                        "name": match.symbol.name,
+                        "kind": match.symbol.kind,
+                        "start_line": match.symbol.start_line,
+                        "end_line": match.symbol.end_line,
+                        "retrieval": "symbol",
+                    },
+                    score=match.score,
+                )
+            )
+    return results
+
+
 class CodebaseRetrieval(BasicPipeline):
     def __init__(
         self,
         embedder_provider: EmbedderProvider,
         document_store_provider: DocumentStoreProvider,
+        # to answer the identifier queries without embedding them, see lookup_symbols
+        symbol_table: Optional[SymbolTable] = None,
+        # to add the imports and importers of the retrieved files, see _expand_dependencies
+        dependency_graph: Optional[DependencyGraph] = None,
+        expand_hops: int = 0,
+        # the results of the repeated queries, invalidated by the index version
+        cache: Optional[RetrievalCache] = None,
+        # to search only the collections the query asks for, see LevelRouter
+        level_router: Optional[LevelRouter] = None,
+        top_k: int = 3,
         **kwargs,
     ):
+        self._symbol_table = symbol_table
+        self._dependency_graph = dependency_graph
+        self._expand_hops = expand_hops
+        self._cache = cache
+        self._level_router = level_router
+        self._top_k = top_k
+        self._context_assembler = ContextAssembler()
         self._components = {
             "embedder": embedder_provider.get_text_embedder(),
+            "sparse_encoder": document_store_provider.get_sparse_encoder(),
             "code_file_retriever": document_store_provider.get_retriever(
                 document_store_provider.get_store(dataset_name="code_file"),
-                top_k=3,
+                top_k=top_k,
             ),
             "code_function_retriever": document_store_provider.get_retriever(
                 document_store_provider.get_store(dataset_name="code_function"),
-                top_k=3,
+                top_k=top_k,
             ),
             "code_class_retriever": document_store_provider.get_retriever(
                 document_store_provider.get_store(dataset_name="code_class"),
-                top_k=3,
+                top_k=top_k,
             ),
         }
 
@@ -77,12 +381,329 @@ class CodebaseRetrieval(BasicPipeline):
             AsyncDriver({}, sys.modules[__name__], result_builder=base.DictResult())
         )
 
+    def update_codebase(
+        self, symbol_table: Optional[SymbolTable] = None, dependency_graph: Optional[DependencyGraph] = None
+    ) -> None:
+        """
+        Use the symbol table and the dependency graph of a re-indexed codebase, for the pipeline kept by a service.
+        """
+        self._symbol_table = symbol_table
+        self._dependency_graph = dependency_graph
+
+    async def _lookup(
+        self, query: str, expand_hops: int, filters: Optional[dict], params: dict
+    ) -> Tuple[Optional[str], Optional[dict], Optional[dict]]:
+        """
+        The results of the query without searching the collections, from the symbol table or the cache,
+        as the source of the results, the results, and the embedding of the query if the semantic cache computed it.
+        """
+        # the symbol table does not support the filters
+        if (
+            self._symbol_table is not None
+            and filters is None
+            and (results := lookup_symbols(query, self._symbol_table, top_k=self._top_k))
+        ):
+            results["dependency_expansion"] = _expand_dependencies(
+                list(results.values()), self._dependency_graph, expand_hops
+            )
+            return "symbol", results, None
+
+        if self._cache is not None and (results := self._cache.get(query, **params)) is not None:
+            return "cache", results, None
+
+        # the semantic cache needs the embedding before the searches, which is then reused for them
+        if self._cache is not None and self._cache.semantic_threshold is not None:
+            embedding = await self._components["embedder"].run(query)
+            if (results := self._cache.get_similar(embedding.get("embedding"), **params)) is not None:
+                return "cache", results, embedding
+            return None, None, embedding
+
+        return None, None, None
+
     @observe(name="Codebase Retrieval")
-    async def run(self, query: str):
-        return await self._pipe.execute(
-            ["construct_retrieval_results"],
-            inputs={
-                "query": query,
-                **self._components,
-            },
+    async def run(
+        self,
+        query: str,
+        expand_hops: Optional[int] = None,
+        filters: Optional[dict] = None,
+        max_tokens: Optional[int] = None,
+        payload_fields: Optional[List[str]] = None,
+    ):
+        """
+        With max_tokens, the results are also assembled into one prompt context of at most that many tokens,
+        under "assemble_context", see ContextAssembler.
+        With payload_fields, e.g. ["path", "name"], the documents only hold the id, the score and those fields,
+        and the other fields are fetched for the documents actually used, see hydrate.
+        """
+        expand_hops = self._expand_hops if expand_hops is None else expand_hops
+        params = {
+            "top_k": self._top_k,
+            "filters": filters,
+            "expand_hops": expand_hops,
+            "payload_fields": payload_fields,
+        }
+        source, results, embedding = await self._lookup(query, expand_hops, filters, params)
+        if source is not None:
+            results = {"construct_retrieval_results": results}
+        else:
+            results = await self._pipe.execute(
+                ["construct_retrieval_results", "embedding", "level_route"],
+                inputs={
+                    "query": query,
+                    "filters": filters,
+                    "payload_fields": payload_fields,
+                    "dependency_graph": self._dependency_graph,
+                    "expand_hops": expand_hops,
+                    "level_router": self._level_router,
+                    **self._components,
+                },
+                overrides={"embedding": embedding} if embedding is not None else {},
+            )
+            embedding, route = results.pop("embedding"), results.pop("level_route")
+            if route is not None:
+                self._level_router.observe(
+                    route,
+                    embedding.get("embedding"),
+                    {
+                        collection: results["construct_retrieval_results"][f"{collection}_retrieval"]
+                        for collection in COLLECTIONS
+                    },
+                )
+            if self._cache is not None:
+                self._cache.put(
+                    query,
+                    results["construct_retrieval_results"],
+                    embedding=embedding.get("embedding") if self._cache.semantic_threshold is not None else None,
+                    **params,
+                )
+
+        if max_tokens is not None:
+            results["assemble_context"] = self._context_assembler.run(
+                await self._hydrate_context(results["construct_retrieval_results"]), max_tokens=max_tokens
+            )
+        return results
+
+    async def _hydrate_context(self, retrieval_results: dict) -> dict:
+        """
+        The results with the source fetched for the documents without content, i.e. from the symbol table
+        or retrieved with payload_fields, which the context could otherwise only refer to by their location.
+        The results are copied, as they may be cached.
+        """
+        names = [
+            name
+            for name, result in retrieval_results.items()
+            if name in _COLLECTIONS
+            and any(document.content is None and "raw_data" not in document.meta for document in result["documents"])
+        ]
+        hydrated = await asyncio.gather(
+            *[
+                self.hydrate(name, retrieval_results[name]["documents"], payload_fields=_CONTEXT_FIELDS)
+                for name in names
+            ]
         )
+        return {
+            **retrieval_results,
+            **{name: {**retrieval_results[name], "documents": documents} for name, documents in zip(names, hydrated)},
+        }
+
+    async def hydrate(
+        self, name: str, documents: List[Document], payload_fields: Optional[List[str]] = None
+    ) -> List[Document]:
+        """
+        Fetch the fields missing from the documents of the results under the name, e.g. "code_function_retrieval",
+        for the documents retrieved with payload_fields or from the symbol table, only the given fields if any.
+        The ids, the scores and the fields the documents already hold are kept.
+        """
+        retriever = self._components[f"{_COLLECTIONS[name]}_retriever"]
+        fetched = {
+            document.id: document
+            for document in await retriever.fetch_documents(
+                list(dict.fromkeys(document.id for document in documents)), payload_fields=payload_fields
+            )
+        }
+        return [
+            _merge_fetched(document, fetched[document.id]) if document.id in fetched else document
+            for document in documents
+        ]
+
+    @observe(name="Codebase Streaming Retrieval")
+    async def stream(
+        self,
+        query: str,
+        expand_hops: Optional[int] = None,
+        filters: Optional[dict] = None,
+        per_document: bool = False,
+        payload_fields: Optional[List[str]] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Retrieve the results of the query like run, but yield the results of every collection as soon as its search
+        is done, so the first results come after the fastest search rather than the slowest one.
+
+        It yields {"event": "results", "name": ..., "documents": [...]} for every collection in the order
+        the searches finish, then for the dependency expansion, or {"event": "document", "name": ..., "document": ...}
+        for every document with per_document. The last event is {"event": "summary", ...} with the source
+        of the results, i.e. "symbol", "cache" or "search", the number of documents by name, the seconds until
+        the first results and in total, and all the results in the shape of run.
+        """
+        start = time.perf_counter()
+        first_result: Optional[float] = None
+        expand_hops = self._expand_hops if expand_hops is None else expand_hops
+        params = {
+            "top_k": self._top_k,
+            "filters": filters,
+            "expand_hops": expand_hops,
+            "payload_fields": payload_fields,
+        }
+
+        def _events(name: str, result: dict) -> List[dict]:
+            nonlocal first_result
+            if first_result is None and result["documents"]:
+                first_result = time.perf_counter() - start
+            if per_document:
+                return [{"event": "document", "name": name, "document": document} for document in result["documents"]]
+            return [{"event": "results", "name": name, "documents": result["documents"]}]
+
+        source, results, embedding = await self._lookup(query, expand_hops, filters, params)
+        if source is not None:
+            for name, result in results.items():
+                for event in _events(name, result):
+                    yield event
+        else:
+            source, results = "search", {}
+            if embedding is None:
+                embedding = await self._components["embedder"].run(query)
+            sparse = sparse_embedding(query, self._components["sparse_encoder"])
+            route = level_route(query, embedding, self._level_router)
+            searches = {
+                asyncio.create_task(
+                    self._components[f"{collection}_retriever"].run(
+                        query_embedding=embedding.get("embedding"),
+                        query_sparse_embedding=sparse,
+                        filters=filters,
+                        top_k=_routed_top_k(route, collection),
+                        payload_fields=payload_fields,
+                    )
+                ): f"{collection}_retrieval"
+                for collection in COLLECTIONS
+                if not _skipped(route, collection)
+            }
+            try:
+                pending = set(searches)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        results[searches[task]] = task.result()
+                        for event in _events(searches[task], results[searches[task]]):
+                            yield event
+            finally:
+                # the consumer stopped early or a search failed
+                for task in searches:
+                    task.cancel()
+
+            # in the order of run, whatever order the searches finished in, and empty for the skipped collections
+            results = {
+                f"{collection}_retrieval": results.get(f"{collection}_retrieval", {"documents": []})
+                for collection in COLLECTIONS
+            }
+            if route is not None:
+                self._level_router.observe(
+                    route,
+                    embedding.get("embedding"),
+                    {collection: results[f"{collection}_retrieval"] for collection in COLLECTIONS},
+                )
+            results["dependency_expansion"] = _expand_dependencies(
+                list(results.values()), self._dependency_graph, expand_hops
+            )
+            for event in _events("dependency_expansion", results["dependency_expansion"]):
+                yield event
+            if self._cache is not None:
+                self._cache.put(
+                    query,
+                    results,
+                    embedding=embedding.get("embedding") if self._cache.semantic_threshold is not None else None,
+                    **params,
+                )
+
+        yield {
+            "event": "summary",
+            "source": source,
+            "counts": {name: len(result["documents"]) for name, result in results.items()},
+            "first_result": first_result,
+            "elapsed": time.perf_counter() - start,
+            "results": results,
+        }
+
+    @observe(name="Codebase Batch Retrieval")
+    async def run_batch(
+        self,
+        queries: List[str],
+        expand_hops: Optional[int] = None,
+        filters: Optional[dict] = None,
+        batch_size: int = 128,
+        max_concurrency: int = 2,
+        payload_fields: Optional[List[str]] = None,
+    ) -> List[dict]:
+        """
+        Retrieve the results of many queries at once, in the order of the queries and in the shape of run.
+        The queries are embedded and searched batch_size at a time, with at most max_concurrency batches in flight.
+        The semantic mode of the cache is not used, since it would need the embeddings first,
+        and every collection is searched, since the searches of a batch are one request per collection anyway.
+        """
+        expand_hops = self._expand_hops if expand_hops is None else expand_hops
+        params = {
+            "top_k": self._top_k,
+            "filters": filters,
+            "expand_hops": expand_hops,
+            "payload_fields": payload_fields,
+        }
+
+        results: List[Optional[dict]] = [None] * len(queries)
+        pending = []
+        for i, query in enumerate(queries):
+            if (
+                self._symbol_table is not None
+                and filters is None
+                and (result := lookup_symbols(query, self._symbol_table, top_k=self._top_k))
+            ):
+                result["dependency_expansion"] = _expand_dependencies(
+                    list(result.values()), self._dependency_graph, expand_hops
+                )
+                results[i] = result
+            elif self._cache is not None and (result := self._cache.get(query, **params)) is not None:
+                results[i] = result
+            else:
+                pending.append(i)
+
+        # the same query is only retrieved once
+        pending_queries = list(dict.fromkeys(queries[i] for i in pending))
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _run(batch: List[str]) -> List[dict]:
+            async with semaphore:
+                return (
+                    await self._pipe.execute(
+                        ["construct_batch_retrieval_results"],
+                        inputs={
+                            "queries": batch,
+                            "filters": filters,
+                            "payload_fields": payload_fields,
+                            "dependency_graph": self._dependency_graph,
+                            "expand_hops": expand_hops,
+                            **self._components,
+                        },
+                    )
+                )["construct_batch_retrieval_results"]
+
+        batches = [pending_queries[i : i + batch_size] for i in range(0, len(pending_queries), batch_size)]
+        retrieved = {
+            query: result
+            for batch, batch_results in zip(batches, await asyncio.gather(*[_run(batch) for batch in batches]))
+            for query, result in zip(batch, batch_results)
+        }
+        for query, result in retrieved.items():
+            if self._cache is not None:
+                self._cache.put(query, result, **params)
+        for i in pending:
+            results[i] = retrieved[queries[i]]
+
+        return [{"construct_retrieval_results": result} for result in results]
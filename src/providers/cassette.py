@@ -0,0 +1,300 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Literal, Optional
+
+import numpy as np
+import orjson
+from haystack import Document, component
+
+from src.core.provider import EmbedderProvider, LLMProvider
+from src.providers.llm.router import ModelRouter
+
+logger = logging.getLogger("wren-ai-service")
+
+
+class CassetteMissError(KeyError):
+    pass
+
+
+class Cassette:
+    """
+    A cassette stores the responses of LLM and embedding calls by the hash of their requests in a JSON Lines file,
+    so indexing and retrieval can be replayed offline and deterministically.
+
+    mode:
+        record: always call the provider and store the responses
+        replay: only serve the stored responses, calling the provider on misses unless strict
+        auto: serve the stored responses and record the misses
+    """
+    def __init__(
+        self,
+        path: str | Path,
+        mode: Literal["record", "replay", "auto"] = "auto",
+        strict: bool = False,
+        # the synthetic latency of a replayed response is latency + latency_scale * the recorded latency
+        latency: float = 0.0,
+        latency_scale: float = 0.0,
+    ) -> None:
+        self._path = Path(path)
+        self._mode = mode
+        self._strict = strict
+        self._latency = latency
+        self._latency_scale = latency_scale
+        self._entries: Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+        if self._path.exists() and mode != "record":
+            with open(self._path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        entry = orjson.loads(line)
+                        self._entries[entry["key"]] = entry
+            logger.info(f"Loaded {len(self._entries)} responses from cassette {self._path}")
+        elif mode == "record":
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._path.write_bytes(b"")
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        return hashlib.sha256(
+            orjson.dumps(parts, option=orjson.OPT_SORT_KEYS, default=str)
+        ).hexdigest()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key) if self._mode != "record" else None
+        if entry is None:
+            self.misses += 1
+            if self._mode == "replay" and self._strict:
+                raise CassetteMissError(f"Cassette {self._path} has no response for request {key}")
+            return None
+
+        self.hits += 1
+        delay = self._latency + self._latency_scale * entry.get("latency", 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return entry["value"]
+
+    def put(self, key: str, value: Any, latency: float) -> None:
+        if self._mode == "replay":
+            return
+
+        entry = {"key": key, "value": value, "latency": latency}
+        self._entries[key] = entry
+        with open(self._path, "ab") as f:
+            f.write(orjson.dumps(entry) + b"\n")
+
+
+def get_cassette() -> Optional[Cassette]:
+    if not (path := os.getenv("CASSETTE_PATH")):
+        return None
+
+    return Cassette(
+        path=path,
+        mode=os.getenv("CASSETTE_MODE") or "auto",
+        strict=os.getenv("CASSETTE_STRICT", "false").lower() == "true",
+        latency=float(os.getenv("CASSETTE_LATENCY") or 0.0),
+        latency_scale=float(os.getenv("CASSETTE_LATENCY_SCALE") or 0.0),
+    )
+
+
+def _encode_embedding(embedding: List[float]) -> str:
+    # float32 in base64 is about a third of the size of the JSON floats
+    return base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode()
+
+
+def _decode_embedding(embedding: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(embedding), dtype=np.float32).tolist()
+
+
+@component
+class CassetteGenerator:
+    def __init__(self, generator: Any, cassette: Cassette) -> None:
+        self._generator = generator
+        self._cassette = cassette
+
+    async def __call__(self, *args, **kwargs):
+        return await self.run(*args, **kwargs)
+
+    @component.output_types(replies=List[str], meta=List[Dict[str, Any]])
+    async def run(
+        self,
+        prompt: str,
+        generation_kwargs: Optional[Dict[str, Any]] = None,
+        query_id: Optional[str] = None,
+        complexity: Optional[int] = None,
+    ):
+        # a router sends the prompt to the generator of one of its routes, so the request is keyed on that one
+        generator = (
+            self._generator.route(prompt, complexity).generator
+            if isinstance(self._generator, ModelRouter)
+            else self._generator
+        )
+        key = Cassette.key(
+            "generator",
+            getattr(generator, "model", None),
+            getattr(generator, "system_prompt", None),
+            {**getattr(generator, "generation_kwargs", {}), **(generation_kwargs or {})},
+            prompt,
+        )
+        if (result := await self._cassette.get(key)) is not None:
+            return result
+
+        start = time.perf_counter()
+        result = await self._generator(
+            prompt=prompt,
+            generation_kwargs=generation_kwargs,
+            query_id=query_id,
+            complexity=complexity,
+        )
+        self._cassette.put(
+            key,
+            orjson.loads(orjson.dumps(result, default=str)),
+            time.perf_counter() - start,
+        )
+        return result
+
+
+@component
+class CassetteTextEmbedder:
+    def __init__(self, embedder: Any, cassette: Cassette) -> None:
+        self._embedder = embedder
+        self._cassette = cassette
+
+    async def __call__(self, *args, **kwargs):
+        return await self.run(*args, **kwargs)
+
+    @component.output_types(embedding=List[float], meta=Dict[str, Any])
+    async def run(self, text: str):
+        key = Cassette.key(
+            "text_embedder",
+            self._embedder.model,
+            self._embedder.dimensions,
+            self._embedder.prefix + text + self._embedder.suffix,
+        )
+        if (result := await self._cassette.get(key)) is not None:
+            return {"embedding": _decode_embedding(result["embedding"]), "meta": result["meta"]}
+
+        start = time.perf_counter()
+        result = await self._embedder.run(text)
+        self._cassette.put(
+            key,
+            {"embedding": _encode_embedding(result["embedding"]), "meta": result["meta"]},
+            time.perf_counter() - start,
+        )
+        return result
+
+    async def run_batch(self, texts: List[str]):
+        keys = [
+            Cassette.key(
+                "text_embedder",
+                self._embedder.model,
+                self._embedder.dimensions,
+                self._embedder.prefix + text + self._embedder.suffix,
+            )
+            for text in texts
+        ]
+
+        embeddings, missing = {}, []
+        for i, key in enumerate(keys):
+            if (result := await self._cassette.get(key)) is not None:
+                embeddings[i] = _decode_embedding(result["embedding"])
+            else:
+                missing.append(i)
+
+        meta: Dict[str, Any] = {}
+        if missing:
+            start = time.perf_counter()
+            result = await self._embedder.run_batch([texts[i] for i in missing])
+            meta = result["meta"]
+            latency = (time.perf_counter() - start) / len(missing)
+            for i, embedding in zip(missing, result["embeddings"]):
+                embeddings[i] = embedding
+                self._cassette.put(keys[i], {"embedding": _encode_embedding(embedding), "meta": meta}, latency)
+
+        return {"embeddings": [embeddings[i] for i in range(len(texts))], "meta": meta}
+
+
+@component
+class CassetteDocumentEmbedder:
+    def __init__(self, embedder: Any, cassette: Cassette) -> None:
+        self._embedder = embedder
+        self._cassette = cassette
+
+    async def __call__(self, *args, **kwargs):
+        return await self.run(*args, **kwargs)
+
+    @component.output_types(documents=List[Document], meta=Dict[str, Any])
+    async def run(self, documents: List[Document]):
+        # the texts are looked up one by one, so a different batching still replays
+        texts_to_embed = self._embedder._prepare_texts_to_embed(documents=documents)
+        keys = [
+            Cassette.key("document_embedder", self._embedder.model, self._embedder.dimensions, text)
+            for text in texts_to_embed
+        ]
+
+        embeddings, missing = {}, []
+        for i, key in enumerate(keys):
+            if (embedding := await self._cassette.get(key)) is not None:
+                embeddings[i] = _decode_embedding(embedding)
+            else:
+                missing.append(i)
+
+        meta: Dict[str, Any] = {}
+        if missing:
+            start = time.perf_counter()
+            missing_embeddings, meta = await self._embedder._embed_batch(
+                texts_to_embed=[texts_to_embed[i] for i in missing],
+                batch_size=self._embedder.batch_size,
+            )
+            latency = (time.perf_counter() - start) / len(missing)
+            for i, embedding in zip(missing, missing_embeddings):
+                embeddings[i] = embedding
+                self._cassette.put(keys[i], _encode_embedding(embedding), latency)
+
+        for i, document in enumerate(documents):
+            document.embedding = embeddings[i]
+
+        return {"documents": documents, "meta": meta}
+
+
+class CassetteLLMProvider(LLMProvider):
+    def __init__(self, provider: LLMProvider, cassette: Cassette) -> None:
+        self._provider = provider
+        self._cassette = cassette
+        self._model = provider.get_model()
+        self._model_kwargs = provider.get_model_kwargs()
+
+    def get_generator(self, *args, **kwargs):
+        return CassetteGenerator(
+            generator=self._provider.get_generator(*args, **kwargs),
+            cassette=self._cassette,
+        )
+
+    def get_route_metrics(self):
+        return self._provider.get_route_metrics()
+
+
+class CassetteEmbedderProvider(EmbedderProvider):
+    def __init__(self, provider: EmbedderProvider, cassette: Cassette) -> None:
+        self._provider = provider
+        self._cassette = cassette
+        self._embedding_model = provider.get_model()
+        self._embedding_model_dim = provider.get_dimensions()
+
+    def get_text_embedder(self, *args, **kwargs):
+        return CassetteTextEmbedder(
+            embedder=self._provider.get_text_embedder(*args, **kwargs),
+            cassette=self._cassette,
+        )
+
+    def get_document_embedder(self, *args, **kwargs):
+        return CassetteDocumentEmbedder(
+            embedder=self._provider.get_document_embedder(*args, **kwargs),
+            cassette=self._cassette,
+        )
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from src.providers.resilience import LatencyTracker
+from src.utils import remove_trailing_slash
+
+logger = logging.getLogger("wren-ai-service")
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """
+    httpx does not expose the usage of its connection pool, so the transport counts the requests in flight instead.
+    The connections are bound to the event loop they were opened in, so there is one connection pool per running loop,
+    e.g. of the successive asyncio.run of the tests and the CLI, and the pools of the closed loops are dropped.
+    """
+    def __init__(self, max_connections: int, **kwargs) -> None:
+        self._kwargs = kwargs
+        self._transports: Dict[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = {}
+        self.max_connections = max_connections
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+        # the time until the response headers, including the wait for a free connection
+        self.latencies = LatencyTracker()
+
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        if (transport := self._transports.get(loop)) is None:
+            self._transports = {
+                other: transport for other, transport in self._transports.items() if not other.is_closed()
+            }
+            transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self._kwargs)
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        transport = self._transport()
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        if self.in_flight > self.max_connections:
+            # the request has to wait for a free connection
+            if not self.saturated:
+                logger.warning(
+                    f"The HTTP connection pool of {request.url.host} is saturated, consider raising OPENAI_MAX_CONNECTIONS"
+                )
+            self.saturated += 1
+        start = time.perf_counter()
+        try:
+            return await transport.handle_async_request(request)
+        finally:
+            self.in_flight -= 1
+            self.latencies.record(time.perf_counter() - start)
+
+    async def aclose(self) -> None:
+        # the connections of the other loops can only be closed in them, they are dropped with their loops
+        if (transport := self._transports.pop(asyncio.get_running_loop(), None)) is not None:
+            await transport.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_connections": self.max_connections,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "saturation": self.in_flight / self.max_connections,
+            "saturated_requests": self.saturated,
+            "latency": {
+                f"p{int(q * 100)}": self.latencies.quantile(q, min_samples=1)
+                for q in (0.5, 0.95, 0.99)
+            },
+        }
+
+
+class OpenAIClientPool:
+    """
+    This pool shares the AsyncOpenAI clients, and the HTTP connection pools underneath them,
+    across all generators and embedders talking to the same OpenAI API-compatible endpoint.
+
+    """
+    def __init__(
+        self,
+        max_connections: int = int(os.getenv("OPENAI_MAX_CONNECTIONS") or 100),
+        max_keepalive_connections: int = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS") or 20),
+        keepalive_expiry: float = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY") or 60.0),
+        # HTTP/2 requires the h2 package, i.e. httpx[http2]
+        http2: bool = (os.getenv("OPENAI_HTTP2") or "false").lower() == "true",
+    ) -> None:
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._http2 = http2
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, MeteredTransport] = {}
+        self._clients: Dict[Tuple[str, str, Optional[str], Optional[float]], AsyncOpenAI] = {}
+
+    def _get_http_client(self, base_url: str) -> httpx.AsyncClient:
+        if base_url not in self._http_clients:
+            transport = MeteredTransport(
+                max_connections=self._limits.max_connections,
+                limits=self._limits,
+                http2=self._http2,
+            )
+            self._transports[base_url] = transport
+            self._http_clients[base_url] = httpx.AsyncClient(
+                transport=transport,
+                follow_redirects=True,
+            )
+            logger.info(
+                f"Created HTTP connection pool for {base_url} with {self._limits}, http2={self._http2}"
+            )
+        return self._http_clients[base_url]
+
+    def get_client(
+        self,
+        api_key: str,
+        base_url: str,
+        organization: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncOpenAI:
+        base_url = remove_trailing_slash(base_url)
+        key = (base_url, api_key, organization, timeout)
+        if key not in self._clients:
+            self._clients[key] = AsyncOpenAI(
+                api_key=api_key,
+                organization=organization,
+                base_url=base_url,
+                timeout=timeout,
+                # retries are handled by ResilientCaller, which also honors the retry budget
+                max_retries=0,
+                http_client=self._get_http_client(base_url),
+            )
+        return self._clients[key]
+
+    async def warmup(self, connections: int = 1) -> None:
+        """
+        Open connections to every endpoint in the pool ahead of the first real request, so TLS handshakes are done early.
+        """
+        async def _warmup(client: AsyncOpenAI):
+            try:
+                await client.models.list()
+            except Exception as e:
+                # the connection is established even if the endpoint does not serve the model list
+                logger.debug(f"Warming up {client.base_url} failed: {e}")
+
+        # clients of the same endpoint share the connections, so one client per endpoint is enough
+        clients = {str(client.base_url): client for client in self._clients.values()}
+        await asyncio.gather(
+            *[
+                _warmup(client)
+                for client in clients.values()
+                for _ in range(connections)
+            ]
+        )
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            base_url: transport.stats()
+            for base_url, transport in self._transports.items()
+        }
+
+    async def close(self) -> None:
+        await asyncio.gather(
+            *[http_client.aclose() for http_client in self._http_clients.values()]
+        )
+        self._http_clients.clear()
+        self._transports.clear()
+        self._clients.clear()
+
+
+_client_pool: Optional[OpenAIClientPool] = None
+
+
+def get_client_pool() -> OpenAIClientPool:
+    global _client_pool
+    if _client_pool is None:
+        _client_pool = OpenAIClientPool()
+    return _client_pool
@@ -0,0 +1,609 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import qdrant_client
+from haystack import Document, component
+from haystack.dataclasses import SparseEmbedding
+from haystack.document_stores.types import DuplicatePolicy
+from haystack.utils import Secret
+from haystack_integrations.components.retrievers.qdrant import QdrantEmbeddingRetriever
+from haystack_integrations.document_stores.qdrant import (
+    QdrantDocumentStore,
+    document_store,
+)
+from haystack_integrations.document_stores.qdrant.converters import (
+    DENSE_VECTORS_NAME,
+    SPARSE_VECTORS_NAME,
+    convert_id,
+    convert_qdrant_point_to_haystack_document,
+)
+from haystack_integrations.document_stores.qdrant.filters import (
+    convert_filters_to_qdrant,
+)
+from qdrant_client.http import models as rest
+from tqdm import tqdm
+
+from src.providers.document_store.vectors import VectorEncoder
+
+logger = logging.getLogger(__name__)
+
+def convert_haystack_documents_to_qdrant_points(
+    documents: List[Document],
+    *,
+    use_sparse_embeddings: bool,
+    vector_encoder: Optional[VectorEncoder] = None,
+) -> List[rest.PointStruct]:
+    points = []
+    for document in documents:
+        payload = document.to_dict(flatten=True)
+        if vector_encoder and payload.get("embedding") is not None:
+            payload["embedding"] = vector_encoder.encode(payload["embedding"])
+        if use_sparse_embeddings:
+            vector = {}
+
+            dense_vector = payload.pop("embedding", None)
+            if dense_vector is not None:
+                vector[DENSE_VECTORS_NAME] = dense_vector
+
+            sparse_vector = payload.pop("sparse_embedding", None)
+            if sparse_vector is not None:
+                sparse_vector_instance = rest.SparseVector(**sparse_vector)
+                vector[SPARSE_VECTORS_NAME] = sparse_vector_instance
+
+        else:
+            vector = payload.pop("embedding") or {}
+        _id = convert_id(payload.get("id"))
+
+        point = rest.PointStruct(
+            payload=payload,
+            vector=vector,
+            id=_id,
+        )
+        points.append(point)
+    return points
+
+
+class AsyncQdrantDocumentStore(QdrantDocumentStore):
+    def __init__(
+        self,
+        location: Optional[str] = None,
+        url: Optional[str] = None,
+        port: int = 6333,
+        grpc_port: int = 6334,
+        prefer_grpc: bool = False,
+        https: Optional[bool] = None,
+        api_key: Optional[Secret] = None,
+        prefix: Optional[str] = None,
+        timeout: Optional[int] = None,
+        host: Optional[str] = None,
+        path: Optional[str] = None,
+        force_disable_check_same_thread: bool = False,
+        index: str = "Document",
+        embedding_dim: int = 768,
+        on_disk: bool = False,
+        use_sparse_embeddings: bool = False,
+        sparse_idf: bool = False,
+        similarity: str = "cosine",
+        return_embedding: bool = False,
+        progress_bar: bool = True,
+        recreate_index: bool = False,
+        shard_number: Optional[int] = None,
+        replication_factor: Optional[int] = None,
+        write_consistency_factor: Optional[int] = None,
+        on_disk_payload: Optional[bool] = None,
+        hnsw_config: Optional[dict] = None,
+        optimizers_config: Optional[dict] = None,
+        wal_config: Optional[dict] = None,
+        quantization_config: Optional[dict] = None,
+        init_from: Optional[dict] = None,
+        wait_result_from_api: bool = True,
+        metadata: Optional[dict] = None,
+        write_batch_size: int = 100,
+        scroll_size: int = 10_000,
+        payload_fields_to_index: Optional[List[dict]] = None,
+        # float32, float16 or uint8, the embeddings longer than embedding_dim are truncated and re-normalized
+        vector_datatype: str = "float32",
+    ):
+        self.vector_encoder = VectorEncoder(embedding_dim, vector_datatype)
+        if vector_datatype == "uint8":
+            similarity = self.vector_encoder.similarity
+
+        super(AsyncQdrantDocumentStore, self).__init__(
+            location=location,
+            url=url,
+            port=port,
+            grpc_port=grpc_port,
+            prefer_grpc=prefer_grpc,
+            https=https,
+            api_key=api_key,
+            prefix=prefix,
+            timeout=timeout,
+            host=host,
+            path=path,
+            force_disable_check_same_thread=force_disable_check_same_thread,
+            index=index,
+            embedding_dim=embedding_dim,
+            on_disk=on_disk,
+            use_sparse_embeddings=use_sparse_embeddings,
+            sparse_idf=sparse_idf,
+            similarity=similarity,
+            return_embedding=return_embedding,
+            progress_bar=progress_bar,
+            recreate_index=recreate_index,
+            shard_number=shard_number,
+            replication_factor=replication_factor,
+            write_consistency_factor=write_consistency_factor,
+            on_disk_payload=on_disk_payload,
+            hnsw_config=hnsw_config,
+            optimizers_config=optimizers_config,
+            wal_config=wal_config,
+            quantization_config=quantization_config,
+            init_from=init_from,
+            wait_result_from_api=wait_result_from_api,
+            metadata=metadata,
+            write_batch_size=write_batch_size,
+            scroll_size=scroll_size,
+            payload_fields_to_index=payload_fields_to_index,
+        )
+
+        self.async_client = qdrant_client.AsyncQdrantClient(
+            location=location,
+            url=url,
+            port=port,
+            grpc_port=grpc_port,
+            prefer_grpc=prefer_grpc,
+            https=https,
+            api_key=api_key.resolve_value() if api_key else None,
+            prefix=prefix,
+            timeout=timeout,
+            host=host,
+            path=path,
+            force_disable_check_same_thread=force_disable_check_same_thread,
+            metadata=metadata or {},
+        )
+        if location == ":memory:":
+            # the in-memory clients are separate databases, so the async one shares the collections of the sync one
+            self.async_client._client.collections = self.client._client.collections
+            self.async_client._client.aliases = self.client._client.aliases
+
+        # to improve the indexing performance
+        # see https://qdrant.tech/documentation/guides/multiple-partitions/?q=mul#calibrate-performance
+        self.client.create_payload_index(
+            collection_name=index, field_name="id", field_schema="keyword"
+        )
+
+    def recreate_collection(
+        self,
+        collection_name: str,
+        distance,
+        embedding_dim: int,
+        on_disk: Optional[bool] = None,
+        use_sparse_embeddings: Optional[bool] = None,
+        sparse_idf: bool = False,
+    ):
+        # same as QdrantDocumentStore.recreate_collection, plus the datatype of the vectors
+        if on_disk is None:
+            on_disk = self.on_disk
+
+        if use_sparse_embeddings is None:
+            use_sparse_embeddings = self.use_sparse_embeddings
+
+        vectors_config = rest.VectorParams(
+            size=embedding_dim,
+            on_disk=on_disk,
+            distance=distance,
+            datatype=rest.Datatype(self.vector_encoder.datatype),
+        )
+
+        sparse_vectors_config = None
+        if use_sparse_embeddings:
+            vectors_config = {DENSE_VECTORS_NAME: vectors_config}
+            sparse_vectors_config = {
+                SPARSE_VECTORS_NAME: rest.SparseVectorParams(
+                    index=rest.SparseIndexParams(
+                        on_disk=on_disk,
+                    ),
+                    modifier=rest.Modifier.IDF if sparse_idf else None,
+                ),
+            }
+
+        if self.client.collection_exists(collection_name):
+            self.client.delete_collection(collection_name)
+
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=vectors_config,
+            sparse_vectors_config=sparse_vectors_config,
+            shard_number=self.shard_number,
+            replication_factor=self.replication_factor,
+            write_consistency_factor=self.write_consistency_factor,
+            on_disk_payload=self.on_disk_payload,
+            hnsw_config=self.hnsw_config,
+            optimizers_config=self.optimizers_config,
+            wal_config=self.wal_config,
+            quantization_config=self.quantization_config,
+            init_from=self.init_from,
+        )
+
+    def _get_search_params(self) -> Optional[rest.SearchParams]:
+        if not self.quantization_config:
+            return None
+
+        return rest.SearchParams(
+            quantization=rest.QuantizationSearchParams(
+                rescore=True,
+                # binary quantization needs more candidates to rescore than scalar quantization
+                oversampling=(
+                    3.0
+                    if isinstance(self.quantization_config, rest.BinaryQuantization)
+                    else 1.5
+                ),
+            ),
+        )
+
+    @staticmethod
+    def _with_payload(payload_fields: Optional[List[str]]) -> bool | List[str]:
+        # the payloads are flattened, so "meta.path" and "path" are the same field, and the id is always needed
+        if payload_fields is None:
+            return True
+        return list(dict.fromkeys(["id", *(field.removeprefix("meta.") for field in payload_fields)]))
+
+    def _hybrid_request(
+        self,
+        query_embedding: List[float],
+        query_sparse_embedding: SparseEmbedding,
+        qdrant_filters: Optional[rest.Filter],
+        top_k: int,
+        return_embedding: bool,
+        prefetch_limit: int,
+        payload_fields: Optional[List[str]] = None,
+    ) -> rest.QueryRequest:
+        return rest.QueryRequest(
+            prefetch=[
+                rest.Prefetch(
+                    query=self.vector_encoder.encode(query_embedding),
+                    using=DENSE_VECTORS_NAME,
+                    filter=qdrant_filters,
+                    params=self._get_search_params(),
+                    limit=prefetch_limit,
+                ),
+                rest.Prefetch(
+                    query=rest.SparseVector(
+                        indices=query_sparse_embedding.indices,
+                        values=query_sparse_embedding.values,
+                    ),
+                    using=SPARSE_VECTORS_NAME,
+                    filter=qdrant_filters,
+                    limit=prefetch_limit,
+                ),
+            ],
+            query=rest.FusionQuery(fusion=rest.Fusion.RRF),
+            limit=top_k,
+            with_payload=self._with_payload(payload_fields),
+            with_vector=return_embedding,
+        )
+
+    async def _query_hybrid_batch(
+        self,
+        query_embeddings: List[List[float]],
+        query_sparse_embeddings: List[SparseEmbedding],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        return_embedding: bool = False,
+        prefetch_limit: Optional[int] = None,
+        payload_fields: Optional[List[str]] = None,
+    ) -> List[List[Document]]:
+        """
+        Search the dense and the sparse vectors, and fuse both rankings with reciprocal rank fusion in Qdrant.
+        The scores are the fused scores, which only rank the documents of one query.
+        """
+        qdrant_filters = convert_filters_to_qdrant(filters)
+        prefetch_limit = prefetch_limit or max(top_k * 5, 50)
+
+        responses = await self.async_client.query_batch_points(
+            collection_name=self.index,
+            requests=[
+                self._hybrid_request(
+                    query_embedding,
+                    query_sparse_embedding,
+                    qdrant_filters,
+                    top_k,
+                    return_embedding,
+                    prefetch_limit,
+                    payload_fields,
+                )
+                for query_embedding, query_sparse_embedding in zip(query_embeddings, query_sparse_embeddings)
+            ],
+        )
+        return [
+            [
+                convert_qdrant_point_to_haystack_document(point, use_sparse_embeddings=True)
+                for point in response.points
+            ]
+            for response in responses
+        ]
+
+    async def _query_hybrid(
+        self,
+        query_embedding: List[float],
+        query_sparse_embedding: SparseEmbedding,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        return_embedding: bool = False,
+        prefetch_limit: Optional[int] = None,
+        payload_fields: Optional[List[str]] = None,
+    ) -> List[Document]:
+        return (
+            await self._query_hybrid_batch(
+                [query_embedding],
+                [query_sparse_embedding],
+                filters=filters,
+                top_k=top_k,
+                return_embedding=return_embedding,
+                prefetch_limit=prefetch_limit,
+                payload_fields=payload_fields,
+            )
+        )[0]
+
+    def _to_documents(self, points: List[rest.ScoredPoint], scale_score: bool) -> List[Document]:
+        results = [
+            convert_qdrant_point_to_haystack_document(
+                point, use_sparse_embeddings=self.use_sparse_embeddings
+            )
+            for point in points
+        ]
+        for document in results:
+            document.score = self.vector_encoder.to_cosine(document.score)
+        if scale_score:
+            for document in results:
+                score = document.score
+                if self.similarity == "cosine" or self.vector_encoder.datatype == "uint8":
+                    score = (score + 1) / 2
+                else:
+                    score = float(1 / (1 + np.exp(-score / 100)))
+                document.score = score
+        return results
+
+    async def _query_by_embeddings(
+        self,
+        query_embeddings: List[List[float]],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        scale_score: bool = True,
+        return_embedding: bool = False,
+        payload_fields: Optional[List[str]] = None,
+    ) -> List[List[Document]]:
+        """
+        Search the top k documents of several queries at once, with one batch search request.
+        """
+        qdrant_filters = convert_filters_to_qdrant(filters)
+
+        responses = await self.async_client.search_batch(
+            collection_name=self.index,
+            requests=[
+                rest.SearchRequest(
+                    vector=rest.NamedVector(
+                        name=DENSE_VECTORS_NAME if self.use_sparse_embeddings else "",
+                        vector=self.vector_encoder.encode(query_embedding),
+                    ),
+                    filter=qdrant_filters,
+                    params=self._get_search_params(),
+                    limit=top_k,
+                    with_payload=self._with_payload(payload_fields),
+                    with_vector=return_embedding,
+                )
+                for query_embedding in query_embeddings
+            ],
+        )
+        return [self._to_documents(points, scale_score) for points in responses]
+
+    async def _query_by_embedding(
+        self,
+        query_embedding: List[float],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        scale_score: bool = True,
+        return_embedding: bool = False,
+        payload_fields: Optional[List[str]] = None,
+    ) -> List[Document]:
+        qdrant_filters = convert_filters_to_qdrant(filters)
+
+        points = await self.async_client.search(
+            collection_name=self.index,
+            query_vector=rest.NamedVector(
+                name=DENSE_VECTORS_NAME if self.use_sparse_embeddings else "",
+                vector=self.vector_encoder.encode(query_embedding),
+            ),
+            search_params=self._get_search_params(),
+            query_filter=qdrant_filters,
+            limit=top_k,
+            with_payload=self._with_payload(payload_fields),
+            with_vectors=return_embedding,
+        )
+        return self._to_documents(points, scale_score)
+
+    async def fetch_documents(self, ids: List[str], payload_fields: Optional[List[str]] = None) -> List[Document]:
+        """
+        The documents of the ids, with the payload fields only if given, in no particular order.
+        """
+        records = await self.async_client.retrieve(
+            collection_name=self.index,
+            ids=[convert_id(id) for id in ids],
+            with_payload=self._with_payload(payload_fields),
+            with_vectors=False,
+        )
+        return [
+            convert_qdrant_point_to_haystack_document(record, use_sparse_embeddings=self.use_sparse_embeddings)
+            for record in records
+        ]
+
+    async def delete_documents(self, filters: Optional[Dict[str, Any]] = None):
+        if not filters:
+            qdrant_filters = rest.Filter()
+        else:
+            qdrant_filters = convert_filters_to_qdrant(filters)
+
+        try:
+            await self.async_client.delete(
+                collection_name=self.index,
+                points_selector=qdrant_filters,
+                wait=self.wait_result_from_api,
+            )
+        except KeyError:
+            logger.warning(
+                "Called QdrantDocumentStore.delete_documents() on a non-existing ID",
+            )
+
+    async def count_documents(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        if not filters:
+            qdrant_filters = rest.Filter()
+        else:
+            qdrant_filters = convert_filters_to_qdrant(filters)
+
+        return (
+            await self.async_client.count(
+                collection_name=self.index, count_filter=qdrant_filters
+            )
+        ).count
+
+    async def write_documents(
+        self, documents: List[Document], policy: DuplicatePolicy = DuplicatePolicy.FAIL
+    ):
+        for doc in documents:
+            if not isinstance(doc, Document):
+                msg = f"DocumentStore.write_documents() expects a list of Documents but got an element of {type(doc)}."
+                raise ValueError(msg)
+
+        self._set_up_collection(
+            self.index,
+            self.embedding_dim,
+            False,
+            self.similarity,
+            self.use_sparse_embeddings,
+            self.sparse_idf,
+            self.on_disk,
+            self.payload_fields_to_index,
+        )
+
+        if len(documents) == 0:
+            logger.warning(
+                "Calling QdrantDocumentStore.write_documents() with empty list"
+            )
+            return
+
+        document_objects = self._handle_duplicate_documents(
+            documents=documents,
+            policy=policy,
+        )
+
+        batched_documents = document_store.get_batches_from_generator(
+            document_objects, self.write_batch_size
+        )
+        with tqdm(
+            total=len(document_objects), disable=not self.progress_bar
+        ) as progress_bar:
+            for document_batch in batched_documents:
+                batch = convert_haystack_documents_to_qdrant_points(
+                    document_batch,
+                    use_sparse_embeddings=self.use_sparse_embeddings,
+                    vector_encoder=self.vector_encoder,
+                )
+
+                await self.async_client.upsert(
+                    collection_name=self.index,
+                    points=batch,
+                    wait=self.wait_result_from_api,
+                )
+
+                progress_bar.update(self.write_batch_size)
+        return len(document_objects)
+
+
+class AsyncQdrantEmbeddingRetriever(QdrantEmbeddingRetriever):
+    def __init__(
+        self,
+        document_store: AsyncQdrantDocumentStore,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        scale_score: bool = True,
+        return_embedding: bool = False,
+        # the payload fields of the results, e.g. ["path", "name"], all of them by default, see fetch_documents
+        payload_fields: Optional[List[str]] = None,
+    ):
+        super(AsyncQdrantEmbeddingRetriever, self).__init__(
+            document_store=document_store,
+            filters=filters,
+            top_k=top_k,
+            scale_score=scale_score,
+            return_embedding=return_embedding,
+        )
+        self._payload_fields = payload_fields
+
+    @component.output_types(documents=List[Document])
+    async def run(
+        self,
+        query_embedding: List[float],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+        scale_score: Optional[bool] = None,
+        return_embedding: Optional[bool] = None,
+        query_sparse_embedding: Optional[SparseEmbedding] = None,
+        payload_fields: Optional[List[str]] = None,
+    ):
+        if query_sparse_embedding is not None and self._document_store.use_sparse_embeddings:
+            docs = await self._document_store._query_hybrid(
+                query_embedding=query_embedding,
+                query_sparse_embedding=query_sparse_embedding,
+                filters=filters or self._filters,
+                top_k=top_k or self._top_k,
+                return_embedding=return_embedding or self._return_embedding,
+                payload_fields=payload_fields or self._payload_fields,
+            )
+            return {"documents": docs}
+
+        docs = await self._document_store._query_by_embedding(
+            query_embedding=query_embedding,
+            filters=filters or self._filters,
+            top_k=top_k or self._top_k,
+            scale_score=scale_score or self._scale_score,
+            return_embedding=return_embedding or self._return_embedding,
+            payload_fields=payload_fields or self._payload_fields,
+        )
+
+        return {"documents": docs}
+
+    async def run_batch(
+        self,
+        query_embeddings: List[List[float]],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+        scale_score: Optional[bool] = None,
+        return_embedding: Optional[bool] = None,
+        query_sparse_embeddings: Optional[List[SparseEmbedding]] = None,
+        payload_fields: Optional[List[str]] = None,
+    ):
+        if query_sparse_embeddings is not None and self._document_store.use_sparse_embeddings:
+            docs = await self._document_store._query_hybrid_batch(
+                query_embeddings=query_embeddings,
+                query_sparse_embeddings=query_sparse_embeddings,
+                filters=filters or self._filters,
+                top_k=top_k or self._top_k,
+                return_embedding=return_embedding or self._return_embedding,
+                payload_fields=payload_fields or self._payload_fields,
+            )
+            return {"documents": docs}
+
+        docs = await self._document_store._query_by_embeddings(
+            query_embeddings=query_embeddings,
+            filters=filters or self._filters,
+            top_k=top_k or self._top_k,
+            scale_score=scale_score or self._scale_score,
+            return_embedding=return_embedding or self._return_embedding,
+            payload_fields=payload_fields or self._payload_fields,
+        )
+
+        return {"documents": docs}
+
+    async def fetch_documents(self, ids: List[str], payload_fields: Optional[List[str]] = None) -> List[Document]:
+        return await self._document_store.fetch_documents(ids, payload_fields=payload_fields)
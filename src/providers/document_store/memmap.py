@@ -0,0 +1,737 @@
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+from haystack import Document, component
+from haystack.dataclasses import SparseEmbedding
+from haystack.document_stores.errors import DuplicateDocumentError
+from haystack.document_stores.types import DuplicatePolicy
+
+from src.components.sparse_encoder import SparseEncoder
+from src.core.provider import DocumentStoreProvider
+from src.providers.document_store.vectors import VectorEncoder
+
+logger = logging.getLogger("wren-ai-service")
+
+COMPARISONS = {
+    "==": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    ">": lambda column, value: _compare(column, value, np.greater),
+    ">=": lambda column, value: _compare(column, value, np.greater_equal),
+    "<": lambda column, value: _compare(column, value, np.less),
+    "<=": lambda column, value: _compare(column, value, np.less_equal),
+    "in": lambda column, value: np.isin(column, np.array(value, dtype=object)),
+    "not in": lambda column, value: ~np.isin(column, np.array(value, dtype=object)),
+}
+
+
+def _compare(column: np.ndarray, value: Any, op) -> np.ndarray:
+    present = np.array([item is not None for item in column], dtype=bool)
+    result = np.zeros(len(column), dtype=bool)
+    result[present] = op(column[present], value)
+    return result
+
+
+class MemmapDocumentStore:
+    """
+    An in-process document store, for single-repo use and tests without a Qdrant service.
+    The vectors are kept in a memory-mapped float32 or float16 .npy file, so opening the store only maps the file,
+    and the payloads are appended row by row to a JSON lines log, next to a small header of the row count and the
+    deleted rows, so a write only appends its rows, and the log is read on first use.
+    The search is an exact matrix-multiply top-k over the rows matching the filters.
+    With use_sparse_embeddings, the sparse vectors are kept in the log too, and searched with an inverted index
+    built on first use, with the same inverse document frequencies as the IDF modifier of Qdrant.
+
+    It has the same async interface as AsyncQdrantDocumentStore, and the same filters on the flattened payload fields.
+
+    """
+    def __init__(
+        self,
+        path: str | Path,
+        index: str = "Document",
+        embedding_dim: int = 768,
+        vector_datatype: str = "float32",
+        recreate_index: bool = False,
+        use_sparse_embeddings: bool = False,
+        # the rows of float16 vectors and of filtered searches are converted to float32 in chunks
+        search_chunk_size: int = 1024,
+    ) -> None:
+        if vector_datatype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector datatype {vector_datatype} for the memmap store, choose float32 or float16")
+
+        self.index = index
+        self.embedding_dim = embedding_dim
+        self.use_sparse_embeddings = use_sparse_embeddings
+        self.vector_encoder = VectorEncoder(embedding_dim, vector_datatype)
+        self._dir = Path(path) / index
+        self._search_chunk_size = search_chunk_size
+
+        if recreate_index and self._dir.exists():
+            shutil.rmtree(self._dir)
+        self._dir.mkdir(parents=True, exist_ok=True)
+
+        # the header names the vectors and the log files of the current generation, a rewrite of either one goes to
+        # a new file of the next generation, which is only used once the header naming it replaced the old one
+        self._header: Optional[Dict[str, Any]] = (
+            orjson.loads(self._header_path.read_bytes()) if self._header_path.exists() else None
+        )
+        self._generation = self._header["generation"] if self._header else 0
+        self._vectors_name = self._header["vectors"] if self._header else "vectors.0.npy"
+        self._log_name = self._header["log"] if self._header else "payloads.0.jsonl"
+        # the files of the older generations, deleted once the header no longer names them
+        self._obsolete_paths: List[Path] = []
+
+        self._vectors: Optional[np.memmap] = None
+        if self._vectors_path.exists():
+            self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+            if self._vectors.shape[1] != embedding_dim or self._vectors.dtype != np.dtype(vector_datatype):
+                raise ValueError(
+                    f"The memmap store {self._dir} has {self._vectors.shape[1]} {self._vectors.dtype} vectors, "
+                    f"but {embedding_dim} {vector_datatype} is configured, recreate the index to change it"
+                )
+
+        # loaded lazily, see _load_payloads
+        self._count = 0
+        self._columns: Optional[Dict[str, List[Any]]] = None
+        self._alive: Optional[np.ndarray] = None
+        self._ids: Dict[str, int] = {}
+        self._column_arrays: Dict[str, np.ndarray] = {}
+        # the [indices, values] of the sparse vector of every row, and the inverted index of them, see _postings
+        self._sparse: List[Optional[List[List[float]]]] = []
+        self._inverted_index: Optional[Dict[int, Tuple[np.ndarray, np.ndarray]]] = None
+        # the rows written since the last save, the bytes and the rows of the log, and whether it has to be rewritten,
+        # e.g. after a compaction renumbers the rows
+        self._written_rows: set[int] = set()
+        self._log_bytes = 0
+        self._log_rows = 0
+        self._log_stale = False
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self._dir / self._vectors_name
+
+    @property
+    def _header_path(self) -> Path:
+        return self._dir / "header.json"
+
+    @property
+    def _log_path(self) -> Path:
+        return self._dir / self._log_name
+
+    def _load_payloads(self) -> None:
+        if self._columns is not None:
+            return
+
+        payloads: List[Optional[Dict[str, Any]]] = []
+        if (header := self._header) is not None:
+            self._header = None
+            self._count = header["count"]
+            self._alive = np.array(header["alive"], dtype=bool)
+            self._sparse = [None] * self._count
+            payloads = [None] * self._count
+            # the bytes past the header are of a write that did not finish
+            with open(self._log_path, "rb") as f:
+                lines = f.read(header["log_bytes"]).splitlines()
+            # the later rows replace the earlier ones, as an upsert replaces the whole payload
+            for line in lines:
+                row, payload, sparse = orjson.loads(line)
+                payloads[row] = payload
+                self._sparse[row] = sparse
+            self._log_bytes = header["log_bytes"]
+            self._log_rows = len(lines)
+        else:
+            self._count = 0
+            self._alive = np.zeros(0, dtype=bool)
+            self._sparse = []
+
+        names = dict.fromkeys(["id", *(name for payload in payloads if payload for name in payload)])
+        self._columns = {
+            name: [payload.get(name) if payload else None for payload in payloads] for name in names
+        }
+        self._ids = {id: row for row, id in enumerate(self._columns["id"]) if self._alive[row]}
+
+    def _log_line(self, row: int) -> bytes:
+        payload = {name: column[row] for name, column in self._columns.items() if column[row] is not None}
+        return orjson.dumps([row, payload, self._sparse[row]]) + b"\n"
+
+    def _save(self) -> None:
+        if self._vectors is not None:
+            self._vectors.flush()
+
+        # rewrite the log once the replaced rows outnumber the live ones, so it stays linear in the store size
+        if self._log_stale or self._log_rows + len(self._written_rows) > 2 * self._count + 1024:
+            self._obsolete_paths.append(self._log_path)
+            self._generation += 1
+            self._log_name = f"payloads.{self._generation}.jsonl"
+            content = b"".join(self._log_line(row) for row in range(self._count))
+            self._log_path.write_bytes(content)
+            self._log_bytes, self._log_rows, self._log_stale = len(content), self._count, False
+        elif self._written_rows:
+            content = b"".join(self._log_line(row) for row in sorted(self._written_rows))
+            with open(self._log_path, "ab") as f:
+                # the log may hold the bytes of a write that did not finish, past the header
+                f.truncate(self._log_bytes)
+                f.write(content)
+            self._log_bytes += len(content)
+            self._log_rows += len(self._written_rows)
+        self._written_rows = set()
+
+        # the header is the commit point, the rows appended to the log are only read once it counts their bytes,
+        # and the files of a new generation once it names them
+        tmp_path = self._header_path.with_suffix(".tmp")
+        tmp_path.write_bytes(
+            orjson.dumps(
+                {
+                    "generation": self._generation,
+                    "vectors": self._vectors_name,
+                    "log": self._log_name,
+                    "count": self._count,
+                    "alive": self._alive.tolist(),
+                    "log_bytes": self._log_bytes,
+                }
+            )
+        )
+        os.replace(tmp_path, self._header_path)
+        for path in self._obsolete_paths:
+            path.unlink(missing_ok=True)
+        self._obsolete_paths = []
+        self._column_arrays = {}
+        self._inverted_index = None
+
+    def _reserve(self, rows: int) -> None:
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if self._count + rows <= capacity:
+            return
+
+        new_capacity = max(1024, capacity * 2, self._count + rows)
+        tmp_path = self._dir / "vectors.tmp.npy"
+        vectors = np.lib.format.open_memmap(
+            tmp_path,
+            mode="w+",
+            dtype=np.dtype(self.vector_encoder.datatype),
+            shape=(new_capacity, self.embedding_dim),
+        )
+        if self._count:
+            vectors[: self._count] = self._vectors[: self._count]
+        vectors.flush()
+        del vectors
+        self._vectors = None
+        os.replace(tmp_path, self._vectors_path)
+        self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+
+    def _compact(self) -> None:
+        rows = np.flatnonzero(self._alive[: self._count])
+        if len(rows) == self._count:
+            return
+
+        # the compacted vectors are written to a new file, as the rows of the current one are still committed
+        self._generation += 1
+        vectors_path = self._dir / f"vectors.{self._generation}.npy"
+        vectors = np.lib.format.open_memmap(
+            vectors_path,
+            mode="w+",
+            dtype=self._vectors.dtype,
+            shape=(max(1024, len(rows)), self.embedding_dim),
+        )
+        vectors[: len(rows)] = self._vectors[rows]
+        vectors.flush()
+        del vectors
+        self._obsolete_paths.append(self._vectors_path)
+        self._vectors_name = vectors_path.name
+        self._vectors = np.load(vectors_path, mmap_mode="r+")
+        self._columns = {
+            name: [column[row] for row in rows] for name, column in self._columns.items()
+        }
+        self._sparse = [self._sparse[row] for row in rows]
+        self._count = len(rows)
+        self._alive = np.ones(self._count, dtype=bool)
+        self._ids = {id: row for row, id in enumerate(self._columns["id"])}
+        # the rows of the log are renumbered
+        self._log_stale = True
+
+    def _column(self, name: str) -> np.ndarray:
+        if name not in self._column_arrays:
+            column = self._columns.get(name) or [None] * self._count
+            array = np.empty(self._count, dtype=object)
+            array[:] = column
+            self._column_arrays[name] = array
+        return self._column_arrays[name]
+
+    def _mask(self, filters: Optional[Dict[str, Any]]) -> np.ndarray:
+        if not filters:
+            return np.ones(self._count, dtype=bool)
+
+        if "conditions" in filters:
+            masks = [self._mask(condition) for condition in filters["conditions"]]
+            operator = filters["operator"]
+            if operator == "AND":
+                return np.logical_and.reduce(masks) if masks else np.ones(self._count, dtype=bool)
+            if operator == "OR":
+                return np.logical_or.reduce(masks) if masks else np.zeros(self._count, dtype=bool)
+            if operator == "NOT":
+                return ~np.logical_and.reduce(masks)
+            raise ValueError(f"Unsupported logical operator {operator}")
+
+        # the payloads are flattened, so "meta.path" and "path" are the same field
+        field = filters["field"].removeprefix("meta.")
+        if filters["operator"] not in COMPARISONS:
+            raise ValueError(f"Unsupported comparison operator {filters['operator']}")
+        return np.asarray(COMPARISONS[filters["operator"]](self._column(field), filters["value"]), dtype=bool)
+
+    def _to_document(
+        self,
+        row: int,
+        score: Optional[float] = None,
+        return_embedding: bool = False,
+        payload_fields: Optional[List[str]] = None,
+    ) -> Document:
+        if payload_fields is None:
+            columns = self._columns
+        else:
+            # the payloads are flattened, so "meta.path" and "path" are the same field, and the id is always needed
+            names = dict.fromkeys(["id", *(field.removeprefix("meta.") for field in payload_fields)])
+            columns = {name: self._columns[name] for name in names if name in self._columns}
+        payload = {
+            name: column[row]
+            for name, column in columns.items()
+            if column[row] is not None
+        }
+        if return_embedding:
+            payload["embedding"] = self._vectors[row].astype(np.float32).tolist()
+        if score is not None:
+            payload["score"] = score
+        return Document.from_dict(payload)
+
+    async def write_documents(
+        self, documents: List[Document], policy: DuplicatePolicy = DuplicatePolicy.FAIL
+    ):
+        for doc in documents:
+            if not isinstance(doc, Document):
+                msg = f"DocumentStore.write_documents() expects a list of Documents but got an element of {type(doc)}."
+                raise ValueError(msg)
+
+        if len(documents) == 0:
+            logger.warning("Calling MemmapDocumentStore.write_documents() with empty list")
+            return
+
+        self._load_payloads()
+        documents = list({document.id: document for document in documents}.values())
+        if policy == DuplicatePolicy.FAIL:
+            if duplicates := [document.id for document in documents if document.id in self._ids]:
+                raise DuplicateDocumentError(f"IDs {duplicates} already exist in the document store.")
+        elif policy == DuplicatePolicy.SKIP:
+            documents = [document for document in documents if document.id not in self._ids]
+
+        new_documents = [document for document in documents if document.id not in self._ids]
+        self._reserve(len(new_documents))
+        for document in new_documents:
+            self._ids[document.id] = self._count
+            self._count += 1
+        self._alive = np.concatenate([self._alive, np.ones(len(new_documents), dtype=bool)])
+        for column in self._columns.values():
+            column.extend([None] * len(new_documents))
+        self._sparse.extend([None] * len(new_documents))
+
+        rows = np.array([self._ids[document.id] for document in documents], dtype=np.int64)
+        embeddings = [document.embedding for document in documents]
+        if all(embedding is not None for embedding in embeddings):
+            self._vectors[rows] = self.vector_encoder.encode_array(np.array(embeddings))
+        else:
+            for row, embedding in zip(rows, embeddings):
+                self._vectors[row] = self.vector_encoder.encode_array(np.array(embedding)) if embedding is not None else 0
+
+        for row, document in zip(rows, documents):
+            # the same fields as document.to_dict(flatten=True) without the embeddings, which it would deep copy
+            payload = {"id": document.id, "content": document.content, **document.meta}
+            # store the values as they are read back from the file, e.g. paths as strings, as Qdrant does
+            payload = orjson.loads(orjson.dumps(payload, default=str))
+            for name, value in payload.items():
+                if name not in self._columns:
+                    self._columns[name] = [None] * self._count
+                self._columns[name][row] = value
+            # the fields missing from the new payload are cleared, as an upsert in Qdrant replaces the whole payload
+            for name, column in self._columns.items():
+                if name not in payload:
+                    column[row] = None
+            self._sparse[row] = (
+                [document.sparse_embedding.indices, document.sparse_embedding.values]
+                if self.use_sparse_embeddings and document.sparse_embedding is not None
+                else None
+            )
+        self._written_rows.update(rows.tolist())
+
+        self._save()
+        return len(documents)
+
+    async def delete_documents(self, filters: Optional[Dict[str, Any]] = None):
+        self._load_payloads()
+        mask = self._mask(filters) & self._alive[: self._count]
+        if not mask.any():
+            return
+
+        for row in np.flatnonzero(mask):
+            self._ids.pop(self._columns["id"][row], None)
+        self._alive[mask] = False
+        # reclaim the deleted rows once they are a quarter of the store
+        if (~self._alive).sum() > self._count // 4:
+            self._compact()
+        self._save()
+
+    async def count_documents(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        self._load_payloads()
+        return int((self._mask(filters) & self._alive[: self._count]).sum())
+
+    def filter_documents(self, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        self._load_payloads()
+        return [
+            self._to_document(row)
+            for row in np.flatnonzero(self._mask(filters) & self._alive[: self._count])
+        ]
+
+    async def fetch_documents(self, ids: List[str], payload_fields: Optional[List[str]] = None) -> List[Document]:
+        """
+        The documents of the ids, with the payload fields only if given, in no particular order.
+        """
+        self._load_payloads()
+        return [self._to_document(self._ids[id], payload_fields=payload_fields) for id in ids if id in self._ids]
+
+    def _dense_scores(self, queries: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+        contiguous = rows[-1] - rows[0] + 1 == len(rows)
+        if contiguous and self._vectors.dtype == np.float32:
+            # without filters and deletions the rows are a slice of the memmap, which is multiplied without a copy
+            scores[:] = (self._vectors[rows[0] : rows[-1] + 1] @ queries.T).T
+        else:
+            # float16 has no BLAS support, so the vectors are converted in chunks small enough to stay in the CPU cache
+            for start in range(0, len(rows), self._search_chunk_size):
+                chunk = rows[start : start + self._search_chunk_size]
+                vectors = (
+                    self._vectors[chunk[0] : chunk[-1] + 1]
+                    if contiguous
+                    else self._vectors[chunk]
+                )
+                scores[:, start : start + len(chunk)] = (vectors.astype(np.float32) @ queries.T).T
+        return scores
+
+    async def _query_by_embeddings(
+        self,
+        query_embeddings: List[List[float]],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        scale_score: bool = True,
+        return_embedding: bool = False,
+        payload_fields: Optional[List[str]] = None,
+    ) -> List[List[Document]]:
+        """
+        Search the top k documents of several queries at once, with one matrix multiplication.
+        """
+        self._load_payloads()
+        queries = self.vector_encoder.encode_array(np.array(query_embeddings)).astype(np.float32)
+        rows = np.flatnonzero(self._mask(filters) & self._alive[: self._count])
+        if not len(rows) or not len(queries):
+            return [[] for _ in queries]
+
+        scores = self._dense_scores(queries, rows)
+
+        k = min(top_k, len(rows))
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, candidates, axis=1)
+        candidates = rows[candidates]
+        order = np.argsort(-scores, axis=1)
+
+        results = []
+        for query_scores, query_rows in zip(
+            np.take_along_axis(scores, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+        ):
+            results.append(
+                [
+                    self._to_document(
+                        row,
+                        score=float((score + 1) / 2) if scale_score else float(score),
+                        return_embedding=return_embedding,
+                        payload_fields=payload_fields,
+                    )
+                    for score, row in zip(query_scores, query_rows)
+                ]
+            )
+        return results
+
+    async def _query_by_embedding(
+        self,
+        query_embedding: List[float],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        scale_score: bool = True,
+        return_embedding: bool = False,
+        payload_fields: Optional[List[str]] = None,
+    ) -> List[Document]:
+        return (
+            await self._query_by_embeddings(
+                [query_embedding],
+                filters=filters,
+                top_k=top_k,
+                scale_score=scale_score,
+                return_embedding=return_embedding,
+                payload_fields=payload_fields,
+            )
+        )[0]
+
+    def _postings(self) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """
+        The rows and the values of every index of the sparse vectors.
+        """
+        if self._inverted_index is None:
+            postings: Dict[int, Tuple[List[int], List[float]]] = {}
+            for row, sparse in enumerate(self._sparse):
+                if sparse is None:
+                    continue
+                for index, value in zip(*sparse):
+                    rows, values = postings.setdefault(index, ([], []))
+                    rows.append(row)
+                    values.append(value)
+            self._inverted_index = {
+                index: (np.array(rows, dtype=np.int64), np.array(values, dtype=np.float32))
+                for index, (rows, values) in postings.items()
+            }
+        return self._inverted_index
+
+    def _sparse_scores(self, query_sparse_embedding: SparseEmbedding, rows: np.ndarray) -> np.ndarray:
+        postings = self._postings()
+        alive = self._alive[: self._count]
+        total = int(alive.sum())
+        scores = np.zeros(self._count, dtype=np.float32)
+        for index, query_value in zip(query_sparse_embedding.indices, query_sparse_embedding.values):
+            if index not in postings:
+                continue
+            posting_rows, values = postings[index]
+            # the same inverse document frequency as the IDF modifier of Qdrant
+            df = int(alive[posting_rows].sum())
+            idf = np.log(1 + (total - df + 0.5) / (df + 0.5))
+            scores[posting_rows] += idf * query_value * values
+        return scores[rows]
+
+    async def _query_hybrid_batch(
+        self,
+        query_embeddings: List[List[float]],
+        query_sparse_embeddings: List[SparseEmbedding],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        return_embedding: bool = False,
+        prefetch_limit: Optional[int] = None,
+        rrf_k: int = 60,
+        payload_fields: Optional[List[str]] = None,
+    ) -> List[List[Document]]:
+        """
+        Rank the documents by the dense and the sparse vectors, and fuse the top prefetch_limit of both rankings
+        with reciprocal rank fusion, as the hybrid queries of Qdrant.
+        """
+        self._load_payloads()
+        rows = np.flatnonzero(self._mask(filters) & self._alive[: self._count])
+        if not len(rows) or not len(query_embeddings):
+            return [[] for _ in query_embeddings]
+
+        prefetch_limit = min(prefetch_limit or max(top_k * 5, 50), len(rows))
+        queries = self.vector_encoder.encode_array(np.array(query_embeddings)).astype(np.float32)
+        results = []
+        for dense_scores, query_sparse_embedding in zip(self._dense_scores(queries, rows), query_sparse_embeddings):
+            fused: Dict[int, float] = {}
+            sparse_scores = self._sparse_scores(query_sparse_embedding, rows)
+            for scores in (dense_scores, sparse_scores):
+                candidates = np.argpartition(-scores, prefetch_limit - 1)[:prefetch_limit]
+                if scores is sparse_scores:
+                    # the documents without a matching word are not in the sparse ranking
+                    candidates = candidates[scores[candidates] > 0]
+                for rank, candidate in enumerate(candidates[np.argsort(-scores[candidates], kind="stable")]):
+                    fused[rows[candidate]] = fused.get(rows[candidate], 0.0) + 1 / (rrf_k + rank + 1)
+
+            ranking = sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+            results.append(
+                [
+                    self._to_document(
+                        row, score=score, return_embedding=return_embedding, payload_fields=payload_fields
+                    )
+                    for row, score in ranking
+                ]
+            )
+        return results
+
+    async def _query_hybrid(
+        self,
+        query_embedding: List[float],
+        query_sparse_embedding: SparseEmbedding,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        return_embedding: bool = False,
+        prefetch_limit: Optional[int] = None,
+        rrf_k: int = 60,
+        payload_fields: Optional[List[str]] = None,
+    ) -> List[Document]:
+        return (
+            await self._query_hybrid_batch(
+                [query_embedding],
+                [query_sparse_embedding],
+                filters=filters,
+                top_k=top_k,
+                return_embedding=return_embedding,
+                prefetch_limit=prefetch_limit,
+                rrf_k=rrf_k,
+                payload_fields=payload_fields,
+            )
+        )[0]
+
+
+@component
+class MemmapEmbeddingRetriever:
+    def __init__(
+        self,
+        document_store: MemmapDocumentStore,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        scale_score: bool = True,
+        return_embedding: bool = False,
+        payload_fields: Optional[List[str]] = None,
+    ):
+        self._document_store = document_store
+        self._filters = filters
+        self._top_k = top_k
+        self._scale_score = scale_score
+        self._return_embedding = return_embedding
+        self._payload_fields = payload_fields
+
+    @component.output_types(documents=List[Document])
+    async def run(
+        self,
+        query_embedding: List[float],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+        scale_score: Optional[bool] = None,
+        return_embedding: Optional[bool] = None,
+        query_sparse_embedding: Optional[SparseEmbedding] = None,
+        payload_fields: Optional[List[str]] = None,
+    ):
+        if query_sparse_embedding is not None and self._document_store.use_sparse_embeddings:
+            docs = await self._document_store._query_hybrid(
+                query_embedding=query_embedding,
+                query_sparse_embedding=query_sparse_embedding,
+                filters=filters or self._filters,
+                top_k=top_k or self._top_k,
+                return_embedding=return_embedding or self._return_embedding,
+                payload_fields=payload_fields or self._payload_fields,
+            )
+            return {"documents": docs}
+
+        docs = await self._document_store._query_by_embedding(
+            query_embedding=query_embedding,
+            filters=filters or self._filters,
+            top_k=top_k or self._top_k,
+            scale_score=scale_score or self._scale_score,
+            return_embedding=return_embedding or self._return_embedding,
+            payload_fields=payload_fields or self._payload_fields,
+        )
+
+        return {"documents": docs}
+
+    async def run_batch(
+        self,
+        query_embeddings: List[List[float]],
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: Optional[int] = None,
+        scale_score: Optional[bool] = None,
+        return_embedding: Optional[bool] = None,
+        query_sparse_embeddings: Optional[List[SparseEmbedding]] = None,
+        payload_fields: Optional[List[str]] = None,
+    ):
+        if query_sparse_embeddings is not None and self._document_store.use_sparse_embeddings:
+            docs = await self._document_store._query_hybrid_batch(
+                query_embeddings=query_embeddings,
+                query_sparse_embeddings=query_sparse_embeddings,
+                filters=filters or self._filters,
+                top_k=top_k or self._top_k,
+                return_embedding=return_embedding or self._return_embedding,
+                payload_fields=payload_fields or self._payload_fields,
+            )
+            return {"documents": docs}
+
+        docs = await self._document_store._query_by_embeddings(
+            query_embeddings=query_embeddings,
+            filters=filters or self._filters,
+            top_k=top_k or self._top_k,
+            scale_score=scale_score or self._scale_score,
+            return_embedding=return_embedding or self._return_embedding,
+            payload_fields=payload_fields or self._payload_fields,
+        )
+
+        return {"documents": docs}
+
+    async def fetch_documents(self, ids: List[str], payload_fields: Optional[List[str]] = None) -> List[Document]:
+        return await self._document_store.fetch_documents(ids, payload_fields=payload_fields)
+
+
+class MemmapProvider(DocumentStoreProvider):
+    def __init__(
+        self,
+        path: str = os.getenv("MEMMAP_STORE_PATH") or ".codebase_index/vectors",
+        embedding_model_dim: int = (
+            int(os.getenv("EMBEDDING_MODEL_DIMENSION"))
+            if os.getenv("EMBEDDING_MODEL_DIMENSION")
+            else 3072
+        ),
+        vector_dimension: Optional[int] = (
+            int(os.getenv("EMBEDDING_STORAGE_DIMENSION"))
+            if os.getenv("EMBEDDING_STORAGE_DIMENSION")
+            else None
+        ),
+        # float32 or float16
+        vector_datatype: str = os.getenv("EMBEDDING_STORAGE_DATATYPE") or "float32",
+        recreate_index: bool = (
+            bool(os.getenv("SHOULD_FORCE_DEPLOY"))
+            if os.getenv("SHOULD_FORCE_DEPLOY")
+            else False
+        ),
+        # store sparse vectors along with the dense ones for hybrid search, the existing stores have to be recreated
+        hybrid_search: bool = os.getenv("HYBRID_SEARCH", "false").lower() == "true",
+        **_,
+    ):
+        self._path = path
+        self._hybrid_search = hybrid_search
+        self._vector_dimension = min(vector_dimension or embedding_model_dim, embedding_model_dim)
+        self._vector_datatype = vector_datatype
+        self._recreate_index = recreate_index
+        # the pipelines share one store per dataset, so the writes of the indexing are seen by the retrieval
+        self._stores: Dict[str, MemmapDocumentStore] = {}
+
+        logger.info(f"Using memmap document store at {self._path}")
+
+    def get_store(
+        self,
+        dataset_name: Optional[str] = None,
+        recreate_index: bool = False,
+    ):
+        index = dataset_name or "Document"
+        if index not in self._stores or recreate_index:
+            self._stores[index] = MemmapDocumentStore(
+                path=self._path,
+                index=index,
+                embedding_dim=self._vector_dimension,
+                vector_datatype=self._vector_datatype,
+                recreate_index=recreate_index or self._recreate_index,
+                use_sparse_embeddings=self._hybrid_search,
+            )
+        return self._stores[index]
+
+    def get_retriever(
+        self,
+        document_store: MemmapDocumentStore,
+        top_k: int = 10,
+    ):
+        return MemmapEmbeddingRetriever(
+            document_store=document_store,
+            top_k=top_k,
+        )
+
+    def get_sparse_encoder(self):
+        return SparseEncoder() if self._hybrid_search else None
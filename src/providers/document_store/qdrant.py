@@ -1,15 +1,13 @@
 import logging
 import os
-from typing import Optional
+from typing import Dict, Optional
 
-from dotenv import load_dotenv
 from haystack.utils import Secret
 from qdrant_client.http import models as rest
 
+from src.components.sparse_encoder import SparseEncoder
 from src.core.provider import DocumentStoreProvider
-from src.providers.document_store import AsyncQdrantDocumentStore, AsyncQdrantEmbeddingRetriever
-
-load_dotenv()
+from src.providers.document_store.async_qdrant import AsyncQdrantDocumentStore, AsyncQdrantEmbeddingRetriever
 
 logger = logging.getLogger(__name__)
 
@@ -27,20 +25,38 @@ class QdrantProvider(DocumentStoreProvider):
             if os.getenv("EMBEDDING_MODEL_DIMENSION")
             else 3072
         ),
+        # store the embeddings truncated to a lower dimension, e.g. 256 or 1024 for text-embedding-3-large
+        vector_dimension: Optional[int] = (
+            int(os.getenv("EMBEDDING_STORAGE_DIMENSION"))
+            if os.getenv("EMBEDDING_STORAGE_DIMENSION")
+            else None
+        ),
+        # float32, float16 or uint8
+        vector_datatype: str = os.getenv("EMBEDDING_STORAGE_DATATYPE") or "float32",
         recreate_index: bool = (
             bool(os.getenv("SHOULD_FORCE_DEPLOY"))
             if os.getenv("SHOULD_FORCE_DEPLOY")
             else False
         ),
+        # store sparse vectors along with the dense ones for hybrid search, the existing collections have to be recreated
+        hybrid_search: bool = os.getenv("HYBRID_SEARCH", "false").lower() == "true",
         **_,
     ):
         self._location = location
         self._api_key = Secret.from_token(api_key) if api_key else None
         self._timeout = timeout
         self._embedding_model_dim = embedding_model_dim
-        self._reset_document_store(recreate_index)
+        self._vector_dimension = min(vector_dimension or embedding_model_dim, embedding_model_dim)
+        self._vector_datatype = vector_datatype
+        self._hybrid_search = hybrid_search
+        # the pipelines share one store per dataset, with its clients, e.g. for the in-memory location
+        self._stores: Dict[str, AsyncQdrantDocumentStore] = {}
+        # the collections are provisioned on the first use, so constructing the provider does not connect to Qdrant
+        self._recreate_index = recreate_index
+        self._provisioned = False
 
     def _reset_document_store(self, recreate_index: bool):
+        self._provisioned = True
         self.get_store(recreate_index=recreate_index)
         self.get_store(dataset_name="table_descriptions", recreate_index=recreate_index)
         self.get_store(dataset_name="view_questions", recreate_index=recreate_index)
@@ -50,27 +66,31 @@ class QdrantProvider(DocumentStoreProvider):
         dataset_name: Optional[str] = None,
         recreate_index: bool = False,
     ):
+        if not self._provisioned:
+            self._reset_document_store(self._recreate_index)
+
+        index = dataset_name or "Document"
+        if index in self._stores and not recreate_index:
+            return self._stores[index]
+
         logger.info(
-            f"Using Qdrant Document Store with Embedding Model Dimension: {self._embedding_model_dim}"
+            f"Using Qdrant Document Store with Embedding Model Dimension: {self._embedding_model_dim}, "
+            f"stored as {self._vector_dimension} {self._vector_datatype}, hybrid search: {self._hybrid_search}"
         )
 
-        return AsyncQdrantDocumentStore(
+        self._stores[index] = AsyncQdrantDocumentStore(
             location=self._location,
             api_key=self._api_key,
-            embedding_dim=self._embedding_model_dim,
-            index=dataset_name or "Document",
+            embedding_dim=self._vector_dimension,
+            vector_datatype=self._vector_datatype,
+            index=index,
             recreate_index=recreate_index,
             on_disk=True,
+            use_sparse_embeddings=self._hybrid_search,
+            # the sparse vectors only hold the term frequencies, Qdrant applies the inverse document frequencies
+            sparse_idf=self._hybrid_search,
             timeout=self._timeout,
-            quantization_config=(
-                rest.BinaryQuantization(
-                    binary=rest.BinaryQuantizationConfig(
-                        always_ram=True,
-                    )
-                )
-                if self._embedding_model_dim >= 1024
-                else None
-            ),
+            quantization_config=self._get_quantization_config(),
             # to improve the indexing performance, we disable building global index for the whole collection
             # see https://qdrant.tech/documentation/guides/multiple-partitions/?q=mul#calibrate-performance
             hnsw_config=rest.HnswConfigDiff(
@@ -78,6 +98,29 @@ class QdrantProvider(DocumentStoreProvider):
                 m=0,
             ),
         )
+        return self._stores[index]
+
+    def _get_quantization_config(self):
+        # uint8 vectors are already as small as scalar quantization
+        if self._vector_datatype == "uint8":
+            return None
+        # reference: https://qdrant.tech/articles/binary-quantization/#when-should-you-not-use-bq
+        if self._vector_dimension >= 1024:
+            return rest.BinaryQuantization(
+                binary=rest.BinaryQuantizationConfig(
+                    always_ram=True,
+                )
+            )
+        # keep int8 vectors in RAM and rescore with the float16 ones on disk
+        if self._vector_datatype == "float16":
+            return rest.ScalarQuantization(
+                scalar=rest.ScalarQuantizationConfig(
+                    type=rest.ScalarType.INT8,
+                    quantile=0.99,
+                    always_ram=True,
+                )
+            )
+        return None
 
     def get_retriever(
         self,
@@ -88,3 +131,6 @@ class QdrantProvider(DocumentStoreProvider):
             document_store=document_store,
             top_k=top_k,
         )
+
+    def get_sparse_encoder(self):
+        return SparseEncoder() if self._hybrid_search else None
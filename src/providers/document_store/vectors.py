@@ -0,0 +1,75 @@
+import math
+from typing import List, Optional
+
+import numpy as np
+
+VECTOR_DATATYPES = ("float32", "float16", "uint8")
+
+
+class VectorEncoder:
+    """
+    It converts the embeddings to the stored vectors, by truncating them to a lower dimension and re-normalizing,
+    which works for the Matryoshka embeddings such as text-embedding-3, and then by lowering their precision.
+
+    float32 and float16 vectors are compared by cosine similarity. uint8 vectors can not be negative,
+    so the components are mapped linearly to 0-255 and compared by euclidean distance, which the offset does not change,
+    and which ranks normalized vectors in the same order as cosine similarity.
+
+    """
+    def __init__(
+        self,
+        dimension: int,
+        datatype: str = "float32",
+        # the components of a normalized vector are about N(0, 1/dimension), so 4 standard deviations cover nearly all of them
+        uint8_range: Optional[float] = None,
+    ) -> None:
+        if datatype not in VECTOR_DATATYPES:
+            raise ValueError(f"Unsupported vector datatype {datatype}, choose one of {', '.join(VECTOR_DATATYPES)}")
+
+        self.dimension = dimension
+        self.datatype = datatype
+        self._uint8_scale = 127.5 / (uint8_range or 4 / math.sqrt(dimension))
+
+    @property
+    def similarity(self) -> str:
+        return "l2" if self.datatype == "uint8" else "cosine"
+
+    def truncate(self, embeddings: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)[..., : self.dimension]
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    def encode_array(self, embeddings: np.ndarray) -> np.ndarray:
+        vectors = self.truncate(embeddings)
+        if self.datatype == "float16":
+            return vectors.astype(np.float16)
+        if self.datatype == "uint8":
+            return np.clip(np.rint(vectors * self._uint8_scale + 127.5), 0, 255).astype(np.uint8)
+        return vectors
+
+    def encode(self, embedding: List[float]) -> List[float]:
+        return self.encode_array(np.asarray(embedding)).tolist()
+
+    def to_cosine(self, score: float) -> float:
+        """
+        Convert the score of Qdrant to cosine similarity, which is the score itself except for uint8 vectors.
+        """
+        if self.datatype != "uint8":
+            return score
+        # |a - b|^2 = 2 - 2 * cos(a, b) for normalized vectors
+        return 1 - (score / self._uint8_scale) ** 2 / 2
+
+    def similarities(self, queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        """
+        The cosine similarities between the encoded queries and vectors, as the store would rank them.
+        """
+        queries = self.encode_array(queries).astype(np.float32)
+        vectors = vectors.astype(np.float32)
+        if self.datatype == "uint8":
+            distances = (
+                (queries**2).sum(axis=-1)[:, None]
+                - 2 * queries @ vectors.T
+                + (vectors**2).sum(axis=-1)[None, :]
+            )
+            return self.to_cosine(np.sqrt(np.maximum(distances, 0)))
+        return queries @ vectors.T
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Set, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+
+class LRUCache(Generic[K, T]):
+    """
+    A least recently used cache whose entries also expire after ttl seconds, if it is set.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: OrderedDict[K, Tuple[float, T]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> Optional[T]:
+        entry = self._entries.get(key)
+        if entry is None or (self._ttl is not None and time.monotonic() - entry[0] > self._ttl):
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: K, value: T) -> None:
+        if self._maxsize <= 0:
+            return
+
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+
+class MicroBatcher(Generic[K, T]):
+    """
+    It collects the concurrent submissions for up to window seconds, or until max_batch_size distinct items,
+    and processes them with a single call of process_batch, which returns one result per item in the same order.
+    Identical items submitted in the same window share the result.
+
+    """
+    def __init__(
+        self,
+        process_batch: Callable[[List[K]], Awaitable[List[T]]],
+        window: float = 0.005,
+        max_batch_size: int = 64,
+    ) -> None:
+        self._process_batch = process_batch
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._pending: Dict[K, asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: K) -> T:
+        future = self._pending.get(item)
+        if future is None:
+            future = self._pending[item] = asyncio.get_running_loop().create_future()
+            if len(self._pending) >= self._max_batch_size:
+                self._flush()
+            elif self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later())
+
+        # shield the future, so a cancelled caller does not cancel the others waiting for the same item
+        return await asyncio.shield(future)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self._window)
+        self._flush_task = None
+        self._flush()
+
+    def _flush(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._run(batch))
+        # keep a reference to the task until it is done, otherwise it may be garbage collected
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[K, asyncio.Future]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self._process_batch(list(batch))
+            for future, result in zip(batch.values(), results):
+                future.set_result(result)
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from haystack import Document, component
+
+from src.core.provider import EmbedderProvider
+from src.utils import tokenize_code
+
+logger = logging.getLogger("wren-ai-service")
+
+LOCAL_EMBEDDING_MODEL = "local-hashing"
+LOCAL_EMBEDDING_MODEL_DIMENSION = 1024
+
+
+class HashingEncoder:
+    """
+    It embeds the text on CPU without a model, by hashing its features into a fixed number of dimensions with random signs:
+    the code-aware words, see tokenize_code, the word bigrams and the character n-grams of the words,
+    which match the parts of identifiers that are spelled differently, e.g. "parse" and "parser".
+    The counts are dampened with log1p and the vectors are L2 normalized, so cosine similarity works as for OpenAI embeddings.
+
+    """
+    def __init__(
+        self,
+        dimension: int = LOCAL_EMBEDDING_MODEL_DIMENSION,
+        ngram_range: tuple[int, int] = (3, 5),
+        bigrams: bool = True,
+        cache_size: int = 100_000,
+    ) -> None:
+        self.dimension = dimension
+        self._ngram_range = ngram_range
+        self._bigrams = bigrams
+        self._cache: Dict[str, np.ndarray] = {}
+        self._cache_size = cache_size
+
+    def _word_hashes(self, word: str) -> np.ndarray:
+        """
+        The hashes of the word followed by the hashes of its character n-grams, cached since the words repeat a lot in code.
+        """
+        if (hashes := self._cache.get(word)) is None:
+            padded = f"<{word}>"
+            low, high = self._ngram_range
+            features = [word] + [
+                f"#{padded[i : i + n]}"
+                for n in range(low, min(high, len(padded)) + 1)
+                for i in range(len(padded) - n + 1)
+            ]
+            hashes = np.array([zlib.crc32(feature.encode()) for feature in features], dtype=np.int64)
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            self._cache[word] = hashes
+        return hashes
+
+    def _hashes(self, text: str) -> np.ndarray:
+        words = tokenize_code(text)
+        if not words:
+            return np.zeros(0, dtype=np.int64)
+
+        word_hashes = {word: self._word_hashes(word) for word in words}
+        unigrams = np.array([word_hashes[word][0] for word in words], dtype=np.int64)
+        hashes = [unigrams]
+        if self._bigrams:
+            # combine the hashes of the neighboring words instead of hashing the bigram strings
+            hashes.append((unigrams[:-1] * 0x9E3779B1 + unigrams[1:]) & 0xFFFFFFFF)
+        hashes.extend(word_hashes[word][1:] for word in word_hashes)
+        return np.concatenate(hashes)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            text_hashes = self._hashes(text)
+            rows.append(np.full(len(text_hashes), row, dtype=np.int64))
+            hashes.append(text_hashes)
+
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if rows:
+            rows, hashes = np.concatenate(rows), np.concatenate(hashes)
+            # the lowest bit is the sign, to keep the collisions unbiased
+            signs = np.where(hashes & 1, 1.0, -1.0)
+            embeddings = np.bincount(
+                rows * self.dimension + (hashes >> 1) % self.dimension,
+                weights=signs,
+                minlength=len(texts) * self.dimension,
+            ).reshape(len(texts), self.dimension).astype(np.float32)
+
+        embeddings = np.sign(embeddings) * np.log1p(np.abs(embeddings))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms > 0, norms, 1.0)
+
+
+class _LocalEmbedder:
+    def __init__(
+        self,
+        encoder: HashingEncoder,
+        executor: Optional[ThreadPoolExecutor] = None,
+        batch_size: int = 256,
+    ) -> None:
+        self._encoder = encoder
+        self._executor = executor
+        self.batch_size = batch_size
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        # the batches are encoded in the thread pool to keep the event loop responsive
+        loop = asyncio.get_running_loop()
+        batches = await asyncio.gather(
+            *[
+                loop.run_in_executor(self._executor, self._encoder.encode, texts[i : i + self.batch_size])
+                for i in range(0, len(texts), self.batch_size)
+            ]
+        )
+        return [embedding for batch in batches for embedding in batch.tolist()]
+
+    def _meta(self, texts: List[str]) -> Dict[str, Any]:
+        return {"model": LOCAL_EMBEDDING_MODEL, "usage": {"prompt_tokens": 0, "total_tokens": 0}, "texts": len(texts)}
+
+
+@component
+class LocalTextEmbedder(_LocalEmbedder):
+    async def __call__(self, *args, **kwargs):
+        return await self.run(*args, **kwargs)
+
+    @component.output_types(embedding=List[float], meta=Dict[str, Any])
+    async def run(self, text: str):
+        if not isinstance(text, str):
+            raise TypeError(
+                "LocalTextEmbedder expects a string as an input."
+                "In case you want to embed a list of Documents, please use the LocalDocumentEmbedder."
+            )
+
+        # a single query is cheaper to encode inline than to hand over to the thread pool
+        embedding = self._encoder.encode([text])[0].tolist()
+        return {"embedding": embedding, "meta": self._meta([text])}
+
+    async def run_batch(self, texts: List[str]):
+        return {"embeddings": await self._embed(texts), "meta": self._meta(texts)}
+
+
+@component
+class LocalDocumentEmbedder(_LocalEmbedder):
+    def __init__(
+        self,
+        encoder: HashingEncoder,
+        executor: Optional[ThreadPoolExecutor] = None,
+        batch_size: int = 256,
+        meta_fields_to_embed: Optional[List[str]] = None,
+        embedding_separator: str = "\n",
+    ) -> None:
+        super(LocalDocumentEmbedder, self).__init__(encoder, executor, batch_size)
+        self._meta_fields_to_embed = meta_fields_to_embed or []
+        self._embedding_separator = embedding_separator
+
+    async def __call__(self, *args, **kwargs):
+        return await self.run(*args, **kwargs)
+
+    @component.output_types(documents=List[Document], meta=Dict[str, Any])
+    async def run(self, documents: List[Document]):
+        if (
+            not isinstance(documents, list)
+            or documents
+            and not isinstance(documents[0], Document)
+        ):
+            raise TypeError(
+                "LocalDocumentEmbedder expects a list of Documents as input."
+                "In case you want to embed a string, please use the LocalTextEmbedder."
+            )
+
+        texts_to_embed = [
+            self._embedding_separator.join(
+                [
+                    str(document.meta[key])
+                    for key in self._meta_fields_to_embed
+                    if document.meta.get(key) is not None
+                ]
+                + [document.content or ""]
+            )
+            for document in documents
+        ]
+        embeddings = await self._embed(texts_to_embed)
+        for document, embedding in zip(documents, embeddings):
+            document.embedding = embedding
+
+        return {"documents": documents, "meta": self._meta(texts_to_embed)}
+
+
+class LocalEmbedderProvider(EmbedderProvider):
+    """
+    It embeds on CPU without network access, for air-gapped deployments and for indexing without the embedding costs.
+    The dimension has to match EMBEDDING_MODEL_DIMENSION of the document store.
+
+    """
+    def __init__(
+        self,
+        dimension: int = (
+            int(os.getenv("EMBEDDING_MODEL_DIMENSION"))
+            if os.getenv("EMBEDDING_MODEL_DIMENSION")
+            else 0
+        )
+        or LOCAL_EMBEDDING_MODEL_DIMENSION,
+        max_workers: Optional[int] = (
+            int(os.getenv("LOCAL_EMBEDDER_MAX_WORKERS"))
+            if os.getenv("LOCAL_EMBEDDER_MAX_WORKERS")
+            else None
+        ),
+        batch_size: int = int(os.getenv("LOCAL_EMBEDDER_BATCH_SIZE") or 256),
+        **_,
+    ):
+        self._embedding_model = LOCAL_EMBEDDING_MODEL
+        self._embedding_model_dim = dimension
+        self._encoder = HashingEncoder(dimension=dimension)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="local-embedder")
+        self._batch_size = batch_size
+
+        logger.info(f"Using local embedder with dimension: {self._embedding_model_dim}")
+
+    def get_text_embedder(self):
+        return LocalTextEmbedder(
+            encoder=self._encoder,
+            executor=self._executor,
+            batch_size=self._batch_size,
+        )
+
+    def get_document_embedder(self):
+        return LocalDocumentEmbedder(
+            encoder=self._encoder,
+            executor=self._executor,
+            batch_size=self._batch_size,
+        )
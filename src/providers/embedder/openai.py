@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from typing import Any, Dict, List, Optional, Tuple
@@ -9,6 +10,9 @@ from openai import AsyncOpenAI
 from tqdm import tqdm
 
 from src.core.provider import EmbedderProvider
+from src.providers.client_pool import OpenAIClientPool, get_client_pool
+from src.providers.embedder.batching import LRUCache, MicroBatcher
+from src.providers.resilience import ResilientCaller, RetryPolicy
 from src.utils import remove_trailing_slash
 
 logger = logging.getLogger("wren-ai-service")
@@ -30,6 +34,14 @@ class AsyncTextEmbedder(OpenAITextEmbedder):
         prefix: str = "",
         suffix: str = "",
         timeout: Optional[float] = None,
+        client: Optional[AsyncOpenAI] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        # the query embeddings are cached by text, 0 disables the cache
+        cache_size: int = 0,
+        cache_ttl: Optional[float] = None,
+        # the concurrent queries within the window are embedded in one request, 0 disables the batching
+        batch_window: float = 0.0,
+        max_batch_size: int = 64,
     ):
         super(AsyncTextEmbedder, self).__init__(
             api_key,
@@ -41,11 +53,18 @@ class AsyncTextEmbedder(OpenAITextEmbedder):
             suffix,
             timeout,
         )
-        self.client = AsyncOpenAI(
+        self.client = client or AsyncOpenAI(
             api_key=api_key.resolve_value(),
             organization=organization,
             base_url=api_base_url,
         )
+        self._caller = ResilientCaller(retry_policy, name=f"Embedder {model}")
+        self._cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self._batcher = (
+            MicroBatcher(self._embed_texts, window=batch_window, max_batch_size=max_batch_size)
+            if batch_window > 0
+            else None
+        )
 
     async def __call__(self, *args, **kwargs):
         return await self.run(*args, **kwargs)
@@ -64,18 +83,68 @@ class AsyncTextEmbedder(OpenAITextEmbedder):
         # replace newlines, which can negatively affect performance.
         text_to_embed = text_to_embed.replace("\n", " ")
 
+        if (cached := self._cache.get(text_to_embed)) is not None:
+            embedding, meta = cached
+            return {"embedding": embedding, "meta": {**meta, "cached": True}}
+
+        if self._batcher:
+            embedding, meta = await self._batcher.submit(text_to_embed)
+        else:
+            embedding, meta = (await self._embed_texts([text_to_embed]))[0]
+        self._cache.put(text_to_embed, (embedding, meta))
+
+        return {"embedding": embedding, "meta": meta}
+
+    async def run_batch(self, texts: List[str], batch_size: int = 256, max_concurrency: int = 4):
+        """
+        Embed many queries at once, in requests of batch_size texts with at most max_concurrency requests in flight.
+        The embeddings are in the order of the texts, and the cached ones are not requested again.
+        """
+        texts_to_embed = [(self.prefix + text + self.suffix).replace("\n", " ") for text in texts]
+
+        embeddings: Dict[str, List[float]] = {}
+        for text in dict.fromkeys(texts_to_embed):
+            if (cached := self._cache.get(text)) is not None:
+                embeddings[text] = cached[0]
+        missing = [text for text in dict.fromkeys(texts_to_embed) if text not in embeddings]
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _embed(batch: List[str]) -> List[Tuple[List[float], Dict[str, Any]]]:
+            async with semaphore:
+                return await self._embed_texts(batch)
+
+        batches = [missing[i : i + batch_size] for i in range(0, len(missing), batch_size)]
+        usage = {"prompt_tokens": 0, "total_tokens": 0}
+        for batch, results in zip(batches, await asyncio.gather(*[_embed(batch) for batch in batches])):
+            for text, (embedding, meta) in zip(batch, results):
+                embeddings[text] = embedding
+                self._cache.put(text, (embedding, meta))
+            usage = {key: usage[key] + results[0][1]["usage"].get(key, 0) for key in usage}
+
+        return {
+            "embeddings": [embeddings[text] for text in texts_to_embed],
+            "meta": {"model": self.model, "usage": usage, "requests": len(batches)},
+        }
+
+    async def _embed_texts(self, texts: List[str]) -> List[Tuple[List[float], Dict[str, Any]]]:
         if self.dimensions is not None:
-            response = await self.client.embeddings.create(
-                model=self.model, dimensions=self.dimensions, input=text_to_embed
+            response = await self._caller.call(
+                lambda: self.client.embeddings.create(
+                    model=self.model, dimensions=self.dimensions, input=texts
+                )
             )
         else:
-            response = await self.client.embeddings.create(
-                model=self.model, input=text_to_embed
+            response = await self._caller.call(
+                lambda: self.client.embeddings.create(
+                    model=self.model, input=texts
+                )
             )
 
-        meta = {"model": response.model, "usage": dict(response.usage)}
+        # the usage is of the whole batch
+        meta = {"model": response.model, "usage": dict(response.usage), "batch_size": len(texts)}
 
-        return {"embedding": response.data[0].embedding, "meta": meta}
+        return [(data.embedding, meta) for data in sorted(response.data, key=lambda data: data.index)]
 
 
 @component
@@ -94,6 +163,8 @@ class AsyncDocumentEmbedder(OpenAIDocumentEmbedder):
         meta_fields_to_embed: Optional[List[str]] = None,
         embedding_separator: str = "\n",
         timeout: Optional[float] = None,
+        client: Optional[AsyncOpenAI] = None,
+        retry_policy: Optional[RetryPolicy] = None,
     ):
         super(AsyncDocumentEmbedder, self).__init__(
             api_key,
@@ -109,11 +180,12 @@ class AsyncDocumentEmbedder(OpenAIDocumentEmbedder):
             embedding_separator,
             timeout,
         )
-        self.client = AsyncOpenAI(
+        self.client = client or AsyncOpenAI(
             api_key=api_key.resolve_value(),
             organization=organization,
             base_url=api_base_url,
         )
+        self._caller = ResilientCaller(retry_policy, name=f"Embedder {model}")
 
     async def _embed_batch(
         self, texts_to_embed: List[str], batch_size: int
@@ -127,12 +199,16 @@ class AsyncDocumentEmbedder(OpenAIDocumentEmbedder):
         ):
             batch = texts_to_embed[i : i + batch_size]
             if self.dimensions is not None:
-                response = await self.client.embeddings.create(
-                    model=self.model, dimensions=self.dimensions, input=batch
+                response = await self._caller.call(
+                    lambda: self.client.embeddings.create(
+                        model=self.model, dimensions=self.dimensions, input=batch
+                    )
                 )
             else:
-                response = await self.client.embeddings.create(
-                    model=self.model, input=batch
+                response = await self._caller.call(
+                    lambda: self.client.embeddings.create(
+                        model=self.model, input=batch
+                    )
                 )
             embeddings = [el.embedding for el in response.data]
             all_embeddings.extend(embeddings)
@@ -192,6 +268,16 @@ class OpenAIEmbedderProvider(EmbedderProvider):
             if os.getenv("EMBEDDER_TIMEOUT")
             else 120.0
         ),
+        client_pool: Optional[OpenAIClientPool] = None,
+        retry_policy: RetryPolicy = RetryPolicy(
+            max_retries=int(os.getenv("EMBEDDER_MAX_RETRIES") or 3),
+            deadline=float(os.getenv("EMBEDDER_DEADLINE")) if os.getenv("EMBEDDER_DEADLINE") else None,
+            hedging=(os.getenv("EMBEDDER_HEDGING") or "false").lower() == "true",
+        ),
+        query_cache_size: int = int(os.getenv("EMBEDDER_QUERY_CACHE_SIZE") or 1024),
+        query_cache_ttl: float = float(os.getenv("EMBEDDER_QUERY_CACHE_TTL") or 3600.0),
+        # in seconds
+        query_batch_window: float = float(os.getenv("EMBEDDER_QUERY_BATCH_WINDOW") or 0.005),
         **_,
     ):
         self._api_key = Secret.from_token(api_key)
@@ -199,6 +285,11 @@ class OpenAIEmbedderProvider(EmbedderProvider):
         self._embedding_model = model
         self._embedding_model_dim = dimension
         self._timeout = timeout
+        self._client_pool = client_pool or get_client_pool()
+        self._retry_policy = retry_policy
+        self._query_cache_size = query_cache_size
+        self._query_cache_ttl = query_cache_ttl
+        self._query_batch_window = query_batch_window
 
         logger.info(
             f"Initializing OpenAIEmbedder provider with API base: {self._api_base}"
@@ -210,12 +301,24 @@ class OpenAIEmbedderProvider(EmbedderProvider):
                 f"Using OpenAI API-compatible Embedding Model: {self._embedding_model}"
             )
 
+    def _get_client(self) -> AsyncOpenAI:
+        return self._client_pool.get_client(
+            api_key=self._api_key.resolve_value(),
+            base_url=self._api_base,
+            timeout=self._timeout,
+        )
+
     def get_text_embedder(self):
         return AsyncTextEmbedder(
             api_key=self._api_key,
             api_base_url=self._api_base,
             model=self._embedding_model,
             timeout=self._timeout,
+            client=self._get_client(),
+            retry_policy=self._retry_policy,
+            cache_size=self._query_cache_size,
+            cache_ttl=self._query_cache_ttl,
+            batch_window=self._query_batch_window,
         )
 
     def get_document_embedder(self):
@@ -224,4 +327,6 @@ class OpenAIEmbedderProvider(EmbedderProvider):
             api_base_url=self._api_base,
             model=self._embedding_model,
             timeout=self._timeout,
+            client=self._get_client(),
+            retry_policy=self._retry_policy,
         )
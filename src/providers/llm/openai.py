@@ -15,6 +15,9 @@ from openai import AsyncOpenAI, AsyncStream
 from openai.types.chat import ChatCompletion, ChatCompletionChunk
 
 from src.core.provider import LLMProvider
+from src.providers.client_pool import OpenAIClientPool, get_client_pool
+from src.providers.resilience import ResilientCaller, RetryPolicy
+from src.providers.llm.router import ModelRouter, Route, RouteMetrics
 from src.utils import remove_trailing_slash
 
 logger = logging.getLogger("wren-ai-service")
@@ -43,6 +46,8 @@ class AsyncGenerator(OpenAIGenerator):
         system_prompt: Optional[str] = None,
         generation_kwargs: Optional[Dict[str, Any]] = None,
         timeout: Optional[float] = None,
+        client: Optional[AsyncOpenAI] = None,
+        retry_policy: Optional[RetryPolicy] = None,
     ):
         super(AsyncGenerator, self).__init__(
             api_key,
@@ -54,11 +59,12 @@ class AsyncGenerator(OpenAIGenerator):
             generation_kwargs,
             timeout,
         )
-        self.client = AsyncOpenAI(
+        self.client = client or AsyncOpenAI(
             api_key=api_key.resolve_value(),
             organization=organization,
             base_url=api_base_url,
         )
+        self._caller = ResilientCaller(retry_policy, name=f"Generator {model}")
 
     async def __call__(self, *args, **kwargs):
         return await self.run(*args, **kwargs)
@@ -69,6 +75,8 @@ class AsyncGenerator(OpenAIGenerator):
         prompt: str,
         generation_kwargs: Optional[Dict[str, Any]] = None,
         query_id: Optional[str] = None,
+        # only used by ModelRouter to pick a model, a single model generator ignores it
+        complexity: Optional[int] = None,
     ):
         message = ChatMessage.from_user(prompt)
         if self.system_prompt:
@@ -87,11 +95,15 @@ class AsyncGenerator(OpenAIGenerator):
 
         completion: Union[
             AsyncStream[ChatCompletionChunk], ChatCompletion
-        ] = await self.client.chat.completions.create(
-            model=self.model,
-            messages=openai_formatted_messages,  # type: ignore
-            stream=self.streaming_callback is not None,
-            **generation_kwargs,
+        ] = await self._caller.call(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=openai_formatted_messages,  # type: ignore
+                stream=self.streaming_callback is not None,
+                **generation_kwargs,
+            ),
+            # a hedged stream would invoke the streaming callback twice
+            hedging=False if self.streaming_callback is not None else None,
         )
 
         completions: List[ChatMessage] = []
@@ -143,6 +155,19 @@ class OpenAILLMProvider(LLMProvider):
         timeout: Optional[float] = (
             float(os.getenv("LLM_TIMEOUT")) if os.getenv("LLM_TIMEOUT") else 120.0
         ),
+        # e.g. [{"name": "small", "model": "gpt-4o-mini", "levels": ["function"], "max_prompt_tokens": 512, "max_complexity": 5}]
+        # a route can also set "api_base", "api_key" and "kwargs" to use another OpenAI API-compatible endpoint
+        routes: List[Dict[str, Any]] = (
+            orjson.loads(os.getenv("GENERATION_MODEL_ROUTES"))
+            if os.getenv("GENERATION_MODEL_ROUTES")
+            else []
+        ),
+        client_pool: Optional[OpenAIClientPool] = None,
+        retry_policy: RetryPolicy = RetryPolicy(
+            max_retries=int(os.getenv("LLM_MAX_RETRIES") or 3),
+            deadline=float(os.getenv("LLM_DEADLINE")) if os.getenv("LLM_DEADLINE") else None,
+            hedging=(os.getenv("LLM_HEDGING") or "false").lower() == "true",
+        ),
         **_,
     ):
         self._api_key = Secret.from_token(api_key)
@@ -150,6 +175,13 @@ class OpenAILLMProvider(LLMProvider):
         self._model = model
         self._model_kwargs = kwargs
         self._timeout = timeout
+        self._routes = routes
+        # shared by the routers of all the generators, so the calls of every level and prompt add up per route
+        self._route_metrics = (
+            {route["name"]: RouteMetrics() for route in [*routes, {"name": "default"}]} if routes else {}
+        )
+        self._client_pool = client_pool or get_client_pool()
+        self._retry_policy = retry_policy
 
         logger.info(f"Using OpenAILLM provider with API base: {self._api_base}")
         if self._api_base == LLM_OPENAI_API_BASE:
@@ -160,25 +192,88 @@ class OpenAILLMProvider(LLMProvider):
             logger.info(
                 f"Using OpenAI API-compatible LLM model kwargs: {self._model_kwargs}"
             )
+        for route in self._routes:
+            logger.info(f"Using LLM route {route['name']}: {route}")
 
-    def get_generator(
+    def _get_generator(
         self,
+        api_key: Secret,
+        api_base: str,
+        model: str,
+        model_kwargs: Dict[str, Any],
         system_prompt: Optional[str] = None,
-        # it is expected to only pass the response format only, others will be merged from the model parameters.
         generation_kwargs: Optional[Dict[str, Any]] = None,
         streaming_callback: Optional[Callable[[StreamingChunk], None]] = None,
     ):
         return AsyncGenerator(
-            api_key=self._api_key,
-            api_base_url=self._api_base,
-            model=self._model,
+            api_key=api_key,
+            api_base_url=api_base,
+            model=model,
             system_prompt=system_prompt,
             # merge model args with the shared args related to response_format
             generation_kwargs=(
-                {**self._model_kwargs, **generation_kwargs}
+                {**model_kwargs, **generation_kwargs}
                 if generation_kwargs
-                else self._model_kwargs
+                else model_kwargs
             ),
             timeout=self._timeout,
             streaming_callback=streaming_callback,
+            client=self._client_pool.get_client(
+                api_key=api_key.resolve_value(),
+                base_url=api_base,
+                timeout=self._timeout,
+            ),
+            retry_policy=self._retry_policy,
         )
+
+    def get_generator(
+        self,
+        system_prompt: Optional[str] = None,
+        # it is expected to only pass the response format only, others will be merged from the model parameters.
+        generation_kwargs: Optional[Dict[str, Any]] = None,
+        streaming_callback: Optional[Callable[[StreamingChunk], None]] = None,
+        # file, class or function, it is used by the routes to pick a model
+        level: Optional[str] = None,
+    ):
+        generator = self._get_generator(
+            api_key=self._api_key,
+            api_base=self._api_base,
+            model=self._model,
+            model_kwargs=self._model_kwargs,
+            system_prompt=system_prompt,
+            generation_kwargs=generation_kwargs,
+            streaming_callback=streaming_callback,
+        )
+        if not self._routes:
+            return generator
+
+        return ModelRouter(
+            routes=[
+                Route(
+                    name=route["name"],
+                    generator=self._get_generator(
+                        api_key=(
+                            Secret.from_token(route["api_key"])
+                            if route.get("api_key")
+                            else self._api_key
+                        ),
+                        api_base=remove_trailing_slash(route.get("api_base") or self._api_base),
+                        model=route.get("model") or self._model,
+                        model_kwargs=route.get("kwargs") or self._model_kwargs,
+                        system_prompt=system_prompt,
+                        generation_kwargs=generation_kwargs,
+                        streaming_callback=streaming_callback,
+                    ),
+                    levels=route.get("levels"),
+                    max_prompt_tokens=route.get("max_prompt_tokens"),
+                    max_complexity=route.get("max_complexity"),
+                    metrics=self._route_metrics[route["name"]],
+                )
+                for route in self._routes
+            ],
+            default=Route(name="default", generator=generator, metrics=self._route_metrics["default"]),
+            level=level,
+        )
+
+    def get_route_metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {name: metrics.to_dict() for name, metrics in self._route_metrics.items()}
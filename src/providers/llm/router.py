@@ -0,0 +1,111 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from haystack import component
+
+from src.utils import estimate_tokens
+
+logger = logging.getLogger("wren-ai-service")
+
+
+@dataclass
+class RouteMetrics:
+    calls: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "avg_latency": self.latency / self.calls if self.calls else 0.0,
+        }
+
+
+@dataclass
+class Route:
+    name: str
+    generator: Any
+    # the route matches when every configured rule is satisfied, rules left as None always match
+    levels: Optional[List[str]] = None
+    max_prompt_tokens: Optional[int] = None
+    max_complexity: Optional[int] = None
+    metrics: RouteMetrics = field(default_factory=RouteMetrics)
+
+    def match(self, level: Optional[str], prompt_tokens: int, complexity: Optional[int]) -> bool:
+        if self.levels is not None and level not in self.levels:
+            return False
+        if self.max_prompt_tokens is not None and prompt_tokens > self.max_prompt_tokens:
+            return False
+        if self.max_complexity is not None and complexity is not None and complexity > self.max_complexity:
+            return False
+        return True
+
+
+@component
+class ModelRouter:
+    """
+    This component sits in front of the generators and sends every prompt to the first route whose rules match
+    the level (file, class or function), the prompt token count and the AST complexity of the summarized code,
+    and to the default generator otherwise. Metrics are recorded per route.
+
+    """
+    def __init__(self, routes: List[Route], default: Route, level: Optional[str] = None) -> None:
+        self._routes = routes
+        self._default = default
+        self._level = level
+
+    def route(self, prompt: str, complexity: Optional[int] = None) -> Route:
+        prompt_tokens = estimate_tokens(prompt)
+        for route in self._routes:
+            if route.match(self._level, prompt_tokens, complexity):
+                return route
+        return self._default
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            route.name: route.metrics.to_dict()
+            for route in self._routes + [self._default]
+        }
+
+    async def __call__(self, *args, **kwargs):
+        return await self.run(*args, **kwargs)
+
+    @component.output_types(replies=List[str], meta=List[Dict[str, Any]])
+    async def run(
+        self,
+        prompt: str,
+        generation_kwargs: Optional[Dict[str, Any]] = None,
+        query_id: Optional[str] = None,
+        complexity: Optional[int] = None,
+    ):
+        route = self.route(prompt, complexity)
+        logger.debug(f"Routing the {self._level} prompt to {route.name}")
+
+        start = time.perf_counter()
+        try:
+            result = await route.generator(
+                prompt=prompt,
+                generation_kwargs=generation_kwargs,
+                query_id=query_id,
+            )
+        except Exception:
+            route.metrics.errors += 1
+            raise
+        finally:
+            route.metrics.calls += 1
+            route.metrics.latency += time.perf_counter() - start
+
+        for meta in result.get("meta", []):
+            usage = meta.get("usage") or {}
+            route.metrics.prompt_tokens += usage.get("prompt_tokens", 0)
+            route.metrics.completion_tokens += usage.get("completion_tokens", 0)
+            meta["route"] = route.name
+
+        return result
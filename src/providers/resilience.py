@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+
+logger = logging.getLogger("wren-ai-service")
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+@dataclass
+class RetryPolicy:
+    max_retries: int = 3
+    initial_backoff: float = 0.5
+    max_backoff: float = 30.0
+    # the deadline of a call in seconds, including all retries
+    deadline: Optional[float] = None
+    # send a duplicate request when a call takes longer than the latency quantile, and keep the first reply
+    hedging: bool = False
+    hedging_quantile: float = 0.95
+    hedging_min_samples: int = 20
+    # retries and hedges are capped to a ratio of the calls, with bursts up to budget_tokens
+    budget_ratio: float = 0.1
+    budget_tokens: float = 10.0
+
+
+def is_retryable(e: BaseException) -> bool:
+    if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code in RETRYABLE_STATUS_CODES or e.status_code >= 500
+    return False
+
+
+def get_retry_after(e: BaseException) -> Optional[float]:
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+
+    if retry_after_ms := response.headers.get("retry-after-ms"):
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    if retry_after := response.headers.get("retry-after"):
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+class RetryBudget:
+    def __init__(self, ratio: float, max_tokens: float) -> None:
+        self._ratio = ratio
+        self._max_tokens = max_tokens
+        self._tokens = max_tokens
+
+    def deposit(self) -> None:
+        self._tokens = min(self._tokens + self._ratio, self._max_tokens)
+
+    def withdraw(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 1000) -> None:
+        self._latencies = deque(maxlen=window)
+
+    def record(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        if len(self._latencies) < min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(int(len(latencies) * q), len(latencies) - 1)]
+
+
+class ResilientCaller:
+    """
+    It retries the calls failing with rate limits, server errors, timeouts or connection errors with jittered
+    exponential backoff, honoring Retry-After, and optionally hedges the slow calls. Both are capped by a budget.
+
+    """
+    def __init__(self, policy: Optional[RetryPolicy] = None, name: str = "") -> None:
+        self._policy = policy or RetryPolicy()
+        self._name = name
+        self._budget = RetryBudget(self._policy.budget_ratio, self._policy.budget_tokens)
+        self._latencies = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+
+    def _backoff(self, attempt: int, e: BaseException) -> float:
+        retry_after = get_retry_after(e)
+        if retry_after is not None:
+            return min(retry_after, self._policy.max_backoff)
+        # full jitter, see https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+        return random.uniform(
+            0, min(self._policy.max_backoff, self._policy.initial_backoff * 2**attempt)
+        )
+
+    async def _race(self, call: Callable[[], Awaitable[T]], hedging: bool) -> T:
+        hedging_delay = (
+            self._latencies.quantile(self._policy.hedging_quantile, self._policy.hedging_min_samples)
+            if hedging
+            else None
+        )
+        primary = asyncio.ensure_future(call())
+        tasks = [primary]
+        # the calls still running are cancelled however the race ends, e.g. by the deadline of call()
+        try:
+            if hedging_delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=hedging_delay)
+            if done or not self._budget.withdraw():
+                return await primary
+
+            self.hedges += 1
+            logger.debug(f"{self._name}: hedging a call slower than {hedging_delay:.2f}s")
+            tasks.append(asyncio.ensure_future(call()))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(self, call: Callable[[], Awaitable[T]], hedging: Optional[bool] = None) -> T:
+        hedging = self._policy.hedging if hedging is None else hedging
+        deadline = (
+            time.monotonic() + self._policy.deadline
+            if self._policy.deadline is not None
+            else None
+        )
+        self._budget.deposit()
+
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                if deadline is None:
+                    result = await self._race(call, hedging)
+                else:
+                    result = await asyncio.wait_for(
+                        self._race(call, hedging), timeout=max(deadline - start, 0)
+                    )
+                self._latencies.record(time.monotonic() - start)
+                return result
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self._policy.max_retries:
+                    raise
+
+                delay = self._backoff(attempt, e)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                if not self._budget.withdraw():
+                    logger.warning(f"{self._name}: the retry budget is exhausted")
+                    raise
+
+                attempt += 1
+                self.retries += 1
+                logger.warning(
+                    f"{self._name}: retrying in {delay:.2f}s (attempt {attempt}/{self._policy.max_retries}) after {e!r}"
+                )
+                await asyncio.sleep(delay)
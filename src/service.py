@@ -0,0 +1,588 @@
+import argparse
+import asyncio
+import dataclasses
+import logging
+import os
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+import orjson
+
+from src.components.code_minifier import CodeMinifier
+from src.components.index_version import get_index_version
+from src.components.level_router import LevelRouter
+from src.components.retrieval_cache import RetrievalCache, get_retrieval_cache, normalize_query
+from src.core.provider import DocumentStoreProvider, EmbedderProvider, LLMProvider
+from src.main import INDEX_PATH, index_version_path, level_router_path, save_codebase
+from src.pipelines.indexing import CodeClassIndexing, CodeFileIndexing, CodeFunctionIndexing, CodeParsing
+from src.pipelines.retrieval import CodebaseRetrieval
+from src.providers.client_pool import get_client_pool
+from src.utils import init_langfuse, to_json
+
+logger = logging.getLogger("wren-ai-service")
+
+HTTP_REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+}
+
+# the largest request body read, the queries and the index requests are small JSON objects
+MAX_BODY_SIZE = 1 << 20
+
+# the fields of a query request passed on to CodebaseRetrieval.run, with their JSON types
+QUERY_PARAMETERS = {"expand_hops": int, "filters": dict, "max_tokens": int, "payload_fields": list}
+
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None) -> None:
+        super(ServiceError, self).__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    id: str
+    path: str
+    # "index", or "backfill" to upsert the LLM summaries over the documents of a fast index, see backfill of the pipelines
+    kind: str = "index"
+    # without the LLM summaries, see the fast mode of the indexing pipelines
+    fast: bool = False
+    # to queue a backfill job of the path once this fast index succeeded, whose id is then backfill_job
+    backfill: bool = False
+    backfill_job: Optional[str] = None
+    # queued, running, succeeded or failed
+    status: str = "queued"
+    stage: Optional[str] = None
+    completed_stages: int = 0
+    total_stages: int = 3
+    symbols: Dict[str, int] = field(default_factory=dict)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **dataclasses.asdict(self),
+            "progress": self.completed_stages / self.total_stages,
+        }
+
+
+class JobQueue:
+    """
+    A bounded queue of jobs run by a fixed number of workers, where submitting to a full queue fails right away,
+    so the callers back off instead of piling up work. The finished jobs are kept up to max_finished.
+
+    """
+    def __init__(
+        self,
+        run: Callable[[Job], Awaitable[None]],
+        workers: int = 1,
+        max_queued: int = 16,
+        max_finished: int = 1000,
+    ) -> None:
+        self._run = run
+        self._workers = workers
+        self._queue: asyncio.Queue[Job] = asyncio.Queue(maxsize=max_queued)
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._max_finished = max_finished
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self._workers)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def submit(self, job: Job) -> Job:
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise ServiceError(429, f"{self._queue.maxsize} jobs are queued already", retry_after=5.0)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def counts(self) -> Dict[str, int]:
+        return dict(Counter(job.status for job in self._jobs.values()))
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                await self._run(job)
+                job.status = "succeeded"
+            except Exception as e:
+                logger.exception(f"The {job.kind} job {job.id} of {job.path} failed")
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
+                self._forget_finished()
+
+    def _forget_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("succeeded", "failed")]
+        for job_id in finished[: max(len(finished) - self._max_finished, 0)]:
+            del self._jobs[job_id]
+
+
+class QueryMetrics:
+    def __init__(self, max_latencies: int = 10_000) -> None:
+        self.total = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.errors = 0
+        self.latencies: Deque[float] = deque(maxlen=max_latencies)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "latency": (
+                {f"p{int(q * 100)}": float(np.quantile(self.latencies, q)) for q in (0.5, 0.95, 0.99)}
+                if self.latencies
+                else {}
+            ),
+        }
+
+
+class CodebaseService:
+    """
+    The indexing and retrieval of a long-running service, where the providers and the pipelines are built once
+    and shared by all the requests.
+
+    The queries run at most max_concurrent_queries at a time. The same query with the same parameters
+    while it is in flight waits for the results of the first one instead of retrieving them again,
+    and beyond max_pending_queries the queries are rejected, so the latency stays bounded under overload.
+    The indexing runs as jobs in a bounded queue, see JobQueue.
+
+    """
+    def __init__(
+        self,
+        llm_provider: LLMProvider,
+        embedder_provider: EmbedderProvider,
+        document_store_provider: DocumentStoreProvider,
+        cache: Optional[RetrievalCache] = None,
+        level_router: Optional[LevelRouter] = None,
+        expand_hops: int = 1,
+        index_workers: int = 1,
+        max_queued_jobs: int = 16,
+        max_concurrent_queries: int = 32,
+        max_pending_queries: int = 256,
+        # the paths outside of it are not indexed, if given
+        code_root: Optional[str | Path] = None,
+        # where the symbol table and the dependency graph of the indexed codebase are saved, if given, see load_codebase
+        index_path: Optional[str | Path] = None,
+    ) -> None:
+        self._llm_provider = llm_provider
+        self._embedder_provider = embedder_provider
+        self._document_store_provider = document_store_provider
+        self._code_root = Path(code_root).resolve() if code_root else None
+        self._index_path = Path(index_path) if index_path else None
+        self._code_minifier = CodeMinifier()
+        self._code_parsing = CodeParsing()
+        # built on the first job of each mode, see _indexing_pipelines
+        self._indexing: Dict[bool, tuple] = {}
+        self.retrieval = CodebaseRetrieval(
+            embedder_provider=embedder_provider,
+            document_store_provider=document_store_provider,
+            expand_hops=expand_hops,
+            cache=cache,
+            level_router=level_router,
+        )
+        self._cache = cache
+        self._level_router = level_router
+
+        self._query_semaphore = asyncio.Semaphore(max_concurrent_queries)
+        self._max_pending_queries = max_pending_queries
+        self._in_flight: Dict[bytes, asyncio.Task] = {}
+        self.query_metrics = QueryMetrics()
+        self.jobs = JobQueue(self._index, workers=index_workers, max_queued=max_queued_jobs)
+        self._started_at = time.time()
+
+    async def start(self) -> "CodebaseService":
+        self.jobs.start()
+        return self
+
+    async def close(self) -> None:
+        await self.jobs.close()
+        for task in self._in_flight.values():
+            task.cancel()
+        # the router learns from the fallback searches, so it is kept for the next start
+        if self._level_router is not None and self._index_path is not None:
+            self._level_router.save(level_router_path(self._index_path))
+
+    def _indexing_pipelines(self, fast: bool) -> tuple:
+        if fast not in self._indexing:
+            providers = {
+                "llm_provider": self._llm_provider,
+                "embedder_provider": self._embedder_provider,
+                "document_store_provider": self._document_store_provider,
+                "fast": fast,
+                "code_minifier": self._code_minifier,
+            }
+            self._indexing[fast] = (
+                CodeClassIndexing(**providers, hierarchical=True, packing=True),
+                CodeFunctionIndexing(**providers, packing=True),
+                CodeFileIndexing(**providers, hierarchical=True),
+            )
+        return self._indexing[fast]
+
+    def submit_index(self, path: str, fast: bool = False, backfill: bool = False) -> Job:
+        """
+        Queue the indexing of the path. With backfill, the LLM summaries are upserted over the documents
+        of a fast index afterwards, or right away without fast, over those of an earlier fast index.
+        """
+        resolved = Path(path).resolve()
+        if self._code_root is not None and not resolved.is_relative_to(self._code_root):
+            raise ServiceError(400, f"{path} is outside of the code root")
+        if not resolved.is_dir():
+            raise ServiceError(400, f"{path} is not a directory")
+        if backfill and not fast:
+            return self.jobs.submit(Job(id=uuid.uuid4().hex, path=path, kind="backfill"))
+        return self.jobs.submit(Job(id=uuid.uuid4().hex, path=path, fast=fast, backfill=backfill))
+
+    async def _index(self, job: Job) -> None:
+        if job.kind == "backfill":
+            await self._backfill(job)
+            return
+
+        job.stage = "parsing"
+        # the parsing is CPU bound, so it runs off the event loop to keep answering the queries
+        parsing_results = await asyncio.to_thread(self._code_parsing.run, Path(job.path))
+        parsed_code = parsing_results["parse_code"]
+        job.symbols = {
+            "files": len(parsed_code),
+            "classes": sum(len(code.global_classes) for code in parsed_code),
+            "functions": sum(len(code.global_functions) for code in parsed_code),
+        }
+        job.completed_stages += 1
+
+        code_class_indexing, code_function_indexing, code_file_indexing = self._indexing_pipelines(job.fast)
+        # file summaries are composed from class and function summaries, so they have to be generated first
+        job.stage = "indexing classes and functions"
+        await asyncio.gather(
+            code_class_indexing.run(parsed_code),
+            code_function_indexing.run(parsed_code),
+        )
+        job.completed_stages += 1
+        job.stage = "indexing files"
+        await code_file_indexing.run(parsed_code)
+        job.completed_stages += 1
+        job.stage = None
+
+        self.retrieval.update_codebase(
+            symbol_table=parsing_results["build_symbol_table"],
+            dependency_graph=parsing_results["build_dependency_graph"],
+        )
+        if self._index_path is not None:
+            # the queries of the next start use them too, as with the index command
+            await asyncio.to_thread(
+                save_codebase,
+                self._index_path,
+                parsing_results["build_symbol_table"],
+                parsing_results["build_dependency_graph"],
+            )
+
+        if job.fast and job.backfill:
+            try:
+                job.backfill_job = self.jobs.submit(Job(id=uuid.uuid4().hex, path=job.path, kind="backfill")).id
+            except ServiceError:
+                # the fast index is done and usable, the backfill can be requested again later
+                logger.warning(f"The backfill of {job.path} was not queued, {self.jobs.counts()} jobs are queued")
+
+    async def _backfill(self, job: Job) -> None:
+        job.stage = "parsing"
+        parsed_code = (await asyncio.to_thread(self._code_parsing.run, Path(job.path)))["parse_code"]
+        job.completed_stages += 1
+
+        # the documents are upserted by id, so the fast ones keep answering the queries in the meantime
+        code_class_indexing, code_function_indexing, code_file_indexing = self._indexing_pipelines(fast=True)
+        job.stage = "backfilling classes and functions"
+        await asyncio.gather(
+            code_class_indexing.backfill(parsed_code),
+            code_function_indexing.backfill(parsed_code),
+        )
+        job.completed_stages += 1
+        job.stage = "backfilling files"
+        await code_file_indexing.backfill(parsed_code)
+        job.completed_stages += 1
+        job.stage = None
+
+    async def query(self, query: str, **params) -> Dict[str, Any]:
+        self.query_metrics.total += 1
+        key = orjson.dumps({"query": normalize_query(query), **params}, option=orjson.OPT_SORT_KEYS, default=str)
+        if (task := self._in_flight.get(key)) is not None:
+            self.query_metrics.coalesced += 1
+            # the other callers keep waiting if this one goes away
+            return await asyncio.shield(task)
+
+        if len(self._in_flight) >= self._max_pending_queries:
+            self.query_metrics.rejected += 1
+            raise ServiceError(429, f"{len(self._in_flight)} queries are pending already", retry_after=1.0)
+
+        task = asyncio.create_task(self._query(query, **params))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _query(self, query: str, **params) -> Dict[str, Any]:
+        async with self._query_semaphore:
+            start = time.perf_counter()
+            try:
+                results = await self.retrieval.run(query, **params)
+            except Exception:
+                self.query_metrics.errors += 1
+                raise
+            self.query_metrics.latencies.append(time.perf_counter() - start)
+        return to_json(results)
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "uptime": time.time() - self._started_at,
+            "index_version": get_index_version().get(),
+            "jobs": self.jobs.counts(),
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queries": {
+                **self.query_metrics.to_dict(),
+                "in_flight": len(self._in_flight),
+            },
+            "jobs": self.jobs.counts(),
+            "cache": self._cache.stats() if self._cache is not None else None,
+            "level_router": self._level_router.metrics.to_dict() if self._level_router is not None else None,
+            "llm_routes": self._llm_provider.get_route_metrics(),
+            "index_version": get_index_version().get(),
+        }
+
+
+class ServiceServer:
+    """
+    The HTTP API of CodebaseService, on asyncio streams with HTTP/1.1 keep-alive and JSON bodies.
+
+    POST /v1/query {"query": ..., "expand_hops", "filters", "max_tokens", "payload_fields"}: the retrieval results
+    POST /v1/index {"path": ..., "fast": false, "backfill": false}: 202 with the queued job
+    GET /v1/jobs and /v1/jobs/<id>: the status and the progress of the jobs
+    GET /health and /metrics
+
+    The overloaded service answers 429 with a retry-after header.
+
+    """
+    def __init__(self, service: CodebaseService) -> None:
+        self.service = service
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> "ServiceServer":
+        await self.service.start()
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"Codebase service listening on {self.base_url}")
+        return self
+
+    async def close(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.service.close()
+
+    async def __aenter__(self) -> "ServiceServer":
+        return await self.start()
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            # HTTP/1.1 keep-alive, one request at a time per connection
+            while request_line := await reader.readline():
+                try:
+                    method, path, _ = request_line.decode().split(" ", 2)
+                    headers = {}
+                    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        name, value = line.decode().split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                    content_length = int(headers.get("content-length", 0))
+                    if content_length < 0:
+                        raise ValueError(f"Negative content-length {content_length}")
+                except ValueError:
+                    # the rest of the stream can not be framed, so the connection is closed after the answer
+                    await self._send(writer, 400, {"error": {"message": "Malformed HTTP request", "code": 400}})
+                    break
+                if content_length > MAX_BODY_SIZE:
+                    await self._send(
+                        writer, 413, {"error": {"message": f"The body is larger than {MAX_BODY_SIZE} bytes", "code": 413}}
+                    )
+                    break
+                body = await reader.readexactly(content_length)
+
+                await self._handle_request(method, path.split("?")[0], body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            # the client went away, or the server is closing
+            pass
+        finally:
+            writer.close()
+
+    async def _send(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        body: Any,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        content = orjson.dumps(body, default=str)
+        head = [
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+            "content-type: application/json",
+            f"content-length: {len(content)}",
+            *[f"{name}: {value}" for name, value in (headers or {}).items()],
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + content)
+        await writer.drain()
+
+    async def _handle_request(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        try:
+            status, response = await self._route(method, path, body)
+            await self._send(writer, status, response)
+        except ServiceError as e:
+            await self._send(
+                writer,
+                e.status,
+                {"error": {"message": str(e), "code": e.status}},
+                {"retry-after": str(int(e.retry_after))} if e.retry_after else None,
+            )
+        except Exception as e:
+            logger.exception(f"Failed to handle {method} {path}")
+            await self._send(writer, 500, {"error": {"message": str(e), "code": 500}})
+
+    async def _route(self, method: str, path: str, body: bytes) -> tuple[int, Any]:
+        if method == "GET" and path == "/health":
+            return 200, self.service.health()
+        if method == "GET" and path == "/metrics":
+            return 200, self.service.metrics()
+        if method == "GET" and path == "/v1/jobs":
+            return 200, {"jobs": [job.to_dict() for job in self.service.jobs.jobs()]}
+        if method == "GET" and path.startswith("/v1/jobs/"):
+            if (job := self.service.jobs.get(path.removeprefix("/v1/jobs/"))) is None:
+                raise ServiceError(404, f"Unknown job {path.removeprefix('/v1/jobs/')}")
+            return 200, job.to_dict()
+        if method == "POST" and path == "/v1/query":
+            request = self._parse(body, "query")
+            return 200, await self.service.query(request["query"], **self._query_parameters(request))
+        if method == "POST" and path == "/v1/index":
+            request = self._parse(body, "path")
+            job = self.service.submit_index(
+                request["path"], fast=bool(request.get("fast", False)), backfill=bool(request.get("backfill", False))
+            )
+            return 202, job.to_dict()
+        raise ServiceError(404, f"Unknown endpoint {method} {path}")
+
+    @staticmethod
+    def _parse(body: bytes, required: str) -> dict:
+        try:
+            request = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            raise ServiceError(400, "The body is not valid JSON")
+        if not isinstance(request, dict) or not isinstance(request.get(required), str):
+            raise ServiceError(400, f"The body needs a {required} string")
+        return request
+
+    @staticmethod
+    def _query_parameters(request: dict) -> dict:
+        params = {name: request[name] for name in QUERY_PARAMETERS if request.get(name) is not None}
+        for name, value in params.items():
+            # a JSON boolean is a Python int too
+            if not isinstance(value, QUERY_PARAMETERS[name]) or isinstance(value, bool):
+                raise ServiceError(400, f"The {name} has to be a JSON {QUERY_PARAMETERS[name].__name__}")
+        if not all(isinstance(payload_field, str) for payload_field in params.get("payload_fields", [])):
+            raise ServiceError(400, "The payload_fields have to be strings")
+        return params
+
+
+def get_service(index_path: Optional[Path] = None) -> CodebaseService:
+    # the providers read their defaults from the environment when imported, i.e. after .env is loaded
+    from src.main import get_document_store_provider, get_embedder_provider
+    from src.providers.cassette import CassetteLLMProvider, get_cassette
+    from src.providers.llm.openai import OpenAILLMProvider
+
+    llm = OpenAILLMProvider()
+    # with CASSETTE_PATH set, the LLM and embedding calls are recorded to or replayed from a local file
+    if cassette := get_cassette():
+        llm = CassetteLLMProvider(llm, cassette)
+    embedder = get_embedder_provider()
+    index_path = index_path or Path(os.getenv("CODEBASE_INDEX_PATH") or INDEX_PATH)
+    level_router = LevelRouter()
+    if (router_path := level_router_path(index_path)).exists():
+        level_router.load(router_path, dimension=embedder.get_dimensions())
+
+    return CodebaseService(
+        llm_provider=llm,
+        embedder_provider=embedder,
+        document_store_provider=get_document_store_provider(),
+        cache=get_retrieval_cache(),
+        level_router=level_router,
+        index_workers=int(os.getenv("SERVICE_INDEX_WORKERS") or 1),
+        max_queued_jobs=int(os.getenv("SERVICE_MAX_QUEUED_JOBS") or 16),
+        max_concurrent_queries=int(os.getenv("SERVICE_MAX_CONCURRENT_QUERIES") or 32),
+        max_pending_queries=int(os.getenv("SERVICE_MAX_PENDING_QUERIES") or 256),
+        code_root=os.getenv("SERVICE_CODE_ROOT"),
+        index_path=index_path,
+    )
+
+
+async def serve(host: str, port: int, service: Optional[CodebaseService] = None) -> None:
+    server = await ServiceServer(service or get_service()).start(host, port)
+    await get_client_pool().warmup()
+    try:
+        await server._server.serve_forever()
+    finally:
+        await server.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Serve the indexing and retrieval of codebases over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_langfuse()
+    os.environ.setdefault(
+        "INDEX_VERSION_PATH", str(index_version_path(Path(os.getenv("CODEBASE_INDEX_PATH") or INDEX_PATH)))
+    )
+    await serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
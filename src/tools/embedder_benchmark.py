@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from haystack import Document
+
+from src.components.code_parser import Code, CodeParser
+from src.core.provider import EmbedderProvider
+
+
+def get_docstring_pairs(parsed_code: List[Code]) -> Tuple[List[str], List[str], List[int]]:
+    """
+    Use the docstrings as the queries and the code without them as the documents, a retrieval task with known answers.
+    It returns the documents, the queries and the index of the expected document of every query.
+    """
+    documents, queries, answers = [], [], []
+    for code in parsed_code:
+        symbols = [
+            *code.global_functions,
+            *code.global_classes,
+            *[method for _class in code.global_classes for method in _class.methods],
+        ]
+        for symbol in symbols:
+            if symbol.docstring:
+                queries.append(symbol.docstring.strip().splitlines()[0])
+                answers.append(len(documents))
+            documents.append(symbol.content.replace(symbol.docstring or "\0", ""))
+    return documents, queries, answers
+
+
+def evaluate_retrieval(
+    document_embeddings: np.ndarray,
+    query_embeddings: np.ndarray,
+    answers: List[int],
+    k: int = 10,
+) -> Dict[str, float]:
+    def normalize(embeddings: np.ndarray) -> np.ndarray:
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    similarities = normalize(query_embeddings) @ normalize(document_embeddings).T
+    ranks = np.array(
+        [
+            int((similarities[i] > similarities[i, answer]).sum()) + 1
+            for i, answer in enumerate(answers)
+        ]
+    )
+    return {
+        f"recall@{k}": float((ranks <= k).mean()),
+        "mrr": float((1 / ranks).mean()),
+    }
+
+
+async def benchmark(
+    embedder_provider: EmbedderProvider,
+    documents: List[str],
+    queries: List[str],
+    answers: List[int],
+    k: int = 10,
+) -> Dict[str, float]:
+    document_embedder = embedder_provider.get_document_embedder()
+    text_embedder = embedder_provider.get_text_embedder()
+
+    start = time.perf_counter()
+    embedded = (await document_embedder.run([Document(content=document) for document in documents]))["documents"]
+    documents_elapsed = time.perf_counter() - start
+
+    query_embeddings, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_embeddings.append((await text_embedder.run(query))["embedding"])
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "documents_per_second": len(documents) / documents_elapsed,
+        "query_latency_p50": float(np.quantile(latencies, 0.5)) if latencies else 0.0,
+        **evaluate_retrieval(
+            np.array([document.embedding for document in embedded]),
+            np.array(query_embeddings),
+            answers,
+            k,
+        ),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the throughput and retrieval quality of the embedders, using the docstrings of a codebase as queries"
+    )
+    parser.add_argument("path", nargs="?", default="src")
+    parser.add_argument("--providers", nargs="+", choices=["local", "openai"], default=["local", "openai"])
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    documents, queries, answers = get_docstring_pairs(CodeParser().parse(Path(args.path)))
+    print(f"{len(documents)} documents, {len(queries)} queries")
+
+    for name in args.providers:
+        if name == "local":
+            from src.providers.embedder.local import LocalEmbedderProvider
+
+            embedder_provider = LocalEmbedderProvider()
+        else:
+            from src.providers.embedder.openai import OpenAIEmbedderProvider
+
+            embedder_provider = OpenAIEmbedderProvider()
+
+        results = await benchmark(embedder_provider, documents, queries, answers, args.k)
+        print(f"{name}: " + ", ".join(f"{key}={value:.4g}" for key, value in results.items()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import orjson
+
+from src.components.code_minifier import CodeMinifier
+from src.pipelines.indexing import CodeParsing, CodeClassIndexing, CodeFunctionIndexing, CodeFileIndexing
+from src.providers.client_pool import OpenAIClientPool
+from src.providers.document_store.memmap import MemmapProvider
+from src.providers.document_store.qdrant import QdrantProvider
+from src.providers.embedder.openai import OpenAIEmbedderProvider
+from src.providers.llm.openai import OpenAILLMProvider
+from src.providers.resilience import RetryPolicy
+from src.tools.openai_server import OpenAIServer, add_server_arguments, get_server_config
+
+
+async def _timed(name: str, coroutine, timings: dict) -> None:
+    start = time.perf_counter()
+    await coroutine
+    timings[name] = time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Index a codebase against the OpenAI stand-in server, and report the throughput and tail latency"
+    )
+    parser.add_argument("path", nargs="?", default="src")
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--packing", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--hierarchical", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--document-store", choices=["qdrant", "memmap"], default="qdrant")
+    parser.add_argument("--qdrant-location", default=None, help="defaults to QDRANT_HOST")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    parsed_code = CodeParsing().run(Path(args.path))["parse_code"]
+
+    async with OpenAIServer(get_server_config(args)) as server:
+        client_pool = OpenAIClientPool(max_connections=args.max_connections)
+        retry_policy = RetryPolicy(max_retries=args.max_retries)
+        llm = OpenAILLMProvider(
+            api_key="stand-in",
+            api_base=server.base_url,
+            client_pool=client_pool,
+            retry_policy=retry_policy,
+        )
+        embedder = OpenAIEmbedderProvider(
+            api_key="stand-in",
+            api_base=server.base_url,
+            dimension=args.embedding_dim,
+            client_pool=client_pool,
+            retry_policy=retry_policy,
+        )
+        if args.document_store == "memmap":
+            document_store = MemmapProvider(
+                path=tempfile.mkdtemp(),
+                embedding_model_dim=args.embedding_dim,
+            )
+        else:
+            document_store = QdrantProvider(
+                **({"location": args.qdrant_location} if args.qdrant_location else {}),
+                embedding_model_dim=args.embedding_dim,
+                recreate_index=True,
+            )
+        code_minifier = CodeMinifier()
+
+        code_class_indexing = CodeClassIndexing(
+            llm_provider=llm,
+            embedder_provider=embedder,
+            document_store_provider=document_store,
+            hierarchical=args.hierarchical,
+            packing=args.packing,
+            code_minifier=code_minifier,
+        )
+        code_function_indexing = CodeFunctionIndexing(
+            llm_provider=llm,
+            embedder_provider=embedder,
+            document_store_provider=document_store,
+            packing=args.packing,
+            code_minifier=code_minifier,
+        )
+        code_file_indexing = CodeFileIndexing(
+            llm_provider=llm,
+            embedder_provider=embedder,
+            document_store_provider=document_store,
+            hierarchical=args.hierarchical,
+            code_minifier=code_minifier,
+        )
+
+        timings = {}
+        start = time.perf_counter()
+        await asyncio.gather(
+            _timed("class", code_class_indexing.run(parsed_code), timings),
+            _timed("function", code_function_indexing.run(parsed_code), timings),
+        )
+        await _timed("file", code_file_indexing.run(parsed_code), timings)
+        elapsed = time.perf_counter() - start
+
+        symbols = {
+            "file": len(parsed_code),
+            "class": sum(len(code.global_classes) for code in parsed_code),
+            "function": sum(len(code.global_functions) for code in parsed_code),
+        }
+        report = {
+            "elapsed": elapsed,
+            "symbols_per_second": sum(symbols.values()) / elapsed,
+            "pipelines": {
+                level: {
+                    "symbols": symbols[level],
+                    "elapsed": timings[level],
+                    "symbols_per_second": symbols[level] / timings[level] if timings[level] else 0.0,
+                }
+                for level in symbols
+            },
+            # the client latency includes the wait for a free connection, the server latency does not
+            "client": client_pool.stats(),
+            "server": server.stats.to_dict(),
+        }
+        await client_pool.close()
+        print(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
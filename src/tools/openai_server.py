@@ -0,0 +1,504 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import logging
+import math
+import random
+import re
+import time
+import uuid
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from src.utils import estimate_tokens
+
+logger = logging.getLogger("wren-ai-service")
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+# the largest request body read, e.g. a batch of documents to embed
+MAX_BODY_SIZE = 64 << 20
+
+
+@dataclass
+class LatencyDistribution:
+    """
+    fixed: always the median
+    uniform: between 0 and twice the median
+    lognormal: a long tail, with the given p99
+    """
+    kind: str = "lognormal"
+    median: float = 0.5
+    p99: float = 2.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.median
+        if self.kind == "uniform":
+            return rng.uniform(0, 2 * self.median)
+        # 2.326 is the z-score of the 99th percentile
+        sigma = math.log(max(self.p99, self.median) / self.median) / 2.326 if self.median > 0 else 0.0
+        return rng.lognormvariate(math.log(self.median), sigma) if self.median > 0 else 0.0
+
+
+@dataclass
+class ServerConfig:
+    embedding_dim: int = 3072
+    # the latency before the first token, plus per completion token for chat completions
+    chat_latency: LatencyDistribution = field(default_factory=LatencyDistribution)
+    chat_token_latency: float = 0.01
+    embedding_latency: LatencyDistribution = field(
+        default_factory=lambda: LatencyDistribution(median=0.1, p99=0.5)
+    )
+    # the probability of failing a request with 429, or with 500/503
+    rate_limit_error_rate: float = 0.0
+    server_error_rate: float = 0.0
+    # the limits per minute, 0 means unlimited
+    rpm: int = 0
+    tpm: int = 0
+    summary_words: int = 30
+    seed: Optional[int] = None
+
+
+class RateLimiter:
+    def __init__(self, rpm: int, tpm: int, window: float = 60.0) -> None:
+        self._rpm = rpm
+        self._tpm = tpm
+        self._window = window
+        self._requests: deque[Tuple[float, int]] = deque()
+        self._tokens = 0
+
+    def acquire(self, tokens: int) -> Optional[float]:
+        """
+        It returns None if the request is admitted, otherwise the seconds to wait before retrying.
+        """
+        now = time.monotonic()
+        while self._requests and self._requests[0][0] <= now - self._window:
+            self._tokens -= self._requests.popleft()[1]
+
+        if (self._rpm and len(self._requests) >= self._rpm) or (
+            self._tpm and self._requests and self._tokens + tokens > self._tpm
+        ):
+            return max(self._requests[0][0] + self._window - now, 0.0)
+
+        self._requests.append((now, tokens))
+        self._tokens += tokens
+        return None
+
+
+class ServerStats:
+    def __init__(self) -> None:
+        self.requests = Counter()
+        self.statuses = Counter()
+        self.latencies: Dict[str, List[float]] = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._start = time.perf_counter()
+
+    def record(self, endpoint: str, status: int, latency: float) -> None:
+        self.requests[endpoint] += 1
+        self.statuses[status] += 1
+        self.latencies.setdefault(endpoint, []).append(latency)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._start
+        return {
+            "elapsed": elapsed,
+            "requests": dict(self.requests),
+            "statuses": {str(status): count for status, count in self.statuses.items()},
+            "requests_per_second": sum(self.requests.values()) / elapsed if elapsed else 0.0,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "peak_in_flight": self.peak_in_flight,
+            "latency": {
+                endpoint: {
+                    f"p{int(q * 100)}": float(np.quantile(latencies, q))
+                    for q in (0.5, 0.95, 0.99)
+                }
+                for endpoint, latencies in self.latencies.items()
+            },
+        }
+
+
+def _resolve(schema: dict, root: dict) -> dict:
+    if "$ref" in schema:
+        # e.g. #/$defs/PackedSummary from pydantic
+        for part in schema["$ref"].lstrip("#/").split("/"):
+            root = root[part]
+        return root
+    return schema
+
+
+class OpenAIServer:
+    """
+    A stand-in for the chat completions and embeddings endpoints of the OpenAI API, for load testing without spending tokens.
+    The chat completions follow the JSON schema of response_format, and the embeddings are deterministic per input.
+    Latency, rate limits and errors are injected as configured, and streaming is sent as server-sent events.
+
+    """
+    def __init__(self, config: Optional[ServerConfig] = None) -> None:
+        self.config = config or ServerConfig()
+        self.stats = ServerStats()
+        self._rng = random.Random(self.config.seed)
+        self._rate_limiter = RateLimiter(self.config.rpm, self.config.tpm)
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/v1"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> "OpenAIServer":
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"OpenAI stand-in server listening on {self.base_url}")
+        return self
+
+    async def close(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> "OpenAIServer":
+        return await self.start()
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            # HTTP/1.1 keep-alive, one request at a time per connection
+            while request_line := await reader.readline():
+                try:
+                    method, path, _ = request_line.decode().split(" ", 2)
+                    headers = {}
+                    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        name, value = line.decode().split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                    content_length = int(headers.get("content-length", 0))
+                    if content_length < 0:
+                        raise ValueError(f"Negative content-length {content_length}")
+                except ValueError:
+                    # the rest of the stream can not be framed, so the connection is closed after the answer
+                    await self._send_error(writer, 400, "Malformed HTTP request")
+                    break
+                if content_length > MAX_BODY_SIZE:
+                    await self._send_error(writer, 413, f"The body is larger than {MAX_BODY_SIZE} bytes")
+                    break
+                body = await reader.readexactly(content_length)
+
+                await self._handle_request(method, path.split("?")[0], body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            # the client went away, or the server is closing
+            pass
+        finally:
+            writer.close()
+
+    async def _send(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        body: Any,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        content = orjson.dumps(body)
+        head = [
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+            "content-type: application/json",
+            f"content-length: {len(content)}",
+            *[f"{name}: {value}" for name, value in (headers or {}).items()],
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + content)
+        await writer.drain()
+
+    async def _send_error(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        message: str,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        await self._send(
+            writer,
+            status,
+            {"error": {"message": message, "type": "stand_in_error", "code": status}},
+            headers,
+        )
+
+    async def _handle_request(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        start = time.perf_counter()
+        self.stats.in_flight += 1
+        self.stats.peak_in_flight = max(self.stats.peak_in_flight, self.stats.in_flight)
+        status = 200
+        try:
+            if method == "GET" and path == "/v1/models":
+                await self._send(writer, 200, {"object": "list", "data": []})
+                return
+            if method != "POST" or path not in ("/v1/chat/completions", "/v1/embeddings"):
+                status = 404
+                await self._send_error(writer, status, f"Unknown endpoint {method} {path}")
+                return
+
+            try:
+                request = orjson.loads(body)
+                if not isinstance(request, dict):
+                    raise TypeError("The body is not a JSON object")
+                if path == "/v1/embeddings":
+                    status = await self._embeddings(request, writer)
+                else:
+                    status = await self._chat_completions(request, writer)
+            except (orjson.JSONDecodeError, KeyError, TypeError) as e:
+                # the malformed requests are rejected before anything is written, like the API does
+                status = 400
+                await self._send_error(writer, status, f"Invalid request: {e!r}")
+        finally:
+            self.stats.in_flight -= 1
+            self.stats.record(path, status, time.perf_counter() - start)
+
+    async def _inject_faults(self, tokens: int, writer: asyncio.StreamWriter) -> Optional[int]:
+        if (retry_after := self._rate_limiter.acquire(tokens)) is not None:
+            await self._send_error(
+                writer, 429, "Rate limit reached", {"retry-after-ms": str(int(retry_after * 1000))}
+            )
+            return 429
+
+        roll = self._rng.random()
+        if roll < self.config.rate_limit_error_rate:
+            await self._send_error(writer, 429, "Rate limit reached", {"retry-after": "1"})
+            return 429
+        if roll < self.config.rate_limit_error_rate + self.config.server_error_rate:
+            status = self._rng.choice([500, 503])
+            await self._send_error(writer, status, "The server had an error while processing your request")
+            return status
+        return None
+
+    def _embed(self, text: str, dimensions: int) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        embedding = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+        return embedding / np.linalg.norm(embedding)
+
+    async def _embeddings(self, request: dict, writer: asyncio.StreamWriter) -> int:
+        texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+        tokens = sum(estimate_tokens(text) for text in texts)
+        if status := await self._inject_faults(tokens, writer):
+            return status
+
+        await asyncio.sleep(self.config.embedding_latency.sample(self._rng))
+
+        dimensions = request.get("dimensions") or self.config.embedding_dim
+        data = []
+        for i, text in enumerate(texts):
+            embedding = self._embed(text, dimensions)
+            data.append(
+                {
+                    "object": "embedding",
+                    "index": i,
+                    # the openai client asks for base64 by default
+                    "embedding": (
+                        base64.b64encode(embedding.tobytes()).decode()
+                        if request.get("encoding_format") == "base64"
+                        else embedding.tolist()
+                    ),
+                }
+            )
+        self.stats.prompt_tokens += tokens
+        await self._send(
+            writer,
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": request.get("model", ""),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            },
+        )
+        return 200
+
+    def _text(self, words: int) -> str:
+        return " ".join(self._rng.choice(["code", "function", "class", "returns", "module", "data", "value"]) for _ in range(words))
+
+    def _generate(self, schema: dict, root: dict, prompt: str, name: str = "") -> Any:
+        schema = _resolve(schema, root)
+        if schema.get("type") == "object" or "properties" in schema:
+            return {
+                key: self._generate(value, root, prompt, key)
+                for key, value in schema.get("properties", {}).items()
+            }
+        if schema.get("type") == "array":
+            items = _resolve(schema.get("items", {}), root)
+            # packed requests, answer every "### id: <id>" of the prompt
+            if "id" in items.get("properties", {}):
+                return [
+                    {**self._generate(items, root, prompt), "id": id}
+                    for id in re.findall(r"^### id: (.+)$", prompt, re.MULTILINE)
+                ]
+            return [self._generate(items, root, prompt)]
+        if schema.get("type") == "integer":
+            return 0
+        if schema.get("type") == "number":
+            return 0.0
+        if schema.get("type") == "boolean":
+            return False
+        return self._text(self.config.summary_words if name == "summary" else 3)
+
+    def _completion(self, request: dict, prompt: str) -> str:
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            return orjson.dumps(self._generate(schema, schema, prompt)).decode()
+        if response_format.get("type") == "json_object":
+            return orjson.dumps({"summary": self._text(self.config.summary_words)}).decode()
+        return self._text(self.config.summary_words)
+
+    async def _chat_completions(self, request: dict, writer: asyncio.StreamWriter) -> int:
+        prompt = "\n".join(
+            message["content"] if isinstance(message["content"], str) else orjson.dumps(message["content"]).decode()
+            for message in request["messages"]
+        )
+        prompt_tokens = estimate_tokens(prompt)
+        if status := await self._inject_faults(prompt_tokens, writer):
+            return status
+
+        content = self._completion(request, prompt)
+        completion_tokens = estimate_tokens(content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        self.stats.prompt_tokens += prompt_tokens
+        self.stats.completion_tokens += completion_tokens
+
+        response = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "created": int(time.time()),
+            "model": request.get("model", ""),
+            "system_fingerprint": "stand-in",
+        }
+        await asyncio.sleep(self.config.chat_latency.sample(self._rng))
+        if request.get("stream"):
+            await self._stream(writer, response, content, usage)
+            return 200
+
+        await asyncio.sleep(self.config.chat_token_latency * completion_tokens)
+        await self._send(
+            writer,
+            200,
+            {
+                **response,
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                        "logprobs": None,
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+        return 200
+
+    async def _stream(self, writer: asyncio.StreamWriter, response: dict, content: str, usage: dict) -> None:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ntransfer-encoding: chunked\r\n\r\n"
+        )
+
+        async def send_event(data: bytes) -> None:
+            event = b"data: " + data + b"\n\n"
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            await writer.drain()
+
+        # about one token per chunk
+        for i in range(0, len(content), 4):
+            await send_event(
+                orjson.dumps(
+                    {
+                        **response,
+                        "object": "chat.completion.chunk",
+                        "choices": [
+                            {"index": 0, "delta": {"content": content[i : i + 4]}, "finish_reason": None}
+                        ],
+                    }
+                )
+            )
+            await asyncio.sleep(self.config.chat_token_latency)
+        await send_event(
+            orjson.dumps(
+                {
+                    **response,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "usage": usage,
+                }
+            )
+        )
+        await send_event(b"[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--embedding-dim", type=int, default=3072)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="median seconds before the first token")
+    parser.add_argument("--chat-latency-p99", type=float, default=2.0)
+    parser.add_argument("--chat-token-latency", type=float, default=0.01)
+    parser.add_argument("--embedding-latency", type=float, default=0.1)
+    parser.add_argument("--embedding-latency-p99", type=float, default=0.5)
+    parser.add_argument("--rate-limit-error-rate", type=float, default=0.0)
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--tpm", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def get_server_config(args: argparse.Namespace) -> ServerConfig:
+    return ServerConfig(
+        embedding_dim=args.embedding_dim,
+        chat_latency=LatencyDistribution(args.latency, args.chat_latency, args.chat_latency_p99),
+        chat_token_latency=args.chat_token_latency,
+        embedding_latency=LatencyDistribution(args.latency, args.embedding_latency, args.embedding_latency_p99),
+        rate_limit_error_rate=args.rate_limit_error_rate,
+        server_error_rate=args.server_error_rate,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        seed=args.seed,
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Serve a stand-in of the OpenAI API for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = await OpenAIServer(get_server_config(args)).start(args.host, args.port)
+    print(f"Set LLM_OPENAI_API_BASE and EMBEDDER_OPENAI_API_BASE to {server.base_url}")
+    try:
+        await server._server.serve_forever()
+    finally:
+        print(orjson.dumps(server.stats.to_dict(), option=orjson.OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from haystack import Document
+
+from src.providers.document_store.qdrant import QdrantProvider
+from src.providers.document_store.vectors import VECTOR_DATATYPES, VectorEncoder
+from src.providers.embedder.openai import OpenAIEmbedderProvider
+
+
+def _top_k(similarities: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, similarities.shape[1])
+    return np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+
+
+def recall_at_k(queries: np.ndarray, documents: np.ndarray, encoder: VectorEncoder, k: int = 10) -> float:
+    """
+    The share of the top k documents by full-precision cosine similarity that are also in the top k of the encoded vectors.
+    """
+    full = VectorEncoder(queries.shape[1])
+    expected = _top_k(full.similarities(queries, full.encode_array(documents)), k)
+    actual = _top_k(encoder.similarities(queries, encoder.encode_array(documents)), k)
+    return float(
+        np.mean(
+            [
+                len(set(expected_ids) & set(actual_ids)) / len(expected_ids)
+                for expected_ids, actual_ids in zip(expected, actual)
+            ]
+        )
+    )
+
+
+def evaluate(
+    queries: np.ndarray,
+    documents: np.ndarray,
+    dimensions: List[int],
+    datatypes: List[str],
+    k: int = 10,
+) -> List[Dict]:
+    results = []
+    for dimension in dimensions:
+        for datatype in datatypes:
+            encoder = VectorEncoder(min(dimension, documents.shape[1]), datatype)
+            results.append(
+                {
+                    "dimension": encoder.dimension,
+                    "datatype": datatype,
+                    "bytes_per_vector": encoder.dimension * np.dtype(datatype).itemsize,
+                    f"recall@{k}": recall_at_k(queries, documents, encoder, k),
+                }
+            )
+    return results
+
+
+async def _embed(documents: List[Document], queries: List[str]):
+    embedder_provider = OpenAIEmbedderProvider()
+    documents = (await embedder_provider.get_document_embedder().run(documents))["documents"]
+    text_embedder = embedder_provider.get_text_embedder()
+    query_embeddings = await asyncio.gather(*[text_embedder.run(query) for query in queries])
+    return (
+        np.array([document.embedding for document in documents]),
+        np.array([result["embedding"] for result in query_embeddings]),
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the recall@k of reduced-dimension and low-precision vectors against full-precision ones"
+    )
+    parser.add_argument("queries", type=Path, help="a file with one query per line")
+    parser.add_argument("--dataset", default="code_function", help="the indexed documents to search")
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[256, 512, 1024, 3072])
+    parser.add_argument("--datatypes", nargs="+", choices=VECTOR_DATATYPES, default=list(VECTOR_DATATYPES))
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    queries = [query for query in args.queries.read_text().splitlines() if query.strip()]
+    # the stored vectors may be reduced already, so the documents are embedded again at full precision
+    documents = [
+        Document(id=document.id, content=document.content)
+        for document in QdrantProvider().get_store(dataset_name=args.dataset).filter_documents()
+    ]
+    document_embeddings, query_embeddings = await _embed(documents, queries)
+
+    print(f"{len(documents)} documents, {len(queries)} queries")
+    print(f"{'dimension':>9} {'datatype':>8} {'bytes':>6} {'recall@' + str(args.k):>9}")
+    for result in evaluate(query_embeddings, document_embeddings, args.dimensions, args.datatypes, args.k):
+        print(
+            f"{result['dimension']:>9} {result['datatype']:>8} {result['bytes_per_vector']:>6} "
+            f"{result[f'recall@{args.k}']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
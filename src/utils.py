@@ -1,3 +1,9 @@
+import dataclasses
+import functools
+import re
+from typing import Any
+
+
 def init_langfuse():
     import os
 
@@ -15,4 +21,43 @@ def init_langfuse():
 
 
 def remove_trailing_slash(endpoint: str) -> str:
-    return endpoint.rstrip("/") if endpoint.endswith("/") else endpoint
\ No newline at end of file
+    return endpoint.rstrip("/") if endpoint.endswith("/") else endpoint
+
+def estimate_tokens(text: str) -> int:
+    # rough estimation for OpenAI tokenizers, which average about 4 characters per token for code and English
+    return (len(text) + 3) // 4
+
+
+_WORD_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_IDENTIFIER_PART_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z]|\d|\b|_)|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+@functools.lru_cache(maxsize=65536)
+def _split_identifier(word: str) -> tuple[str, ...]:
+    parts = [part.lower() for part in _IDENTIFIER_PART_PATTERN.findall(word)]
+    return (word.lower(), *parts) if len(parts) > 1 else (word.lower(),)
+
+
+def tokenize_code(text: str) -> list[str]:
+    """
+    Split the text into lowercase words, where the identifiers also yield their snake_case and camelCase parts,
+    e.g. "getHTTPResponse_code" gives "gethttpresponse_code", "get", "http", "response" and "code".
+    """
+    return [token for word in _WORD_PATTERN.findall(text) for token in _split_identifier(word)]
+
+
+def to_json(value: Any) -> Any:
+    """
+    The JSON-serializable form of the pipeline results, e.g. of documents with their meta kept nested.
+    """
+    from haystack import Document
+
+    if isinstance(value, Document):
+        return value.to_dict(flatten=False)
+    if dataclasses.is_dataclass(value):
+        return to_json(dataclasses.asdict(value))
+    if isinstance(value, dict):
+        return {name: to_json(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    return value
@@ -9,9 +9,20 @@ from e import (
 
 import f as f_alias
 
+CONSTANT = 1
+
 
 class A:
-    pass
+    """Docstring of A."""
+
+    attribute: int = 0
+
+    def method_a(self) -> int:
+        return self.attribute
+
+    @property
+    def method_b(self):
+        pass
 
 @dataclass
 class B:
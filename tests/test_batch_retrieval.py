@@ -0,0 +1,75 @@
+import asyncio
+from pathlib import Path
+
+import numpy as np
+from haystack import Document
+from haystack.document_stores.types import DuplicatePolicy
+
+from src.components.index_version import IndexVersion
+from src.components.retrieval_cache import RetrievalCache
+from src.pipelines.retrieval import CodebaseRetrieval
+from src.providers.client_pool import OpenAIClientPool
+from src.providers.document_store.memmap import MemmapProvider
+from src.providers.embedder.openai import OpenAIEmbedderProvider
+from src.tools.openai_server import LatencyDistribution, OpenAIServer, ServerConfig
+
+
+def test_run_batch_matches_run_with_batched_requests(tmp_path: Path):
+    async def run():
+        config = ServerConfig(embedding_dim=8, embedding_latency=LatencyDistribution("fixed", 0.0))
+        async with OpenAIServer(config) as server:
+            client_pool = OpenAIClientPool()
+            embedder_provider = OpenAIEmbedderProvider(
+                api_key="stand-in",
+                api_base=server.base_url,
+                dimension=8,
+                client_pool=client_pool,
+                query_cache_size=0,
+                query_batch_window=0.0,
+            )
+            document_store_provider = MemmapProvider(path=str(tmp_path), embedding_model_dim=8)
+            for dataset_name in ["code_file", "code_function", "code_class"]:
+                documents = [
+                    Document(id=f"{dataset_name}{i}", content=f"{dataset_name} {i}", meta={"path": f"{i}.py"})
+                    for i in range(20)
+                ]
+                documents = (await embedder_provider.get_document_embedder().run(documents))["documents"]
+                await document_store_provider.get_store(dataset_name=dataset_name).write_documents(
+                    documents, policy=DuplicatePolicy.OVERWRITE
+                )
+
+            retrieval = CodebaseRetrieval(
+                embedder_provider=embedder_provider,
+                document_store_provider=document_store_provider,
+                cache=RetrievalCache(index_version=IndexVersion()),
+            )
+            queries = [f"query {i % 40}" for i in range(100)]
+            requests = server.stats.requests["/v1/embeddings"]
+            batch = await retrieval.run_batch(queries, batch_size=16)
+            batch_requests = server.stats.requests["/v1/embeddings"] - requests
+            single = await CodebaseRetrieval(
+                embedder_provider=embedder_provider,
+                document_store_provider=document_store_provider,
+            ).run(queries[7])
+            cached = await retrieval.run_batch(queries[:5])
+            await client_pool.close()
+            return queries, batch, batch_requests, single, cached, server.stats.requests["/v1/embeddings"] - requests
+
+    queries, batch, batch_requests, single, cached, total_requests = asyncio.run(run())
+
+    assert len(batch) == len(queries)
+    # 40 distinct queries in batches of 16
+    assert batch_requests == 3
+    # the repeated batch is answered from the cache
+    assert total_requests == 4
+    for name in ["code_file_retrieval", "code_function_retrieval", "code_class_retrieval"]:
+        assert [document.id for document in batch[7]["construct_retrieval_results"][name]["documents"]] == [
+            document.id for document in single["construct_retrieval_results"][name]["documents"]
+        ]
+        assert [document.id for document in batch[47]["construct_retrieval_results"][name]["documents"]] == [
+            document.id for document in batch[7]["construct_retrieval_results"][name]["documents"]
+        ]
+    assert np.allclose(
+        [document.score for document in batch[0]["construct_retrieval_results"]["code_file_retrieval"]["documents"]],
+        [document.score for document in cached[0]["construct_retrieval_results"]["code_file_retrieval"]["documents"]],
+    )
@@ -0,0 +1,159 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from haystack import Document
+
+from src.pipelines.indexing import CodeClassIndexing, CodeFileIndexing, CodeFunctionIndexing, CodeParsing
+from src.providers.cassette import (
+    Cassette,
+    CassetteDocumentEmbedder,
+    CassetteGenerator,
+    CassetteLLMProvider,
+    CassetteMissError,
+    CassetteTextEmbedder,
+)
+from src.providers.client_pool import OpenAIClientPool
+from src.providers.document_store.memmap import MemmapProvider
+from src.providers.embedder.local import LocalEmbedderProvider
+from src.providers.llm.openai import OpenAILLMProvider
+from src.providers.llm.router import ModelRouter, Route
+from src.tools.openai_server import LatencyDistribution, OpenAIServer, ServerConfig
+
+
+class FakeGenerator:
+    model = "fake"
+    system_prompt = None
+    generation_kwargs = {}
+
+    def __init__(self, model: str = "fake"):
+        self.model = model
+        self.calls = 0
+
+    async def __call__(self, prompt: str, **kwargs):
+        self.calls += 1
+        return {"replies": [prompt.upper()], "meta": [{"usage": {"prompt_tokens": 1}}]}
+
+
+class FakeEmbedder:
+    model = "fake"
+    dimensions = 2
+    prefix = ""
+    suffix = ""
+    batch_size = 2
+
+    def __init__(self):
+        self.calls = 0
+
+    async def run(self, text: str):
+        self.calls += 1
+        return {"embedding": [len(text), 0.5], "meta": {}}
+
+    def _prepare_texts_to_embed(self, documents):
+        return [document.content for document in documents]
+
+    async def _embed_batch(self, texts_to_embed, batch_size):
+        self.calls += len(texts_to_embed)
+        return [[len(text), 0.5] for text in texts_to_embed], {}
+
+
+def test_record_and_replay(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    generator, embedder = FakeGenerator(), FakeEmbedder()
+
+    cassette = Cassette(path, mode="record")
+    asyncio.run(CassetteGenerator(generator, cassette).run(prompt="hello"))
+    asyncio.run(CassetteTextEmbedder(embedder, cassette).run(text="hi"))
+    asyncio.run(CassetteDocumentEmbedder(embedder, cassette).run([Document(content="a"), Document(content="bb")]))
+
+    cassette = Cassette(path, mode="replay", strict=True)
+    assert asyncio.run(CassetteGenerator(generator, cassette).run(prompt="hello"))["replies"] == ["HELLO"]
+    assert asyncio.run(CassetteTextEmbedder(embedder, cassette).run(text="hi"))["embedding"] == [2.0, 0.5]
+    documents = asyncio.run(
+        CassetteDocumentEmbedder(embedder, cassette).run([Document(content="bb"), Document(content="a")])
+    )["documents"]
+    assert [document.embedding for document in documents] == [[2.0, 0.5], [1.0, 0.5]]
+    assert generator.calls == 1
+    assert embedder.calls == 3
+
+    with pytest.raises(CassetteMissError):
+        asyncio.run(CassetteGenerator(generator, cassette).run(prompt="bye"))
+
+
+def test_auto_records_misses(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    generator = FakeGenerator()
+
+    asyncio.run(CassetteGenerator(generator, Cassette(path)).run(prompt="hello"))
+    cassette = Cassette(path)
+    asyncio.run(CassetteGenerator(generator, cassette).run(prompt="hello"))
+    asyncio.run(CassetteGenerator(generator, cassette).run(prompt="bye"))
+
+    assert generator.calls == 2
+    assert (cassette.hits, cassette.misses) == (1, 1)
+
+
+def test_routed_requests_are_keyed_on_the_route_model(tmp_path):
+    def _router(small_model: str) -> ModelRouter:
+        return ModelRouter(
+            routes=[Route(name="small", generator=FakeGenerator(small_model), max_complexity=5)],
+            default=Route(name="default", generator=FakeGenerator("large")),
+        )
+
+    path = tmp_path / "cassette.jsonl"
+    asyncio.run(CassetteGenerator(_router("small"), Cassette(path, mode="record")).run(prompt="hello", complexity=1))
+
+    cassette = Cassette(path, mode="replay", strict=True)
+    assert asyncio.run(CassetteGenerator(_router("small"), cassette).run(prompt="hello", complexity=1))["replies"] == [
+        "HELLO"
+    ]
+    # another route, or another model of the same route, is another request
+    with pytest.raises(CassetteMissError):
+        asyncio.run(CassetteGenerator(_router("small"), cassette).run(prompt="hello", complexity=10))
+    with pytest.raises(CassetteMissError):
+        asyncio.run(CassetteGenerator(_router("tiny"), cassette).run(prompt="hello", complexity=1))
+
+
+def test_replay_full_indexing_offline(tmp_path):
+    config = ServerConfig(
+        chat_latency=LatencyDistribution("fixed", 0.0),
+        chat_token_latency=0.0,
+        embedding_latency=LatencyDistribution("fixed", 0.0),
+    )
+    path = tmp_path / "cassette.jsonl"
+
+    async def index(api_base: str, cassette: Cassette, store_path: str) -> list[Document]:
+        llm = CassetteLLMProvider(
+            OpenAILLMProvider(api_key="stand-in", api_base=api_base, client_pool=OpenAIClientPool()), cassette
+        )
+        providers = {
+            "llm_provider": llm,
+            "embedder_provider": LocalEmbedderProvider(dimension=64),
+            "document_store_provider": MemmapProvider(path=store_path, embedding_model_dim=64),
+        }
+        parsed_code = CodeParsing().run(Path("tests/examples"))["parse_code"]
+        await asyncio.gather(
+            CodeClassIndexing(**providers, hierarchical=True, packing=True).run(parsed_code),
+            CodeFunctionIndexing(**providers, packing=True).run(parsed_code),
+        )
+        await CodeFileIndexing(**providers, hierarchical=True).run(parsed_code)
+        return [
+            document
+            for collection in ["code_file", "code_class", "code_function"]
+            for document in providers["document_store_provider"].get_store(dataset_name=collection).filter_documents()
+        ]
+
+    async def record() -> list[Document]:
+        async with OpenAIServer(config) as server:
+            return await index(server.base_url, Cassette(path, mode="record"), str(tmp_path / "recorded"))
+
+    recorded = asyncio.run(record())
+    # nothing listens there, so every LLM call has to be replayed
+    replayed = asyncio.run(
+        index("http://127.0.0.1:1/v1", Cassette(path, mode="replay", strict=True), str(tmp_path / "replayed"))
+    )
+
+    assert recorded and all(document.meta["index_mode"] == "summary" for document in recorded)
+    assert [(document.id, document.content) for document in replayed] == [
+        (document.id, document.content) for document in recorded
+    ]
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import orjson
+
+from src.components.index_version import IndexVersion
+
+
+def _run(args: list[str], tmp_path: Path, stdin: str = "") -> subprocess.CompletedProcess:
+    env = {
+        **os.environ,
+        "EMBEDDER_PROVIDER": "local",
+        "DOCUMENT_STORE_PROVIDER": "memmap",
+        "MEMMAP_STORE_PATH": str(tmp_path / "index" / "vectors"),
+        "EMBEDDING_MODEL_DIMENSION": "64",
+        "RETRIEVAL_CACHE": "false",
+        "LLM_OPENAI_API_KEY": "stand-in",
+        # the local embedder is not recorded, only the LLM calls, of which the fast mode makes none
+        "CASSETTE_PATH": str(tmp_path / "cassette.jsonl"),
+    }
+    return subprocess.run(
+        [sys.executable, "-m", "src.main", "--index-path", str(tmp_path / "index"), *args],
+        input=stdin,
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+        timeout=120,
+    )
+
+
+def test_query_reuses_the_index(tmp_path: Path):
+    indexed = _run(["index", "tests/examples", "--fast"], tmp_path)
+    assert "Indexed 1 files" in indexed.stdout
+    assert (tmp_path / "index" / "symbol_table.json").exists()
+    assert (tmp_path / "index" / "dependency_graph.npz").exists()
+    # the version of the index is kept next to it, so it invalidates the results cached by the other processes
+    assert IndexVersion(tmp_path / "index" / "index_version.sqlite").get() > 0
+
+    one_shot = _run(["query", "--json", "How is the code parsed?", "Which class holds the settings?"], tmp_path)
+    results = [orjson.loads(line) for line in one_shot.stdout.splitlines()]
+    assert len(results) == 2
+    assert results[0]["construct_retrieval_results"]["code_file_retrieval"]["documents"]
+    assert results[0]["assemble_context"]["context"]
+    # the router learned from the session
+    assert (tmp_path / "index" / "level_router.npz").exists()
+
+    piped = _run(["query", "--json"], tmp_path, stdin="How is the code parsed?\n\nexit\nnot asked\n")
+    assert [orjson.loads(line) for line in piped.stdout.splitlines()] == results[:1]
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+from src.providers.client_pool import OpenAIClientPool
+from src.tools.openai_server import LatencyDistribution, OpenAIServer, ServerConfig
+
+
+def test_share_connection_pool_per_endpoint():
+    client_pool = OpenAIClientPool(max_connections=10)
+
+    llm_client = client_pool.get_client(api_key="llm", base_url="https://api.openai.com/v1/")
+    embedder_client = client_pool.get_client(api_key="embedder", base_url="https://api.openai.com/v1")
+    local_client = client_pool.get_client(api_key="llm", base_url="http://localhost:8000/v1")
+
+    assert client_pool.get_client(api_key="llm", base_url="https://api.openai.com/v1") is llm_client
+    assert llm_client is not embedder_client
+    assert llm_client._client is embedder_client._client
+    assert llm_client._client is not local_client._client
+    assert client_pool.stats()["https://api.openai.com/v1"]["max_connections"] == 10
+
+
+async def _shutdown(server: OpenAIServer) -> None:
+    await server.close()
+    # the connections of the clients are kept alive, so their handlers are still reading
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_clients_outlive_the_event_loop():
+    # the server runs in its own loop, so the clients are used from one asyncio.run after another
+    loop = asyncio.new_event_loop()
+    config = ServerConfig(embedding_latency=LatencyDistribution("fixed", 0.0))
+    server = loop.run_until_complete(OpenAIServer(config).start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    client_pool = OpenAIClientPool()
+    client = client_pool.get_client(api_key="stand-in", base_url=server.base_url)
+    try:
+        for _ in range(2):
+            embeddings = asyncio.run(client.embeddings.create(model="text-embedding-3-large", input="a"))
+            assert len(embeddings.data) == 1
+        assert client_pool.stats()[server.base_url]["requests"] == 2
+    finally:
+        asyncio.run_coroutine_threadsafe(_shutdown(server), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -0,0 +1,51 @@
+from src.components.code_minifier import CodeMinifier
+
+
+CODE = '''# Copyright (c) 2024 Example
+# Licensed under the MIT License
+
+
+def load():
+    """Load the table."""
+    # the table is sorted by key
+    table = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+
+    message = "%s"
+    return table, message
+''' % ("x" * 100)
+
+
+def test_minify():
+    code_minifier = CodeMinifier(max_literal_length=10, max_collection_items=3, strip_license_header=True)
+
+    assert code_minifier.minify(CODE) == '\n'.join([
+        'def load():',
+        ' """Load the table."""',
+        ' table = [1, 2, 3, ... (7 more)]',
+        ' message = "xxxxxxxxxx..."',
+        ' return table, message',
+    ])
+
+
+def test_keep_comments_and_license_header():
+    code_minifier = CodeMinifier(comments="keep", collapse_whitespace=False)
+
+    minified = code_minifier.minify(CODE)
+    assert minified.startswith('# Copyright (c) 2024 Example')
+    assert '    # the table is sorted by key' in minified
+
+
+def test_report_saved_tokens():
+    code_minifier = CodeMinifier()
+
+    result = code_minifier.run(contents=[CODE, CODE])
+    assert result["minified_tokens"] < result["original_tokens"]
+    assert code_minifier.original_tokens == result["original_tokens"]
+    assert code_minifier.minified_tokens == result["minified_tokens"]
+
+
+def test_shorten_non_ascii_on_character_boundaries():
+    code_minifier = CodeMinifier(comments="shorten", max_comment_length=11, max_literal_length=10)
+
+    assert code_minifier.minify('x = "a' + 'é' * 100 + '"\n') == 'x = "a' + 'é' * 9 + '..."'
+    assert code_minifier.minify('# ' + '代码' * 50 + '\ny = 1\n') == '# ' + '代码' * 4 + '代...\ny = 1'
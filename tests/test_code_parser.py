@@ -23,3 +23,84 @@ def test_parse(code_path: Path):
     for global_function in code_files[0].global_functions:
         assert global_function.content.startswith('def ')
     assert [global_function.name for global_function in code_files[0].global_functions] == ['fun_a']
+
+
+def test_parse_class_methods(code_path: Path):
+    code_parser = CodeParser()
+    global_class = code_parser.parse(code_path)[0].global_classes[0]
+
+    assert global_class.docstring == 'Docstring of A.'
+    assert [method.name for method in global_class.methods] == ['method_a', 'method_b']
+    assert global_class.methods[0].signature == 'def method_a(self) -> int:'
+    assert 'return self.attribute' not in global_class.signature
+    assert 'attribute: int = 0' in global_class.signature
+    assert 'def method_b(self):\n        ...' in global_class.signature
+
+
+def test_parse_module_code(code_path: Path):
+    code_parser = CodeParser()
+    code_file = code_parser.parse(code_path)[0]
+
+    assert code_file.module_code == ['CONSTANT = 1']
+    assert code_file.global_functions[0].signature == 'def fun_a():'
+
+
+def test_parse_symbol_ids(code_path: Path):
+    code_parser = CodeParser()
+    code_file = code_parser.parse(code_path)[0]
+
+    assert code_file.global_classes[0].id == 'tests/examples/test.py::A'
+    assert code_file.global_classes[0].methods[1].id == 'tests/examples/test.py::A.method_b'
+    assert code_file.global_classes[0].methods[1].decorators == ['@property']
+    assert code_file.global_classes[1].decorators == ['@dataclass']
+    assert code_file.global_functions[0].id == 'tests/examples/test.py::fun_a'
+
+
+def test_parse_complexity(tmp_path: Path):
+    (tmp_path / 'complex.py').write_text(
+        'def f(x):\n'
+        '    if x and x > 1:\n'
+        '        return [i for i in range(x) if i]\n'
+        '    return x\n'
+        '\n'
+        'def g():\n'
+        '    pass\n'
+    )
+    code_parser = CodeParser()
+    code_file = code_parser.parse(tmp_path)[0]
+
+    assert [global_function.complexity for global_function in code_file.global_functions] == [5, 1]
+    assert code_file.complexity == 5
+
+
+def test_parse_line_spans_and_aliases(tmp_path: Path):
+    (tmp_path / 'spans.py').write_text(
+        'class A:\n'
+        '    def f(self):\n'
+        '        pass\n'
+        '\n'
+        '\n'
+        'def g():\n'
+        '    pass\n'
+        '\n'
+        'h = g\n'
+    )
+    code_parser = CodeParser()
+    code_file = code_parser.parse(tmp_path)[0]
+
+    assert (code_file.global_classes[0].start_line, code_file.global_classes[0].end_line) == (1, 3)
+    assert (code_file.global_classes[0].methods[0].start_line, code_file.global_classes[0].methods[0].end_line) == (2, 3)
+    assert (code_file.global_functions[0].start_line, code_file.global_functions[0].end_line) == (6, 7)
+    assert code_file.aliases == {'h': 'g'}
+
+
+def test_parse_relative_and_aliased_imports(tmp_path: Path):
+    (tmp_path / 'relative.py').write_text(
+        'from . import a\n'
+        'from .b import c as d\n'
+        'from ..e import *\n'
+    )
+    code_parser = CodeParser()
+    code_file = code_parser.parse(tmp_path)[0]
+
+    assert code_file.imports == ['.a', '.b.c', '..e']
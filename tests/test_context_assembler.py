@@ -0,0 +1,138 @@
+from pathlib import Path
+
+from haystack import Document
+
+from src.components.code_parser import CodeParser
+from src.components.context_assembler import ContextAssembler
+from src.utils import estimate_tokens
+
+
+SOURCE = """import re
+
+from app import config
+
+_PATTERN = re.compile(r"[a-z]+")
+
+
+def load(path):
+    \"\"\"Load the settings of the path.\"\"\"
+    with open(path) as f:
+        return parse(f.read())
+
+
+def parse(text):
+    settings = {}
+    for line in text.splitlines():
+        key, _, value = line.partition("=")
+        settings[key.strip()] = value.strip()
+    return settings
+
+
+def words(text):
+    return _PATTERN.findall(text)
+
+
+class Settings:
+    def __init__(self, path):
+        self.values = load(path)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+""" + "\n# padding\n" * 500
+
+
+def _retrieval_results(tmp_path: Path) -> dict:
+    (tmp_path / "settings.py").write_text(SOURCE)
+    code = CodeParser().parse(tmp_path)[0]
+    path = str(code.path)
+    file_document = Document(
+        id=path,
+        content="The settings module.",
+        meta={"path": path, "raw_data": code.content},
+        score=0.5,
+    )
+    function_documents = [
+        Document(
+            id=function.id,
+            content=f"Summary of {function.name}.",
+            meta={
+                "path": path,
+                "name": function.name,
+                "raw_data": function.content,
+                "signature": function.signature,
+                "start_line": function.start_line,
+                "end_line": function.end_line,
+            },
+            score=0.8 - 0.1 * i,
+        )
+        for i, function in enumerate(code.global_functions)
+    ]
+    class_document = Document(
+        id=code.global_classes[-1].id,
+        content="Summary of Settings.",
+        meta={
+            "path": path,
+            "name": code.global_classes[-1].name,
+            "raw_data": code.global_classes[-1].content,
+            "signature": code.global_classes[-1].signature,
+            "start_line": code.global_classes[-1].start_line,
+            "end_line": code.global_classes[-1].end_line,
+        },
+        score=0.6,
+    )
+    return {
+        "code_file_retrieval": {"documents": [file_document]},
+        "code_function_retrieval": {"documents": function_documents},
+        "code_class_retrieval": {"documents": [class_document]},
+        "dependency_expansion": {
+            "documents": [
+                Document(
+                    id="src/components/code_parser.py",
+                    meta={"path": "src/components/code_parser.py", "relation": "imports", "hops": 1},
+                )
+            ]
+        },
+    }, code
+
+
+def test_nested_hits_are_included_once(tmp_path: Path):
+    retrieval_results, code = _retrieval_results(tmp_path)
+    result = ContextAssembler().run(retrieval_results, max_tokens=100_000)
+
+    assert [item.form for item in result["items"]] == ["full", "reference"]
+    assert result["items"][0].start_line == 1
+    assert result["context"].count("def parse(") == 1
+    # the file and every function and class within it are retrieved, but the file source is included once
+    assert result["tokens"] < result["retrieved_tokens"]
+    assert result["context"].endswith("# src/components/code_parser.py (imports, 1 hops)")
+
+
+def test_adjacent_hits_are_merged(tmp_path: Path):
+    retrieval_results, code = _retrieval_results(tmp_path)
+    retrieval_results["code_file_retrieval"]["documents"] = []
+    result = ContextAssembler().run(retrieval_results, max_tokens=100_000)
+
+    # load, parse, words and Settings are two blank lines apart
+    start_line, end_line = code.global_functions[0].start_line, code.global_classes[-1].end_line
+    assert len(result["items"]) == 2
+    merged = result["items"][0]
+    assert (merged.start_line, merged.end_line) == (start_line, end_line)
+    assert merged.form == "full"
+    assert "\n".join(merged.text.splitlines()[1:]) == "\n".join(code.content.splitlines()[start_line - 1 : end_line])
+
+
+def test_packs_within_budget(tmp_path: Path):
+    retrieval_results, code = _retrieval_results(tmp_path)
+    for max_tokens in [40, 200, 1000]:
+        result = ContextAssembler().run(retrieval_results, max_tokens=max_tokens)
+        assert result["tokens"] <= max_tokens
+        assert sum(estimate_tokens(item.text) + 1 for item in result["items"]) == result["tokens"]
+
+    # the file does not fit, so its summary comes with the source of the best nested hits
+    result = ContextAssembler().run(retrieval_results, max_tokens=1000)
+    assert result["items"][0].form == "partial"
+    assert "The settings module." in result["context"]
+    assert "def load(" in result["context"]
+    # the summaries only
+    result = ContextAssembler().run(retrieval_results, max_tokens=40)
+    assert result["items"][0].form in ("summary", "reference")
@@ -0,0 +1,97 @@
+import asyncio
+from pathlib import Path
+
+import numpy as np
+
+from src.components.code_parser import CodeParser
+from src.components.dependency_graph import DependencyGraph
+from src.components.symbol_table import SymbolTable
+from src.pipelines.retrieval import CodebaseRetrieval
+from src.providers.document_store.memmap import MemmapProvider
+from src.providers.embedder.local import LocalEmbedderProvider
+
+
+def _parse(tmp_path: Path):
+    package = tmp_path / 'app'
+    (package / 'core').mkdir(parents=True)
+    (package / '__init__.py').write_text('')
+    (package / 'core' / '__init__.py').write_text('from .models import Model\n')
+    (package / 'core' / 'models.py').write_text('import os\n\nclass Model:\n    pass\n')
+    (package / 'core' / 'store.py').write_text('from . import models\nfrom ..utils import helper\n')
+    (package / 'utils.py').write_text('def helper():\n    pass\n')
+    (package / 'service.py').write_text('from app.core.store import *\nimport app.utils\n')
+    return CodeParser().parse(tmp_path)
+
+
+def test_build_resolves_imports(tmp_path: Path):
+    graph = DependencyGraph.build(_parse(tmp_path))
+    root = str(tmp_path / 'app')
+
+    assert graph.imports(f'{root}/core/store.py') == [f'{root}/core/models.py', f'{root}/utils.py']
+    assert graph.imports(f'{root}/core/__init__.py') == [f'{root}/core/models.py']
+    assert graph.imports(f'{root}/service.py') == [f'{root}/core/store.py', f'{root}/utils.py']
+    # the standard library is not in the graph
+    assert graph.imports(f'{root}/core/models.py') == []
+    assert sorted(graph.importers(f'{root}/utils.py')) == [f'{root}/core/store.py', f'{root}/service.py']
+    assert graph.edges == 5
+
+
+def test_other_packages_are_not_resolved_to_local_modules(tmp_path: Path):
+    package = tmp_path / 'app'
+    (package / 'clients').mkdir(parents=True)
+    (package / '__init__.py').write_text('')
+    (package / 'clients' / '__init__.py').write_text('')
+    (package / 'clients' / 'openai.py').write_text('import openai\n\nclient = openai.OpenAI()\n')
+    (package / 'retry.py').write_text('import openai\nfrom openai import AsyncOpenAI\n')
+    (package / 'service.py').write_text('from app.clients import openai\nfrom .clients.openai import client\n')
+    graph = DependencyGraph.build(CodeParser().parse(package))
+    root = str(tmp_path / 'app')
+
+    assert graph.imports(f'{root}/clients/openai.py') == []
+    assert graph.imports(f'{root}/retry.py') == []
+    assert graph.imports(f'{root}/service.py') == [f'{root}/clients/openai.py']
+
+
+def test_expand_and_reload(tmp_path: Path):
+    graph = DependencyGraph.build(_parse(tmp_path))
+    root = str(tmp_path / 'app')
+
+    assert graph.expand([f'{root}/core/store.py'], hops=1) == {
+        f'{root}/core/models.py': ('imports', 1),
+        f'{root}/utils.py': ('imports', 1),
+        f'{root}/service.py': ('imported_by', 1),
+    }
+    assert graph.expand([f'{root}/service.py'], hops=2, direction='imports') == {
+        f'{root}/core/store.py': ('imports', 1),
+        f'{root}/utils.py': ('imports', 1),
+        f'{root}/core/models.py': ('imports', 2),
+    }
+
+    graph.save(tmp_path / 'graph.npz')
+    loaded = DependencyGraph.load(tmp_path / 'graph.npz')
+    assert loaded.paths == graph.paths
+    assert loaded._indices.dtype == np.int32
+    assert loaded.expand([f'{root}/core/store.py'], hops=1) == graph.expand([f'{root}/core/store.py'], hops=1)
+
+
+def test_retrieval_expands_dependencies(tmp_path: Path):
+    parsed_code = _parse(tmp_path)
+    retrieval = CodebaseRetrieval(
+        embedder_provider=LocalEmbedderProvider(dimension=64),
+        document_store_provider=MemmapProvider(path=str(tmp_path / 'vectors'), embedding_model_dim=64),
+        symbol_table=SymbolTable.build(parsed_code),
+        dependency_graph=DependencyGraph.build(parsed_code),
+    )
+
+    results = asyncio.run(retrieval.run('helper'))['construct_retrieval_results']
+    assert results['dependency_expansion']['documents'] == []
+
+    results = asyncio.run(retrieval.run('helper', expand_hops=1))['construct_retrieval_results']
+    expanded = {document.meta['path']: document.meta['relation'] for document in results['dependency_expansion']['documents']}
+    assert expanded == {
+        str(tmp_path / 'app' / 'core' / 'store.py'): 'imported_by',
+        str(tmp_path / 'app' / 'service.py'): 'imported_by',
+    }
+
+    results = asyncio.run(retrieval.run('what does the service do', expand_hops=1))['construct_retrieval_results']
+    assert results['dependency_expansion'] == {'documents': []}
@@ -0,0 +1,64 @@
+import asyncio
+
+import numpy as np
+from haystack import Document
+from haystack.document_stores.types import DuplicatePolicy
+
+from src.components.sparse_encoder import SparseEncoder
+from src.providers.document_store.memmap import MemmapProvider
+
+
+def test_sparse_encoder_splits_identifiers():
+    encoder = SparseEncoder()
+    query = encoder.encode_query("where is parseHTTPResponse")
+    document = encoder.encode_document(
+        Document(content="", meta={"name": "parse_http_response", "raw_data": "def parse_http_response(raw): ..."})
+    )
+
+    matched = set(query.indices) & set(document.indices)
+    assert {encoder._index(word) for word in ["parse", "http", "response"]} <= matched
+    assert all(value > 0 for value in document.values)
+
+
+def test_hybrid_search_ranks_exact_identifier_first(tmp_path):
+    provider = MemmapProvider(path=str(tmp_path), embedding_model_dim=4, hybrid_search=True)
+    store = provider.get_store(dataset_name="code_function")
+    retriever = provider.get_retriever(store, top_k=3)
+    encoder = provider.get_sparse_encoder()
+
+    names = ["load_config", "save_config", "retry_request", "render_template", "build_index", "flush_cache"]
+    # the dense vectors all point the same way, so only the sparse vectors tell the documents apart
+    documents = [
+        Document(
+            id=name,
+            content=f"summary of {name}",
+            meta={"name": name, "path": "src/app.py", "raw_data": f"def {name}(): ..."},
+            embedding=(np.ones(4) + 0.01 * i).tolist(),
+        )
+        for i, name in enumerate(names)
+    ]
+    encoder.run(documents=documents)
+
+    async def run():
+        await store.write_documents(documents, policy=DuplicatePolicy.OVERWRITE)
+        query_embedding = np.ones(4).tolist()
+        dense = await retriever.run(query_embedding=query_embedding)
+        hybrid = await retriever.run(
+            query_embedding=query_embedding,
+            query_sparse_embedding=encoder.encode_query("retryRequest"),
+        )
+        return dense["documents"], hybrid["documents"]
+
+    dense, hybrid = asyncio.run(run())
+
+    assert dense[0].id != "retry_request"
+    assert hybrid[0].id == "retry_request"
+    assert len(hybrid) == 3
+
+    reopened = MemmapProvider(path=str(tmp_path), embedding_model_dim=4, hybrid_search=True).get_store(
+        dataset_name="code_function"
+    )
+    reopened_hybrid = asyncio.run(
+        reopened._query_hybrid(np.ones(4).tolist(), encoder.encode_query("flush cache"), top_k=1)
+    )
+    assert reopened_hybrid[0].id == "flush_cache"
@@ -0,0 +1,132 @@
+import asyncio
+from pathlib import Path
+
+import numpy as np
+from haystack import Document
+from haystack.document_stores.types import DuplicatePolicy
+
+from src.components.level_router import COLLECTIONS, LevelRouter
+from src.pipelines.retrieval import CodebaseRetrieval
+from src.providers.document_store.memmap import MemmapProvider
+from src.providers.embedder.local import LocalEmbedderProvider
+
+
+def _clusters(rng: np.random.Generator, size: int) -> tuple[np.ndarray, list[list[float]], list[str]]:
+    centers = rng.normal(size=(len(COLLECTIONS), 16))
+    embeddings, collections = [], []
+    for i, collection in enumerate(COLLECTIONS):
+        for _ in range(size):
+            embeddings.append((centers[i] + 0.3 * rng.normal(size=16)).tolist())
+            collections.append(collection)
+    return centers, embeddings, collections
+
+
+def test_rules():
+    router = LevelRouter(top_k=5)
+
+    assert router.route("which file configures Qdrant").top_k == {"code_file": 5}
+    route = router.route("what does the `_traverse` helper do")
+    assert (route.source, route.top_k) == ("rule", {"code_function": 5, "code_class": 5})
+    assert router.route("what inherits from BasicPipeline").top_k == {"code_class": 5}
+    # nothing to go by before the classifier has seen enough examples
+    route = router.route("how are the documents ranked", np.ones(16).tolist())
+    assert (route.source, set(route.top_k)) == ("fallback", set(COLLECTIONS))
+    assert router.metrics.to_dict()["routes"] == {"rule": 3, "classifier": 0, "fallback": 1}
+
+
+def test_classifier_routes_confident_queries_only():
+    rng = np.random.default_rng(0)
+    centers, embeddings, collections = _clusters(rng, 30)
+    router = LevelRouter(top_k=6, audit_rate=0.0).fit(embeddings, collections)
+
+    route = router.route("how are the documents ranked", (centers[1] + 0.3 * rng.normal(size=16)).tolist())
+    assert route.source == "classifier"
+    assert route.confidence >= 0.7
+    assert next(iter(route.top_k)) == "code_function"
+    assert route.top_k["code_function"] == 6
+
+    # as similar to every centroid
+    centroids = router._sums / np.linalg.norm(router._sums, axis=1, keepdims=True)
+    vector = rng.normal(size=16)
+    vector -= centroids.T @ np.linalg.lstsq(centroids.T, vector, rcond=None)[0]
+    route = router.route("how are the documents ranked", vector.tolist())
+    assert route.source == "fallback"
+
+    # the calibrated probabilities are about as confident as the classifier is accurate
+    _, test_embeddings, test_collections = _clusters(np.random.default_rng(0), 30)
+    probabilities = router._probabilities(np.stack([router._normalize(embedding) for embedding in test_embeddings]))
+    accuracy = np.mean(np.array(COLLECTIONS)[probabilities.argmax(axis=0)] == np.array(test_collections))
+    assert abs(probabilities.max(axis=0).mean() - accuracy) < 0.1
+
+
+def test_learns_from_fallback_searches_and_audits_routes():
+    rng = np.random.default_rng(1)
+    centers, embeddings, collections = _clusters(rng, 20)
+    router = LevelRouter(audit_rate=0.5, min_examples=20, use_rules=False)
+
+    for embedding, collection in zip(embeddings, collections):
+        route = router.route("query", embedding)
+        assert route.source == "fallback"
+        results = {c: {"documents": [Document(content="", score=0.9 if c == collection else 0.5)]} for c in COLLECTIONS}
+        router.observe(route, embedding, results)
+    assert router.trained
+
+    routes = [router.route("query", (centers[2] + 0.1 * rng.normal(size=16)).tolist()) for _ in range(4)]
+    assert [route.audit for route in routes] == [False, True, False, True]
+    for route in routes:
+        router.observe(route, None, {"code_class": {"documents": [Document(content="", score=0.9)]}})
+    assert router.metrics.to_dict()["hit_rate"] == 1.0
+
+
+def test_load_discards_a_router_of_another_dimension(tmp_path: Path):
+    _, embeddings, collections = _clusters(np.random.default_rng(2), 20)
+    LevelRouter().fit(embeddings, collections).save(tmp_path / "level_router.npz")
+
+    assert LevelRouter().load(tmp_path / "level_router.npz", dimension=16).trained
+    # e.g. after switching the embedder, the classifier would compare vectors of different sizes
+    assert not LevelRouter().load(tmp_path / "level_router.npz", dimension=8).trained
+
+
+def test_routed_retrieval_skips_searches(tmp_path: Path):
+    embedder_provider = LocalEmbedderProvider(dimension=64)
+    document_store_provider = MemmapProvider(path=str(tmp_path), embedding_model_dim=64)
+    searches = []
+
+    async def run():
+        for dataset_name in COLLECTIONS:
+            documents = [
+                Document(id=f"{dataset_name}{i}", content=f"{dataset_name} {i}", meta={"path": f"{i}.py"})
+                for i in range(10)
+            ]
+            documents = (await embedder_provider.get_document_embedder().run(documents))["documents"]
+            await document_store_provider.get_store(dataset_name=dataset_name).write_documents(
+                documents, policy=DuplicatePolicy.OVERWRITE
+            )
+
+        retrieval = CodebaseRetrieval(
+            embedder_provider=embedder_provider,
+            document_store_provider=document_store_provider,
+            level_router=LevelRouter(top_k=2, audit_rate=0.0),
+        )
+        for collection in COLLECTIONS:
+            retriever = retrieval._components[f"{collection}_retriever"]
+
+            async def _run(retriever=retriever, collection=collection, **kwargs):
+                searches.append(collection)
+                return await type(retriever).run(retriever, **kwargs)
+
+            retrieval._components[f"{collection}_retriever"] = type(
+                "CountingRetriever", (), {"run": staticmethod(_run)}
+            )()
+
+        routed = await retrieval.run("which file embeds the documents")
+        fallback = await retrieval.run("how are the documents embedded")
+        return routed["construct_retrieval_results"], fallback["construct_retrieval_results"]
+
+    routed, fallback = asyncio.run(run())
+
+    assert searches[0] == "code_file"
+    assert sorted(searches[1:]) == sorted(COLLECTIONS)
+    assert len(routed["code_file_retrieval"]["documents"]) == 2
+    assert routed["code_function_retrieval"]["documents"] == []
+    assert all(len(fallback[f"{collection}_retrieval"]["documents"]) == 2 for collection in COLLECTIONS)
@@ -0,0 +1,39 @@
+import asyncio
+
+import numpy as np
+from haystack import Document
+
+from src.providers.embedder.local import LocalEmbedderProvider
+from src.utils import tokenize_code
+
+
+def test_tokenize_code():
+    assert tokenize_code("getHTTPResponse_code(x)") == [
+        "gethttpresponse_code",
+        "get",
+        "http",
+        "response",
+        "code",
+        "x",
+    ]
+
+
+def test_local_embedder():
+    embedder_provider = LocalEmbedderProvider(dimension=256)
+    documents = [
+        Document(content="def parse_code(path): return CodeParser().parse(path)"),
+        Document(content="def send_email(address, body): smtp.send(address, body)"),
+    ]
+
+    async def run():
+        documents_result = await embedder_provider.get_document_embedder().run(documents)
+        query_result = await embedder_provider.get_text_embedder().run("how is the code parsed?")
+        return documents_result["documents"], query_result["embedding"]
+
+    embedded, query_embedding = asyncio.run(run())
+    document_embeddings = np.array([document.embedding for document in embedded])
+
+    assert document_embeddings.shape == (2, 256)
+    assert np.allclose(np.linalg.norm(document_embeddings, axis=1), 1.0)
+    similarities = document_embeddings @ np.array(query_embedding)
+    assert similarities[0] > similarities[1]
@@ -0,0 +1,133 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+from haystack import Document
+from haystack.document_stores.types import DuplicatePolicy
+
+from src.providers.document_store.memmap import MemmapProvider
+
+
+def _documents(n: int, dimension: int = 8) -> list[Document]:
+    embeddings = np.eye(dimension)[np.arange(n) % dimension] + 0.01
+    return [
+        Document(
+            id=f"doc{i}",
+            content=f"def f{i}(): pass",
+            meta={"path": f"src/{i % 2}.py", "name": f"f{i}"},
+            embedding=embeddings[i].tolist(),
+        )
+        for i in range(n)
+    ]
+
+
+def test_write_query_and_delete(tmp_path):
+    store = MemmapProvider(path=str(tmp_path), embedding_model_dim=8).get_store(dataset_name="code_function")
+
+    async def run():
+        await store.write_documents(_documents(6), policy=DuplicatePolicy.OVERWRITE)
+        await store.write_documents(
+            [Document(id="doc1", content="def g(): pass", meta={"path": "src/1.py"}, embedding=np.eye(8)[1].tolist())],
+            policy=DuplicatePolicy.OVERWRITE,
+        )
+        top = await store._query_by_embedding(np.eye(8)[1].tolist(), top_k=2)
+        filtered = await store._query_by_embeddings(
+            [np.eye(8)[1].tolist(), np.eye(8)[2].tolist()],
+            filters={"field": "meta.path", "operator": "==", "value": "src/0.py"},
+            top_k=1,
+        )
+        await store.delete_documents({"field": "name", "operator": "in", "value": ["f0", "f2"]})
+        return top, filtered, await store.count_documents()
+
+    top, filtered, count = asyncio.run(run())
+
+    assert top[0].id == "doc1"
+    assert top[0].content == "def g(): pass"
+    assert "name" not in top[0].meta
+    assert top[0].score > top[1].score
+    assert [documents[0].id for documents in filtered] == ["doc0", "doc2"]
+    assert count == 4
+
+    reopened = MemmapProvider(path=str(tmp_path), embedding_model_dim=8).get_store(dataset_name="code_function")
+    assert asyncio.run(reopened.count_documents({"field": "path", "operator": "==", "value": "src/1.py"})) == 3
+
+
+def test_float16_vectors(tmp_path):
+    store = MemmapProvider(
+        path=str(tmp_path), embedding_model_dim=8, vector_dimension=4, vector_datatype="float16"
+    ).get_store()
+
+    async def run():
+        await store.write_documents(_documents(4))
+        return await store._query_by_embedding(np.eye(8)[3].tolist(), top_k=1)
+
+    assert asyncio.run(run())[0].id == "doc3"
+
+
+def test_writes_append_to_the_payload_log(tmp_path):
+    store = MemmapProvider(path=str(tmp_path), embedding_model_dim=8).get_store(dataset_name="code_function")
+    log_path = tmp_path / "code_function" / "payloads.0.jsonl"
+
+    async def run():
+        sizes = []
+        for documents in [_documents(4)[:2], _documents(4)[2:]]:
+            await store.write_documents(documents)
+            sizes.append(log_path.stat().st_size)
+        # an upsert appends the replaced row, a delete only rewrites the header
+        await store.write_documents(
+            [Document(id="doc1", content="def g(): pass", embedding=np.eye(8)[1].tolist())],
+            policy=DuplicatePolicy.OVERWRITE,
+        )
+        sizes.append(log_path.stat().st_size)
+        await store.delete_documents({"field": "id", "operator": "==", "value": "doc3"})
+        sizes.append(log_path.stat().st_size)
+        return sizes
+
+    sizes = asyncio.run(run())
+
+    assert sizes[0] < sizes[1] < sizes[2] == sizes[3]
+    assert log_path.read_bytes().count(b"\n") == 5
+    # a write that did not finish is past the bytes counted by the header, so it is not read
+    with open(log_path, "ab") as f:
+        f.write(b'[0, {"id": "doc0", "conte')
+
+    reopened = MemmapProvider(path=str(tmp_path), embedding_model_dim=8).get_store(dataset_name="code_function")
+    documents = {document.id: document for document in reopened.filter_documents()}
+    assert sorted(documents) == ["doc0", "doc1", "doc2"]
+    assert documents["doc1"].content == "def g(): pass"
+    assert "name" not in documents["doc1"].meta
+    assert documents["doc2"].meta["name"] == "f2"
+
+
+def test_compaction_is_committed_by_the_header(tmp_path, monkeypatch):
+    store = MemmapProvider(path=str(tmp_path), embedding_model_dim=8).get_store(dataset_name="code_function")
+    asyncio.run(store.write_documents(_documents(8)))
+
+    os_replace = os.replace
+
+    def replace(src, dst):
+        # a crash right before the header naming the compacted files is written
+        if str(dst).endswith("header.json"):
+            raise OSError("crashed")
+        os_replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", replace)
+    with pytest.raises(OSError):
+        asyncio.run(store.delete_documents({"field": "id", "operator": "in", "value": ["doc0", "doc1", "doc2"]}))
+    monkeypatch.undo()
+
+    reopened = MemmapProvider(path=str(tmp_path), embedding_model_dim=8).get_store(dataset_name="code_function")
+    assert asyncio.run(reopened.count_documents()) == 8
+    assert asyncio.run(reopened._query_by_embedding(np.eye(8)[5].tolist(), top_k=1))[0].id == "doc5"
+
+    asyncio.run(reopened.delete_documents({"field": "id", "operator": "in", "value": ["doc0", "doc1", "doc2"]}))
+    reopened = MemmapProvider(path=str(tmp_path), embedding_model_dim=8).get_store(dataset_name="code_function")
+    assert asyncio.run(reopened.count_documents()) == 5
+    assert asyncio.run(reopened._query_by_embedding(np.eye(8)[5].tolist(), top_k=1))[0].id == "doc5"
+    # only the files of the committed generation are left
+    assert sorted(path.name for path in (tmp_path / "code_function").iterdir()) == [
+        "header.json",
+        "payloads.2.jsonl",
+        "vectors.1.npy",
+    ]
@@ -0,0 +1,75 @@
+import asyncio
+
+from src.providers.client_pool import OpenAIClientPool
+from src.providers.llm.openai import OpenAILLMProvider
+from src.providers.llm.router import ModelRouter, Route
+from src.tools.openai_server import LatencyDistribution, OpenAIServer, ServerConfig
+
+
+class FakeGenerator:
+    def __init__(self, model: str):
+        self.model = model
+
+    async def __call__(self, prompt: str, **kwargs):
+        return {
+            "replies": [self.model],
+            "meta": [{"usage": {"prompt_tokens": 10, "completion_tokens": 2}}],
+        }
+
+
+def _router(level: str) -> ModelRouter:
+    return ModelRouter(
+        routes=[
+            Route(name="small", generator=FakeGenerator("small"), levels=["function"], max_prompt_tokens=100, max_complexity=5),
+            Route(name="file", generator=FakeGenerator("file"), levels=["file"]),
+        ],
+        default=Route(name="default", generator=FakeGenerator("default")),
+        level=level,
+    )
+
+
+def test_route_by_level_tokens_and_complexity():
+    router = _router("function")
+
+    assert router.route("def f(): pass", complexity=1).name == "small"
+    assert router.route("def f(): pass", complexity=10).name == "default"
+    assert router.route("x" * 1000, complexity=1).name == "default"
+    assert _router("file").route("x" * 1000).name == "file"
+    assert _router("class").route("def f(): pass").name == "default"
+
+
+def test_route_metrics():
+    router = _router("function")
+
+    result = asyncio.run(router.run(prompt="def f(): pass", complexity=1))
+    asyncio.run(router.run(prompt="def f(): pass", complexity=10))
+
+    assert result["replies"] == ["small"]
+    assert result["meta"][0]["route"] == "small"
+    metrics = router.metrics()
+    assert metrics["small"]["calls"] == 1
+    assert metrics["small"]["prompt_tokens"] == 10
+    assert metrics["default"]["calls"] == 1
+    assert metrics["file"]["calls"] == 0
+
+
+def test_provider_shares_route_metrics_across_generators():
+    config = ServerConfig(chat_latency=LatencyDistribution("fixed", 0.0), chat_token_latency=0.0)
+
+    async def run():
+        async with OpenAIServer(config) as server:
+            provider = OpenAILLMProvider(
+                api_key="stand-in",
+                api_base=server.base_url,
+                routes=[{"name": "small", "levels": ["function"]}],
+                client_pool=OpenAIClientPool(),
+            )
+            for level in ["function", "function", "class"]:
+                await provider.get_generator(system_prompt=f"Summarize the {level}.", level=level)(prompt="x = 1")
+            return provider.get_route_metrics()
+
+    metrics = asyncio.run(run())
+
+    assert metrics["small"]["calls"] == 2
+    assert metrics["small"]["prompt_tokens"] > 0
+    assert metrics["default"]["calls"] == 1
@@ -0,0 +1,125 @@
+import asyncio
+
+import openai
+import orjson
+import pytest
+from openai import AsyncOpenAI
+
+from src.components.summary_packer import PACKED_GENERATION_MODEL_KWARGS
+from src.pipelines.indexing.code_function_indexing import GENERATION_MODEL_KWARGS
+from src.tools.openai_server import MAX_BODY_SIZE, LatencyDistribution, OpenAIServer, ServerConfig
+
+
+def _config(**kwargs) -> ServerConfig:
+    return ServerConfig(
+        embedding_dim=8,
+        chat_latency=LatencyDistribution("fixed", 0.0),
+        chat_token_latency=0.0,
+        embedding_latency=LatencyDistribution("fixed", 0.0),
+        **kwargs,
+    )
+
+
+def test_chat_completions_and_embeddings():
+    async def run():
+        async with OpenAIServer(_config()) as server:
+            client = AsyncOpenAI(api_key="stand-in", base_url=server.base_url)
+            summary = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": "def f(): pass"}],
+                **GENERATION_MODEL_KWARGS,
+            )
+            packed = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": "### id: 0\ndef f(): pass\n### id: 1\ndef g(): pass"}],
+                **PACKED_GENERATION_MODEL_KWARGS,
+            )
+            stream = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": "def f(): pass"}],
+                stream=True,
+            )
+            chunks = [chunk async for chunk in stream]
+            embeddings = await client.embeddings.create(model="text-embedding-3-large", input=["a", "b", "a"])
+            await client.close()
+            return summary, packed, chunks, embeddings
+
+    summary, packed, chunks, embeddings = asyncio.run(run())
+
+    assert orjson.loads(summary.choices[0].message.content)["summary"]
+    assert [item["id"] for item in orjson.loads(packed.choices[0].message.content)["summaries"]] == ["0", "1"]
+    assert chunks[-1].choices[0].finish_reason == "stop"
+    assert "".join(chunk.choices[0].delta.content or "" for chunk in chunks)
+    assert len(embeddings.data[0].embedding) == 8
+    assert embeddings.data[0].embedding == embeddings.data[2].embedding
+    assert embeddings.data[0].embedding != embeddings.data[1].embedding
+
+
+def test_rate_limits():
+    async def run():
+        async with OpenAIServer(_config(rpm=1)) as server:
+            client = AsyncOpenAI(api_key="stand-in", base_url=server.base_url, max_retries=0)
+            await client.embeddings.create(model="text-embedding-3-large", input="a")
+            with pytest.raises(openai.RateLimitError) as e:
+                await client.embeddings.create(model="text-embedding-3-large", input="a")
+            await client.close()
+            return e.value, server.stats.to_dict()
+
+    error, stats = asyncio.run(run())
+
+    assert float(error.response.headers["retry-after-ms"]) > 0
+    assert stats["statuses"] == {"200": 1, "429": 1}
+
+
+def test_malformed_requests():
+    async def run():
+        async with OpenAIServer(_config()) as server:
+            client = AsyncOpenAI(api_key="stand-in", base_url=server.base_url, max_retries=0)
+            errors = []
+            for body in [{"model": "gpt-4o-mini"}, {"model": "gpt-4o-mini", "messages": 1}]:
+                with pytest.raises(openai.BadRequestError) as e:
+                    await client.post("/chat/completions", body=body, cast_to=dict)
+                errors.append(e.value)
+            with pytest.raises(openai.BadRequestError) as e:
+                await client.post("/embeddings", body=[1, 2], cast_to=dict)
+            errors.append(e.value)
+            invalid_json = await client._client.post(f"{server.base_url}/embeddings", content=b"{")
+            # the connection is still usable
+            embeddings = await client.embeddings.create(model="text-embedding-3-large", input="a")
+            await client.close()
+            return errors, invalid_json, embeddings
+
+    errors, invalid_json, embeddings = asyncio.run(run())
+
+    assert all(error.status_code == 400 for error in errors)
+    assert invalid_json.status_code == 400
+    assert invalid_json.json()["error"]["code"] == 400
+    assert len(embeddings.data) == 1
+
+
+def test_malformed_http_requests():
+    async def run():
+        async with OpenAIServer(_config()) as server:
+            host, port = server._server.sockets[0].getsockname()[:2]
+            responses = []
+            for request in [
+                b"GARBAGE\r\n\r\n",
+                b"GET /v1/models HTTP/1.1\r\nno colon\r\n\r\n",
+                b"POST /v1/embeddings HTTP/1.1\r\ncontent-length: -1\r\n\r\n",
+                b"POST /v1/embeddings HTTP/1.1\r\ncontent-length: %d\r\n\r\n" % (MAX_BODY_SIZE + 1),
+            ]:
+                reader, writer = await asyncio.open_connection(host, port)
+                writer.write(request)
+                await writer.drain()
+                responses.append(await reader.read())
+                writer.close()
+            return responses
+
+    responses = asyncio.run(run())
+
+    assert [response.split(b"\r\n")[0] for response in responses] == [
+        b"HTTP/1.1 400 Bad Request",
+        b"HTTP/1.1 400 Bad Request",
+        b"HTTP/1.1 400 Bad Request",
+        b"HTTP/1.1 413 Payload Too Large",
+    ]
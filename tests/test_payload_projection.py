@@ -0,0 +1,59 @@
+import asyncio
+from pathlib import Path
+
+from haystack import Document
+from haystack.document_stores.types import DuplicatePolicy
+
+from src.pipelines.retrieval import CodebaseRetrieval
+from src.providers.document_store.memmap import MemmapProvider
+from src.providers.embedder.local import LocalEmbedderProvider
+
+
+def test_projected_results_are_hydrated_on_demand(tmp_path: Path):
+    embedder_provider = LocalEmbedderProvider(dimension=64)
+    document_store_provider = MemmapProvider(path=str(tmp_path), embedding_model_dim=64)
+
+    async def run():
+        for dataset_name in ["code_file", "code_function", "code_class"]:
+            documents = [
+                Document(
+                    id=f"{dataset_name}{i}",
+                    content=f"summary of the {dataset_name} {i}",
+                    meta={
+                        "path": f"src/{i}.py",
+                        "name": f"name_{i}",
+                        "raw_data": f"def name_{i}():\n" + "    pass\n" * 1000,
+                        "imports": [f"module_{j}" for j in range(50)],
+                    },
+                )
+                for i in range(10)
+            ]
+            documents = (await embedder_provider.get_document_embedder().run(documents))["documents"]
+            await document_store_provider.get_store(dataset_name=dataset_name).write_documents(
+                documents, policy=DuplicatePolicy.OVERWRITE
+            )
+
+        retrieval = CodebaseRetrieval(
+            embedder_provider=embedder_provider,
+            document_store_provider=document_store_provider,
+        )
+        full = await retrieval.run("summary of the code_function 3")
+        projected = await retrieval.run("summary of the code_function 3", payload_fields=["path", "meta.name"])
+        documents = projected["construct_retrieval_results"]["code_function_retrieval"]["documents"]
+        hydrated = await retrieval.hydrate("code_function_retrieval", documents[:1])
+        raw_data = await retrieval.hydrate("code_function_retrieval", documents[1:2], payload_fields=["raw_data"])
+        return full["construct_retrieval_results"], projected["construct_retrieval_results"], hydrated, raw_data
+
+    full, projected, hydrated, raw_data = asyncio.run(run())
+
+    for name in ["code_file_retrieval", "code_function_retrieval", "code_class_retrieval"]:
+        assert [(document.id, document.score) for document in projected[name]["documents"]] == [
+            (document.id, document.score) for document in full[name]["documents"]
+        ]
+        for document in projected[name]["documents"]:
+            assert document.content is None
+            assert set(document.meta) == {"path", "name"}
+
+    assert hydrated[0] == full["code_function_retrieval"]["documents"][0]
+    assert set(raw_data[0].meta) == {"path", "name", "raw_data"}
+    assert raw_data[0].score == projected["code_function_retrieval"]["documents"][1].score
@@ -0,0 +1,44 @@
+import asyncio
+
+from src.providers.client_pool import OpenAIClientPool
+from src.providers.embedder.batching import LRUCache
+from src.providers.embedder.openai import OpenAIEmbedderProvider
+from src.tools.openai_server import LatencyDistribution, OpenAIServer, ServerConfig
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert LRUCache(ttl=0).get("a") is None
+
+
+def test_cache_and_batch_concurrent_queries():
+    async def run():
+        config = ServerConfig(embedding_dim=8, embedding_latency=LatencyDistribution("fixed", 0.01))
+        async with OpenAIServer(config) as server:
+            client_pool = OpenAIClientPool()
+            embedder = OpenAIEmbedderProvider(
+                api_key="stand-in",
+                api_base=server.base_url,
+                client_pool=client_pool,
+                query_batch_window=0.005,
+            ).get_text_embedder()
+
+            results = await asyncio.gather(*[embedder.run(f"query {i % 3}") for i in range(10)])
+            cached = await embedder.run("query 1")
+            await client_pool.close()
+            return results, cached, server.stats.requests["/v1/embeddings"]
+
+    results, cached, requests = asyncio.run(run())
+
+    assert requests == 1
+    assert results[0]["meta"]["batch_size"] == 3
+    assert results[1]["embedding"] == results[4]["embedding"] == cached["embedding"]
+    assert results[0]["embedding"] != results[1]["embedding"]
+    assert cached["meta"]["cached"]
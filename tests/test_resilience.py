@@ -0,0 +1,102 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from src.providers.resilience import ResilientCaller, RetryPolicy, get_retry_after
+
+
+def _status_error(status_code: int, headers: dict | None = None) -> openai.APIStatusError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    if status_code == 429:
+        return openai.RateLimitError("rate limited", response=response, body=None)
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+class FlakyCall:
+    def __init__(self, errors: list[Exception]):
+        self.calls = 0
+        self._errors = errors
+
+    async def __call__(self):
+        self.calls += 1
+        if self._errors:
+            raise self._errors.pop(0)
+        return "ok"
+
+
+def test_retry_after():
+    assert get_retry_after(_status_error(429, {"retry-after": "2"})) == 2.0
+    assert get_retry_after(_status_error(429, {"retry-after-ms": "150"})) == 0.15
+    assert get_retry_after(_status_error(429)) is None
+
+
+def test_retry_retryable_errors():
+    caller = ResilientCaller(RetryPolicy(initial_backoff=0.001))
+    call = FlakyCall([_status_error(429, {"retry-after": "0"}), _status_error(503)])
+
+    assert asyncio.run(caller.call(call)) == "ok"
+    assert call.calls == 3
+    assert caller.retries == 2
+
+
+def test_do_not_retry_client_errors():
+    caller = ResilientCaller(RetryPolicy(initial_backoff=0.001))
+    call = FlakyCall([_status_error(400)])
+
+    with pytest.raises(openai.APIStatusError):
+        asyncio.run(caller.call(call))
+    assert call.calls == 1
+
+
+def test_retry_budget():
+    caller = ResilientCaller(RetryPolicy(initial_backoff=0.001, max_retries=10, budget_tokens=2))
+    call = FlakyCall([_status_error(500) for _ in range(5)])
+
+    with pytest.raises(openai.APIStatusError):
+        asyncio.run(caller.call(call))
+    assert call.calls == 3
+
+
+def test_hedge_slow_calls():
+    caller = ResilientCaller(RetryPolicy(hedging=True, hedging_min_samples=1))
+    delays = [0.0, 1.0, 0.0]
+
+    async def call():
+        await asyncio.sleep(delays.pop(0))
+        return "ok"
+
+    async def run():
+        await caller.call(call)
+        return await asyncio.wait_for(caller.call(call), timeout=0.5)
+
+    assert asyncio.run(run()) == "ok"
+    assert caller.hedges == 1
+
+
+def test_cancel_the_calls_of_a_cancelled_race():
+    caller = ResilientCaller(RetryPolicy(hedging=True, hedging_min_samples=1))
+    delays = [0.2, 5.0]
+    cancelled = []
+
+    async def call():
+        try:
+            await asyncio.sleep(delays.pop(0))
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "ok"
+
+    async def run():
+        await caller.call(call)
+        # cancelled while waiting for the hedging delay of 0.2s
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(caller.call(call), timeout=0.05)
+        await asyncio.sleep(0.01)
+        # before the event loop closes and cancels whatever is left
+        return list(cancelled)
+
+    assert asyncio.run(run()) == [True]
+    assert caller.hedges == 0
@@ -0,0 +1,115 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from haystack import Document
+from haystack.document_stores.types import DuplicatePolicy
+
+from src.components.document_writer import AsyncDocumentWriter
+from src.components.index_version import IndexVersion
+from src.components.retrieval_cache import RetrievalCache, SqliteCacheBackend, get_retrieval_cache
+from src.pipelines.retrieval import CodebaseRetrieval
+from src.providers.document_store.memmap import MemmapProvider
+from src.providers.embedder.local import LocalEmbedderProvider
+
+
+def _results(content: str) -> dict:
+    return {"code_file_retrieval": {"documents": [Document(id="a", content=content, meta={"path": Path("a.py")})]}}
+
+
+def test_cache_is_keyed_by_query_params_and_version():
+    index_version = IndexVersion()
+    cache = RetrievalCache(index_version=index_version)
+
+    cache.put("Where is  the parser?", _results("parser"), top_k=3)
+    hit = cache.get("where is the PARSER?", top_k=3)
+    assert hit["code_file_retrieval"]["documents"][0].content == "parser"
+    assert hit["code_file_retrieval"]["documents"][0].meta["path"] == "a.py"
+    assert cache.get("where is the parser?", top_k=5) is None
+
+    index_version.bump()
+    assert cache.get("where is the parser?", top_k=3) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_cache_evicts_least_recently_used_by_size():
+    cache = RetrievalCache(max_bytes=600, index_version=IndexVersion())
+    for query in ["a", "b", "c"]:
+        cache.put(query, _results(query * 100))
+        cache.get("a")
+
+    assert cache.size <= 600
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+
+
+def test_shared_backend_and_version(tmp_path: Path, monkeypatch):
+    def worker() -> RetrievalCache:
+        return RetrievalCache(
+            backend=SqliteCacheBackend(tmp_path / "cache.db", max_bytes=10_000),
+            index_version=IndexVersion(tmp_path / "version.db"),
+        )
+
+    first, second = worker(), worker()
+    first.put("query", _results("shared"))
+    assert second.get("query")["code_file_retrieval"]["documents"][0].content == "shared"
+
+    IndexVersion(tmp_path / "version.db").bump()
+    assert first.get("query") is None
+
+    for i in range(50):
+        first.put(f"query {i}", _results("x" * 1000))
+    size = first._backend._connection.execute("SELECT SUM(size) FROM retrieval_cache").fetchone()[0]
+    assert size <= 10_000
+
+    # a shared cache with a version per process would outlive the re-indexing of the others
+    monkeypatch.setenv("RETRIEVAL_CACHE", "true")
+    monkeypatch.setenv("RETRIEVAL_CACHE_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.delenv("INDEX_VERSION_PATH", raising=False)
+    with pytest.raises(ValueError):
+        get_retrieval_cache()
+
+
+def test_semantic_cache():
+    cache = RetrievalCache(semantic_threshold=0.95, index_version=IndexVersion())
+    cache.put("how are files parsed", _results("parser"), embedding=[1.0, 0.0, 0.1])
+
+    assert cache.get_similar([1.0, 0.0, 0.12])["code_file_retrieval"]["documents"][0].content == "parser"
+    assert cache.get_similar([0.0, 1.0, 0.0]) is None
+    assert cache.get_similar([1.0, 0.0, 0.12], top_k=5) is None
+
+
+def test_retrieval_uses_cache_until_reindexed(tmp_path: Path):
+    index_version = IndexVersion()
+    document_store_provider = MemmapProvider(path=str(tmp_path), embedding_model_dim=64)
+    embedder_provider = LocalEmbedderProvider(dimension=64)
+    cache = RetrievalCache(index_version=index_version)
+    retrieval = CodebaseRetrieval(
+        embedder_provider=embedder_provider,
+        document_store_provider=document_store_provider,
+        cache=cache,
+    )
+    writer = AsyncDocumentWriter(
+        document_store=document_store_provider.get_store(dataset_name="code_file"),
+        policy=DuplicatePolicy.OVERWRITE,
+        index_version=index_version,
+    )
+
+    async def run():
+        first = await retrieval.run("parse the code")
+        second = await retrieval.run("parse  the code")
+        documents = (
+            await embedder_provider.get_document_embedder().run(
+                [Document(id="parser.py", content="parse the code", meta={"path": "parser.py"})]
+            )
+        )["documents"]
+        await writer.run(documents=documents)
+        third = await retrieval.run("parse the code")
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+
+    assert first["construct_retrieval_results"]["code_file_retrieval"]["documents"] == []
+    assert second["construct_retrieval_results"]["code_file_retrieval"]["documents"] == []
+    assert [document.id for document in third["construct_retrieval_results"]["code_file_retrieval"]["documents"]] == ["parser.py"]
+    assert cache.hits == 1 and cache.misses == 2
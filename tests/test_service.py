@@ -0,0 +1,199 @@
+import asyncio
+from pathlib import Path
+
+import httpx
+
+from src.components.level_router import LevelRouter
+from src.providers.client_pool import OpenAIClientPool
+from src.providers.document_store.qdrant import QdrantProvider
+from src.providers.embedder.local import LocalEmbedderProvider
+from src.providers.llm.openai import OpenAILLMProvider
+from src.service import MAX_BODY_SIZE, CodebaseService, ServiceServer
+from src.tools.openai_server import LatencyDistribution, OpenAIServer, ServerConfig
+
+
+class _SlowRetrieval:
+    def __init__(self, retrieval, delay: float):
+        self._retrieval = retrieval
+        self._delay = delay
+        self.calls = 0
+
+    async def run(self, query: str, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self._delay)
+        return await self._retrieval.run(query, **kwargs)
+
+
+def _service(base_url: str, **kwargs) -> CodebaseService:
+    return CodebaseService(
+        llm_provider=OpenAILLMProvider(api_key="stand-in", api_base=base_url, client_pool=OpenAIClientPool()),
+        embedder_provider=LocalEmbedderProvider(dimension=64),
+        document_store_provider=QdrantProvider(location=":memory:", embedding_model_dim=64),
+        level_router=LevelRouter(),
+        **kwargs,
+    )
+
+
+def test_index_and_query_over_http(tmp_path: Path):
+    config = ServerConfig(
+        embedding_dim=8,
+        chat_latency=LatencyDistribution("fixed", 0.0),
+        chat_token_latency=0.0,
+        embedding_latency=LatencyDistribution("fixed", 0.0),
+    )
+
+    async def run():
+        async with OpenAIServer(config) as llm_server:
+            async with ServiceServer(_service(llm_server.base_url, index_path=tmp_path / "index")) as server:
+                async with httpx.AsyncClient(base_url=server.base_url) as client:
+                    job = (await client.post("/v1/index", json={"path": "tests/examples"})).json()
+                    while job["status"] in ("queued", "running"):
+                        await asyncio.sleep(0.05)
+                        job = (await client.get(f"/v1/jobs/{job['id']}")).json()
+
+                    slow_retrieval = _SlowRetrieval(server.service.retrieval, 0.2)
+                    server.service.retrieval = slow_retrieval
+                    responses = await asyncio.gather(
+                        *[
+                            client.post("/v1/query", json={"query": "How is the code parsed?", "max_tokens": 500})
+                            for _ in range(5)
+                        ]
+                    )
+                    health = (await client.get("/health")).json()
+                    metrics = (await client.get("/metrics")).json()
+                    errors = [
+                        await client.post("/v1/query", content=b"not json"),
+                        await client.post("/v1/index", json={"path": "tests/missing"}),
+                        await client.get("/v1/jobs/missing"),
+                        await client.post("/v1/query", json={"query": "x", "max_tokens": "a"}),
+                        await client.post("/v1/query", json={"query": "x", "expand_hops": True}),
+                        await client.post("/v1/query", json={"query": "x", "payload_fields": ["path", 1]}),
+                    ]
+                    return job, responses, slow_retrieval.calls, health, metrics, errors
+
+    job, responses, calls, health, metrics, errors = asyncio.run(run())
+
+    assert job["status"] == "succeeded", job["error"]
+    assert job["progress"] == 1.0
+    assert job["symbols"]["files"] == 1
+
+    assert [response.status_code for response in responses] == [200] * 5
+    # the concurrent duplicates wait for the first one
+    assert calls == 1
+    results = responses[0].json()
+    assert all(response.json() == results for response in responses)
+    assert results["construct_retrieval_results"]["code_file_retrieval"]["documents"]
+    assert results["assemble_context"]["tokens"] <= 500
+
+    assert health["status"] == "ok"
+    assert health["jobs"] == {"succeeded": 1}
+    assert metrics["queries"]["total"] == 5
+    assert metrics["queries"]["coalesced"] == 4
+    assert metrics["queries"]["in_flight"] == 0
+    assert metrics["level_router"]["routes"]["fallback"] == 1
+    # without GENERATION_MODEL_ROUTES the summaries are generated by the default model only
+    assert metrics["llm_routes"] == {}
+    assert [error.status_code for error in errors] == [400, 400, 404, 400, 400, 400]
+    # a restarted service loads them, see load_codebase
+    assert (tmp_path / "index" / "symbol_table.json").exists()
+    assert (tmp_path / "index" / "dependency_graph.npz").exists()
+    assert (tmp_path / "index" / "level_router.npz").exists()
+
+
+def test_malformed_http_requests():
+    async def run():
+        async with ServiceServer(_service("http://127.0.0.1:1", index_workers=0)) as server:
+            host, port = server._server.sockets[0].getsockname()[:2]
+            responses = []
+            for request in [
+                b"GARBAGE\r\n\r\n",
+                b"GET /health HTTP/1.1\r\nno colon\r\n\r\n",
+                b"POST /v1/query HTTP/1.1\r\ncontent-length: -1\r\n\r\n",
+                b"POST /v1/query HTTP/1.1\r\ncontent-length: %d\r\n\r\n" % (MAX_BODY_SIZE + 1),
+            ]:
+                reader, writer = await asyncio.open_connection(host, port)
+                writer.write(request)
+                await writer.drain()
+                responses.append(await reader.read())
+                writer.close()
+            return responses
+
+    responses = asyncio.run(run())
+
+    assert [response.split(b"\r\n")[0] for response in responses] == [
+        b"HTTP/1.1 400 Bad Request",
+        b"HTTP/1.1 400 Bad Request",
+        b"HTTP/1.1 400 Bad Request",
+        b"HTTP/1.1 413 Payload Too Large",
+    ]
+
+
+async def _wait(client: httpx.AsyncClient, job_id: str) -> dict:
+    while (job := (await client.get(f"/v1/jobs/{job_id}")).json())["status"] in ("queued", "running"):
+        await asyncio.sleep(0.05)
+    return job
+
+
+def test_backfill_after_fast_index():
+    config = ServerConfig(
+        embedding_dim=8,
+        chat_latency=LatencyDistribution("fixed", 0.0),
+        chat_token_latency=0.0,
+        embedding_latency=LatencyDistribution("fixed", 0.0),
+    )
+
+    async def run():
+        async with OpenAIServer(config) as llm_server:
+            service = _service(llm_server.base_url)
+            store = service._document_store_provider.get_store(dataset_name="code_function")
+
+            async def count() -> dict:
+                return {
+                    index_mode: await store.count_documents(
+                        {"field": "index_mode", "operator": "==", "value": index_mode}
+                    )
+                    for index_mode in ["fast", "backfill"]
+                }
+
+            async with ServiceServer(service) as server:
+                async with httpx.AsyncClient(base_url=server.base_url) as client:
+                    counts, jobs = [], []
+                    for request in [
+                        {"path": "tests/examples", "fast": True},
+                        {"path": "tests/examples", "backfill": True},
+                        # the backfill is queued once the fast index succeeded
+                        {"path": "tests/examples", "fast": True, "backfill": True},
+                    ]:
+                        jobs.append(await _wait(client, (await client.post("/v1/index", json=request)).json()["id"]))
+                        if jobs[-1]["backfill_job"]:
+                            jobs.append(await _wait(client, jobs[-1]["backfill_job"]))
+                        counts.append(await count())
+                    return jobs, counts
+
+    jobs, counts = asyncio.run(run())
+
+    assert [job["status"] for job in jobs] == ["succeeded"] * 4, [job["error"] for job in jobs]
+    assert [job["kind"] for job in jobs] == ["index", "backfill", "index", "backfill"]
+    assert counts[0]["fast"] > 0 and counts[0]["backfill"] == 0
+    # the fast documents are upserted by id with the summaries
+    assert counts[1] == counts[2] == {"fast": 0, "backfill": counts[0]["fast"]}
+
+
+def test_backpressure():
+    async def run():
+        service = _service("http://127.0.0.1:1", max_pending_queries=2, max_queued_jobs=1, index_workers=0)
+        service.retrieval = _SlowRetrieval(service.retrieval, 0.2)
+        async with ServiceServer(service) as server:
+            async with httpx.AsyncClient(base_url=server.base_url) as client:
+                queries = await asyncio.gather(
+                    *[client.post("/v1/query", json={"query": f"query {i}"}) for i in range(4)]
+                )
+                # without workers, the first job stays queued
+                jobs = [await client.post("/v1/index", json={"path": "tests/examples"}) for _ in range(2)]
+                return queries, jobs
+
+    queries, jobs = asyncio.run(run())
+
+    assert sorted(response.status_code for response in queries) == [200, 200, 429, 429]
+    assert all(response.headers["retry-after"] for response in queries if response.status_code == 429)
+    assert [response.status_code for response in jobs] == [202, 429]
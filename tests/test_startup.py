@@ -0,0 +1,77 @@
+import subprocess
+import sys
+import time
+
+import orjson
+
+# the budgets in seconds, with headroom for slow machines, the measured times are about a tenth of the import budget
+# and half of the query budget, which is mostly importing haystack
+IMPORT_BUDGET = 0.5
+QUERY_BUDGET = 3.0
+
+# the modules only needed to index, or by the providers not chosen
+INDEXING_MODULES = [
+    "src.pipelines.indexing.code_file_indexing",
+    "src.providers.llm.openai",
+    "langfuse.openai",
+    "openai",
+    "qdrant_client",
+    "tree_sitter",
+]
+
+
+def _measure(code: str) -> dict:
+    """
+    Run the code in a fresh interpreter, and return the seconds it took and the modules it imported.
+    """
+    script = f"""
+import sys, time
+import orjson
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+sys.stdout.buffer.write(orjson.dumps({{"elapsed": elapsed, "modules": sorted(sys.modules)}}))
+"""
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, check=True, timeout=60).stdout
+    return orjson.loads(output)
+
+
+def test_cli_imports_nothing_heavy():
+    result = _measure("import src.main")
+
+    assert result["elapsed"] < IMPORT_BUDGET
+    for module in ["haystack", "hamilton", "numpy", *INDEXING_MODULES]:
+        assert module not in result["modules"]
+
+
+def test_query_starts_without_indexing(tmp_path):
+    result = _measure(
+        f"""
+from src.pipelines.retrieval import CodebaseRetrieval
+from src.providers.document_store.memmap import MemmapProvider
+from src.providers.embedder.local import LocalEmbedderProvider
+
+CodebaseRetrieval(
+    embedder_provider=LocalEmbedderProvider(dimension=64),
+    document_store_provider=MemmapProvider(path={str(tmp_path)!r}, embedding_model_dim=64),
+)
+"""
+    )
+
+    assert result["elapsed"] < QUERY_BUDGET
+    for module in INDEXING_MODULES:
+        assert module not in result["modules"]
+
+
+def test_qdrant_provider_connects_on_first_use():
+    from src.providers.document_store.qdrant import QdrantProvider
+
+    start = time.perf_counter()
+    # nothing listens there, so constructing it would fail if it connected
+    provider = QdrantProvider(location="http://127.0.0.1:1", embedding_model_dim=8)
+    assert time.perf_counter() - start < 0.1
+    assert not provider._stores
+
+    provider = QdrantProvider(location=":memory:", embedding_model_dim=8)
+    provider.get_store(dataset_name="code_file")
+    assert set(provider._stores) == {"Document", "table_descriptions", "view_questions", "code_file"}
@@ -0,0 +1,70 @@
+import asyncio
+from pathlib import Path
+
+from haystack import Document
+from haystack.document_stores.types import DuplicatePolicy
+
+from src.pipelines.retrieval import CodebaseRetrieval
+from src.providers.document_store.memmap import MemmapProvider
+from src.providers.embedder.local import LocalEmbedderProvider
+
+
+class _SlowRetriever:
+    def __init__(self, retriever, delay: float):
+        self._retriever = retriever
+        self._delay = delay
+
+    async def run(self, **kwargs):
+        await asyncio.sleep(self._delay)
+        return await self._retriever.run(**kwargs)
+
+
+def test_stream_yields_the_fastest_search_first(tmp_path: Path):
+    embedder_provider = LocalEmbedderProvider(dimension=64)
+    document_store_provider = MemmapProvider(path=str(tmp_path), embedding_model_dim=64)
+
+    async def run():
+        for dataset_name in ["code_file", "code_function", "code_class"]:
+            documents = [
+                Document(id=f"{dataset_name}{i}", content=f"{dataset_name} parse code {i}", meta={"path": f"{i}.py"})
+                for i in range(10)
+            ]
+            documents = (await embedder_provider.get_document_embedder().run(documents))["documents"]
+            await document_store_provider.get_store(dataset_name=dataset_name).write_documents(
+                documents, policy=DuplicatePolicy.OVERWRITE
+            )
+
+        retrieval = CodebaseRetrieval(
+            embedder_provider=embedder_provider,
+            document_store_provider=document_store_provider,
+        )
+        expected = await retrieval.run("how is the code parsed?")
+
+        retrieval._components["code_file_retriever"] = _SlowRetriever(retrieval._components["code_file_retriever"], 0.3)
+        retrieval._components["code_class_retriever"] = _SlowRetriever(
+            retrieval._components["code_class_retriever"], 0.2
+        )
+        events = [event async for event in retrieval.stream("how is the code parsed?")]
+        documents = [event async for event in retrieval.stream("how is the code parsed?", per_document=True)]
+        return expected["construct_retrieval_results"], events, documents
+
+    expected, events, documents = asyncio.run(run())
+
+    assert [event["name"] for event in events[:-1]] == [
+        "code_function_retrieval",
+        "code_class_retrieval",
+        "code_file_retrieval",
+        "dependency_expansion",
+    ]
+    summary = events[-1]
+    assert summary["event"] == "summary"
+    assert summary["source"] == "search"
+    assert summary["first_result"] < 0.2 <= summary["elapsed"]
+    for name, result in expected.items():
+        assert [document.id for document in summary["results"][name]["documents"]] == [
+            document.id for document in result["documents"]
+        ]
+        assert summary["counts"][name] == len(result["documents"])
+
+    assert all(event["event"] == "document" for event in documents[:-1])
+    assert len(documents) - 1 == sum(summary["counts"].values())
@@ -0,0 +1,110 @@
+import asyncio
+import re
+
+import orjson
+
+from src.components.summary_packer import SummaryPacker
+from src.providers.llm.router import ModelRouter, Route
+
+
+class FakeGenerator:
+    def __init__(self, packed: bool, skip_ids: tuple[str, ...] = ()):
+        self.prompts = []
+        self._packed = packed
+        self._skip_ids = skip_ids
+
+    async def __call__(self, prompt: str, **kwargs):
+        self.prompts.append(prompt)
+        if self._packed:
+            summaries = [
+                {"id": id, "summary": f"packed summary {id}"}
+                for id in re.findall(r"### id: (\S+)", prompt)
+                if id not in self._skip_ids
+            ]
+            reply = {"summaries": summaries}
+        else:
+            reply = {"summary": f"single summary {prompt}"}
+        return {"replies": [orjson.dumps(reply).decode()], "meta": [{"usage": {"prompt_tokens": 10}}]}
+
+
+def _prompts(prompts: list[str], complexity: int | None = None) -> list[dict]:
+    return [{"prompt": prompt, "complexity": complexity} for prompt in prompts]
+
+
+def _summaries(results: list[dict]) -> list[str]:
+    return [orjson.loads(result["replies"][0])["summary"] for result in results]
+
+
+def test_pack_small_prompts():
+    generator, packed_generator = FakeGenerator(packed=False), FakeGenerator(packed=True)
+    packer = SummaryPacker(generator, packed_generator, max_pack_size=4)
+
+    results = asyncio.run(packer.run(prompts=_prompts([f"def f{i}(): pass" for i in range(10)])))["results"]
+
+    assert _summaries(results) == [f"packed summary {i}" for i in range(10)]
+    assert len(packed_generator.prompts) == 3
+    assert len(generator.prompts) == 0
+
+
+def test_large_prompts_are_sent_alone():
+    generator, packed_generator = FakeGenerator(packed=False), FakeGenerator(packed=True)
+    packer = SummaryPacker(generator, packed_generator, max_item_tokens=10)
+
+    results = asyncio.run(packer.run(prompts=_prompts(["x" * 100, "a", "b"])))["results"]
+
+    assert _summaries(results) == ["single summary " + "x" * 100, "packed summary 1", "packed summary 2"]
+
+
+def test_missing_summaries_fall_back_to_single_requests():
+    generator, packed_generator = FakeGenerator(packed=False), FakeGenerator(packed=True, skip_ids=("1",))
+    packer = SummaryPacker(generator, packed_generator)
+
+    results = asyncio.run(packer.run(prompts=_prompts(["a", "b", "c"])))["results"]
+
+    assert _summaries(results) == ["packed summary 0", "single summary b", "packed summary 2"]
+    assert generator.prompts == ["b"]
+    # the usage of the packed request is counted once
+    assert [result["meta"][0].get("usage") for result in results] == [{"prompt_tokens": 10}] * 2 + [None]
+    assert [result["meta"][0].get("packed", False) for result in results] == [True, False, True]
+
+
+class FailingGenerator(FakeGenerator):
+    async def __call__(self, prompt: str, **kwargs):
+        self.prompts.append(prompt)
+        raise RuntimeError("context length exceeded")
+
+
+def test_failed_packed_requests_fall_back_to_single_requests():
+    generator, packed_generator = FakeGenerator(packed=False), FailingGenerator(packed=True)
+    packer = SummaryPacker(generator, packed_generator)
+
+    results = asyncio.run(packer.run(prompts=_prompts(["a", "b", "c"])))["results"]
+
+    assert _summaries(results) == ["single summary a", "single summary b", "single summary c"]
+    assert len(packed_generator.prompts) == 1
+    assert generator.prompts == ["a", "b", "c"]
+
+
+def test_packed_requests_are_routed_on_the_highest_complexity():
+    def _router(packed: bool) -> ModelRouter:
+        return ModelRouter(
+            routes=[Route(name="small", generator=FakeGenerator(packed=packed), max_complexity=5)],
+            default=Route(name="default", generator=FakeGenerator(packed=packed)),
+        )
+
+    generator, packed_generator = _router(packed=False), _router(packed=True)
+    packer = SummaryPacker(generator, packed_generator, max_pack_size=2, max_item_tokens=10)
+
+    prompts = [
+        {"prompt": "a", "complexity": 1},
+        {"prompt": "b", "complexity": 2},
+        {"prompt": "c", "complexity": 1},
+        {"prompt": "d", "complexity": 9},
+        {"prompt": "x" * 100, "complexity": 9},
+    ]
+    results = asyncio.run(packer.run(prompts=prompts))["results"]
+
+    assert [result["meta"][0]["route"] for result in results] == ["small", "small", "default", "default", "default"]
+    assert packed_generator.metrics()["small"]["calls"] == 1
+    assert packed_generator.metrics()["default"]["calls"] == 1
+    assert generator.metrics()["default"]["calls"] == 1
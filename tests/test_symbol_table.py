@@ -0,0 +1,127 @@
+import asyncio
+from pathlib import Path
+
+from haystack import Document
+
+from src.components.code_parser import CodeParser
+from src.components.symbol_table import SymbolTable, parse_identifier_query
+from src.pipelines.retrieval import CodebaseRetrieval
+from src.providers.document_store.memmap import MemmapProvider
+from src.providers.embedder.local import LocalEmbedderProvider
+
+
+def _symbol_table(tmp_path: Path) -> SymbolTable:
+    (tmp_path / 'pkg').mkdir()
+    (tmp_path / 'pkg' / 'writer.py').write_text(
+        'class AsyncDocumentWriter:\n'
+        '    async def run(self, documents):\n'
+        '        pass\n'
+        '\n'
+        '    def close(self):\n'
+        '        pass\n'
+        '\n'
+        'def write_documents(documents):\n'
+        '    pass\n'
+        '\n'
+        'Writer = AsyncDocumentWriter\n'
+    )
+    return SymbolTable.build(CodeParser().parse(tmp_path))
+
+
+def test_parse_identifier_query():
+    assert parse_identifier_query('`AsyncDocumentWriter.run()`') == 'AsyncDocumentWriter.run'
+    assert parse_identifier_query(' CodeParser ') == 'CodeParser'
+    assert parse_identifier_query('how are the documents written?') is None
+
+
+def test_lookup(tmp_path: Path):
+    symbol_table = _symbol_table(tmp_path)
+
+    method = symbol_table.lookup('AsyncDocumentWriter.run')[0].symbol
+    assert method.kind == 'method'
+    assert method.collection == 'code_class'
+    assert method.document_id.endswith('writer.py::AsyncDocumentWriter')
+    assert (method.start_line, method.end_line) == (2, 3)
+
+    assert symbol_table.lookup('pkg.writer.AsyncDocumentWriter.run')[0].symbol == method
+    assert symbol_table.lookup('writer')[0].symbol.kind == 'module'
+    assert symbol_table.lookup('Writer')[0].symbol.name == 'AsyncDocumentWriter'
+    assert symbol_table.lookup('asyncdocumentwriter')[0].score == 1.0
+
+
+def test_prefix_and_fuzzy_search(tmp_path: Path):
+    symbol_table = _symbol_table(tmp_path)
+
+    assert [match.symbol.name for match in symbol_table.search('write_doc')] == ['write_documents']
+    assert symbol_table.search('AsyncDocumentWritter')[0].symbol.name == 'AsyncDocumentWriter'
+    assert symbol_table.search('AsyncDocumentWritter')[0].score < 1.0
+    # plain words are not matched by prefix or fuzzily, e.g. a one-word question
+    assert symbol_table.search('wrote') == []
+    assert symbol_table.search('write') == []
+
+    symbol_table.save(tmp_path / 'symbols.json')
+    loaded = SymbolTable.load(tmp_path / 'symbols.json')
+    assert loaded.lookup('write_documents') == symbol_table.lookup('write_documents')
+
+
+def test_retrieval_answers_identifier_queries_from_symbol_table(tmp_path: Path):
+    retrieval = CodebaseRetrieval(
+        embedder_provider=LocalEmbedderProvider(dimension=64),
+        document_store_provider=MemmapProvider(path=str(tmp_path / 'vectors'), embedding_model_dim=64),
+        symbol_table=_symbol_table(tmp_path),
+    )
+
+    results = asyncio.run(retrieval.run('AsyncDocumentWriter.run'))['construct_retrieval_results']
+    class_documents = results['code_class_retrieval']['documents']
+    assert class_documents[0].meta['retrieval'] == 'symbol'
+    assert class_documents[0].meta['name'] == 'AsyncDocumentWriter.run'
+    assert results['code_function_retrieval']['documents'] == []
+
+    for query in ('where are the documents written', 'write'):
+        results = asyncio.run(retrieval.run(query))['construct_retrieval_results']
+        assert all(
+            document.meta.get('retrieval') != 'symbol'
+            for documents in results.values()
+            for document in documents['documents']
+        )
+
+
+def test_identifier_query_context_holds_the_source(tmp_path: Path):
+    symbol_table = _symbol_table(tmp_path)
+    code = CodeParser().parse(tmp_path)[0]
+    class_code = code.global_classes[0]
+    document_store_provider = MemmapProvider(path=str(tmp_path / 'vectors'), embedding_model_dim=64)
+    retrieval = CodebaseRetrieval(
+        embedder_provider=LocalEmbedderProvider(dimension=64),
+        document_store_provider=document_store_provider,
+        symbol_table=symbol_table,
+    )
+    asyncio.run(
+        document_store_provider.get_store(dataset_name='code_class').write_documents(
+            [
+                Document(
+                    id=class_code.id,
+                    content='Summary of AsyncDocumentWriter.',
+                    meta={
+                        'path': str(code.path),
+                        'name': class_code.name,
+                        'raw_data': class_code.content,
+                        'signature': class_code.signature,
+                        'start_line': class_code.start_line,
+                        'end_line': class_code.end_line,
+                    },
+                    embedding=[1.0] * 64,
+                )
+            ]
+        )
+    )
+
+    results = asyncio.run(retrieval.run('AsyncDocumentWriter', max_tokens=500))
+    assert 'async def run(self, documents):' in results['assemble_context']['context']
+    # the cached results keep the documents of the symbol table
+    assert results['construct_retrieval_results']['code_class_retrieval']['documents'][0].content is None
+
+    # a method is fetched as its class, but only its own lines are in the context
+    context = asyncio.run(retrieval.run('AsyncDocumentWriter.close', max_tokens=500))['assemble_context']['context']
+    assert context.splitlines()[1:] == ['    def close(self):', '        pass']
+    assert context.splitlines()[0].endswith('writer.py:5-6')
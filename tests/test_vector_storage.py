@@ -0,0 +1,44 @@
+import numpy as np
+
+from src.providers.document_store.vectors import VectorEncoder
+from src.tools.recall import evaluate
+
+
+def _embeddings(n: int, dimension: int = 64) -> np.ndarray:
+    # Matryoshka-like, the leading components carry most of the variance
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((n, dimension)) / np.arange(1, dimension + 1) ** 0.5
+
+
+def test_encode_vectors():
+    embedding = _embeddings(1)[0]
+
+    float16 = VectorEncoder(16, "float16").encode_array(embedding)
+    uint8 = VectorEncoder(16, "uint8").encode_array(embedding)
+
+    assert float16.dtype == np.float16 and float16.shape == (16,)
+    assert np.isclose(np.linalg.norm(float16.astype(np.float32)), 1.0, atol=1e-3)
+    assert uint8.dtype == np.uint8 and uint8.shape == (16,)
+
+
+def test_uint8_similarity_approximates_cosine():
+    embeddings = _embeddings(10)
+    encoder = VectorEncoder(64, "uint8")
+
+    similarities = encoder.similarities(embeddings, encoder.encode_array(embeddings))
+    expected = VectorEncoder(64).similarities(embeddings, VectorEncoder(64).encode_array(embeddings))
+
+    assert np.allclose(similarities, expected, atol=0.05)
+
+
+def test_recall_at_k():
+    documents, queries = _embeddings(200), _embeddings(20) + 0.1
+
+    results = {
+        (result["dimension"], result["datatype"]): result["recall@10"]
+        for result in evaluate(queries, documents, dimensions=[8, 64], datatypes=["float32", "uint8"])
+    }
+
+    assert results[(64, "float32")] == 1.0
+    assert results[(8, "float32")] < results[(64, "float32")]
+    assert results[(64, "uint8")] > 0.8